@@ -1,34 +1,124 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
-from pymongo import MongoClient
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, g, Response, stream_with_context, has_request_context
+from pymongo import MongoClient, IndexModel, UpdateOne, ReplaceOne, ReturnDocument, ASCENDING, DESCENDING, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson.objectid import ObjectId
-from datetime import datetime
+from bson import json_util, encode as bson_encode
+from itsdangerous import URLSafeSerializer, BadSignature
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, deque
+import argparse
+import random
+import csv
+import gzip
 import hashlib
+import json
 import os
+import re
+import secrets
+import sys
 import io
+import threading
+import time
+import unicodedata
 from functools import wraps
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.utils import ImageReader
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as TiempoAgotado
+
+import comprobantes
+import trabajos
 
 app = Flask(__name__)
-app.secret_key = 'clave_secreta_biblioteca_2024'
+# Firma la cookie de sesión y los cursores de paginación; en producción debe
+# venir del entorno (la clave de desarrollo está publicada en el repositorio)
+app.secret_key = os.environ.get('SECRET_KEY')
+if not app.secret_key:
+    print("ADVERTENCIA: SECRET_KEY no está definida; se usa la clave de desarrollo")
+    app.secret_key = 'clave_secreta_biblioteca_2024'
 
 # ----------------- CONEXIÓN A MONGODB -----------------
-try:
-    client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
-    client.admin.command('ping') 
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB = os.environ.get('MONGO_DB', 'libros')
 
-    db = client['libros']
-    
-    coleccion_libros = db['tipolibro']
-    coleccion_usuarios = db['usuarios']
-    coleccion_clientes = db['clientes']  
-    coleccion_ventas = db['ventas']
+MONGO_TIMEOUT_MS = int(os.environ.get('MONGO_TIMEOUT_MS', 5000))
+MONGO_MAX_POOL = int(os.environ.get('MONGO_MAX_POOL', 50))
+MONGO_MIN_POOL = int(os.environ.get('MONGO_MIN_POOL', 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGO_COMPRESORES = os.environ.get('MONGO_COMPRESORES', '')  # p. ej. "zstd,snappy,zlib"
+MONGO_READ_CONCERN = os.environ.get('MONGO_READ_CONCERN', '')  # local, majority...
+MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '')  # 1, majority...
+
+def opciones_cliente():
+    """Opciones del MongoClient tomadas de la configuración"""
+    opciones = {
+        'serverSelectionTimeoutMS': MONGO_TIMEOUT_MS,
+        'maxPoolSize': MONGO_MAX_POOL,
+        'minPoolSize': MONGO_MIN_POOL,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'appname': 'biblioteca',
+    }
+    if MONGO_COMPRESORES:
+        opciones['compressors'] = MONGO_COMPRESORES
+    if MONGO_READ_CONCERN:
+        opciones['readConcernLevel'] = MONGO_READ_CONCERN
+    if MONGO_WRITE_CONCERN:
+        opciones['w'] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    return opciones
+
+# El cliente se crea en el primer uso y uno por proceso: un MongoClient creado
+# antes de un fork (gunicorn --preload) no debe usarse en los hijos.
+_clientes_mongo = {}
+_clientes_mongo_lock = threading.Lock()
+
+def obtener_cliente():
+    pid = os.getpid()
+    cliente = _clientes_mongo.get(pid)
+    if cliente is None:
+        with _clientes_mongo_lock:
+            cliente = _clientes_mongo.get(pid)
+            if cliente is None:
+                cliente = MongoClient(MONGO_URI, event_listeners=[monitor_comandos, monitor_pool],
+                                      **opciones_cliente())
+                _clientes_mongo.clear()  # Los clientes heredados del padre no se cierran aquí
+                _clientes_mongo[pid] = cliente
+    return cliente
+
+def obtener_db():
+    return obtener_cliente()[MONGO_DB]
+
+class BaseDatosPerezosa:
+    """Acceso a la base de datos que resuelve el cliente del proceso actual"""
 
-    print("Conexión exitosa a MongoDB.")
+    def __getitem__(self, nombre):
+        return obtener_db()[nombre]
 
-except Exception as e:
-    print(f"ERROR: No se pudo conectar a MongoDB. Detalle: {e}")
+    def __getattr__(self, atributo):
+        return getattr(obtener_db(), atributo)
+
+class ColeccionPerezosa:
+    """Colección que se resuelve en cada uso contra el cliente del proceso actual,
+    así los módulos pueden seguir usando coleccion_* como variables globales"""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __getattr__(self, atributo):
+        return getattr(obtener_db()[self.nombre], atributo)
+
+    def __repr__(self):
+        return f'ColeccionPerezosa({self.nombre!r})'
+
+db = BaseDatosPerezosa()
+
+coleccion_libros = ColeccionPerezosa('tipolibro')
+coleccion_usuarios = ColeccionPerezosa('usuarios')
+coleccion_clientes = ColeccionPerezosa('clientes')
+coleccion_ventas = ColeccionPerezosa('ventas')
+coleccion_resumen_ventas = ColeccionPerezosa('ventas_resumen')
+coleccion_trabajos = ColeccionPerezosa('trabajos')
+coleccion_carritos = ColeccionPerezosa('carritos')
+coleccion_lotes_inventario = ColeccionPerezosa('inventario_lotes')
+coleccion_ajustes_inventario = ColeccionPerezosa('inventario_ajustes')
 
 # ----------------- FUNCIONES AUXILIARES -----------------
 def encriptar_password(password):
@@ -65,6 +155,493 @@ def calcular_iva(subtotal, porcentaje_iva=16):
     """Calcular IVA basado en el subtotal"""
     return subtotal * (porcentaje_iva / 100)
 
+# ----------------- PAGINACIÓN POR CURSOR -----------------
+PAGINA_TAMANO = int(os.environ.get('PAGINA_TAMANO', 50))
+PAGINA_TAMANO_MAX = int(os.environ.get('PAGINA_TAMANO_MAX', 200))
+
+# Órdenes permitidos por listado; todos terminan en _id para que el cursor sea único
+ORDENES_VENTAS = {
+    'recientes': [('fecha_venta', DESCENDING), ('_id', DESCENDING)],
+    'antiguas': [('fecha_venta', ASCENDING), ('_id', ASCENDING)],
+}
+ORDENES_LIBROS = {
+    'recientes': [('_id', DESCENDING)],
+    'nombre': [('nombre', ASCENDING), ('_id', ASCENDING)],
+    'stock': [('stock', ASCENDING), ('_id', ASCENDING)],
+}
+ORDENES_PERSONAS = {
+    'recientes': [('_id', DESCENDING)],
+    'nombre': [('nombre', ASCENDING), ('_id', ASCENDING)],
+}
+
+# Los cursores van firmados, así que la API solo acepta los que ella misma generó
+# (cada cursor distinto ocuparía un lugar en la caché de libros)
+def firmador_cursores():
+    # Se arma en cada uso para tomar la clave vigente de app.secret_key
+    return URLSafeSerializer(app.secret_key, salt='cursor-paginacion', serializer=json_util)
+
+def codificar_cursor(orden, documento, direccion):
+    """Crear un cursor opaco y firmado con los valores de orden del documento"""
+    datos = {'o': orden, 'd': direccion, 'v': [documento.get(campo) for campo in orden]}
+    return firmador_cursores().dumps(datos)
+
+# Los valores del cursor van tal cual al filtro, así que solo se aceptan escalares:
+# un dict ({"$ne": null}) o una regex metería operadores en la consulta
+TIPOS_VALOR_CURSOR = (str, int, float, bool, ObjectId, datetime, type(None))
+
+def cursor_valido(datos):
+    """¿Tiene `datos` la forma que genera codificar_cursor?"""
+    return (isinstance(datos, dict) and datos.get('d') in ('siguiente', 'anterior')
+            and isinstance(datos.get('o'), list) and isinstance(datos.get('v'), list)
+            and len(datos['v']) == len(datos['o'])
+            and all(isinstance(valor, TIPOS_VALOR_CURSOR) for valor in datos['v']))
+
+def decodificar_cursor(cursor):
+    """Datos del cursor, o None si no lo generó esta aplicación o está mal formado"""
+    try:
+        datos = firmador_cursores().loads(cursor)
+    except BadSignature:
+        return None
+    return datos if cursor_valido(datos) else None
+
+def filtro_cursor(orden, valores, direccion):
+    """Filtro keyset: documentos posteriores (o anteriores) a los valores dados"""
+    condiciones = []
+    for i, (campo, sentido) in enumerate(orden):
+        hacia_adelante = (sentido == ASCENDING) == (direccion == 'siguiente')
+        condicion = {orden[j][0]: valores[j] for j in range(i)}
+        condicion[campo] = {'$gt' if hacia_adelante else '$lt': valores[i]}
+        condiciones.append(condicion)
+    return {'$or': condiciones}
+
+def paginar(coleccion, filtro, orden, cursor=None, limite=PAGINA_TAMANO, proyeccion=None):
+    """Obtener una página ordenada en el servidor usando paginación keyset.
+    Regresa un dict con los documentos y los cursores siguiente/anterior."""
+    campos_orden = [campo for campo, _ in orden]
+    datos = decodificar_cursor(cursor) if cursor else None
+    if datos and datos.get('o') != campos_orden:
+        datos = None
+
+    direccion = datos['d'] if datos else 'siguiente'
+    consulta = dict(filtro)
+    if datos:
+        consulta = {'$and': [filtro, filtro_cursor(orden, datos['v'], direccion)]}
+
+    orden_consulta = orden
+    if direccion == 'anterior':
+        orden_consulta = [(campo, -sentido) for campo, sentido in orden]
+
+    documentos = list(coleccion.find(consulta, proyeccion).sort(orden_consulta).limit(limite + 1))
+    hay_mas = len(documentos) > limite
+    documentos = documentos[:limite]
+    if direccion == 'anterior':
+        documentos.reverse()
+
+    siguiente = anterior = None
+    if documentos:
+        if hay_mas or direccion == 'anterior':
+            siguiente = codificar_cursor(campos_orden, documentos[-1], 'siguiente')
+        if datos and (hay_mas or direccion == 'siguiente'):
+            anterior = codificar_cursor(campos_orden, documentos[0], 'anterior')
+
+    return {'documentos': documentos, 'siguiente': siguiente, 'anterior': anterior}
+
+def parametros_paginacion(ordenes):
+    """Leer orden, cursor y tamaño de página de la petición"""
+    orden = request.args.get('orden')
+    if orden not in ordenes:
+        orden = next(iter(ordenes))
+    try:
+        limite = int(request.args.get('limite', PAGINA_TAMANO))
+    except ValueError:
+        limite = PAGINA_TAMANO
+    limite = max(1, min(limite, PAGINA_TAMANO_MAX))
+    return orden, request.args.get('cursor'), limite
+
+# ----------------- CARGA EN LOTE -----------------
+def obtener_por_ids(coleccion, ids):
+    """Obtener documentos por _id con una sola consulta $in.
+    Usa un mapa de identidad por petición para no pedir dos veces el mismo documento."""
+    mapa = g.setdefault('mapa_identidad', {}).setdefault(coleccion.name, {})
+    faltantes = set()
+    for id_ in ids:
+        if id_ not in mapa and ObjectId.is_valid(id_):
+            faltantes.add(ObjectId(id_))
+    if faltantes:
+        for documento in coleccion.find({'_id': {'$in': list(faltantes)}}):
+            mapa[str(documento['_id'])] = documento
+        for id_ in faltantes:
+            mapa.setdefault(str(id_), None)
+    return {id_: mapa.get(id_) for id_ in ids}
+
+def completar_ventas(ventas):
+    """Agregar datos de cliente y vendedor a las ventas antiguas que no los guardan"""
+    clientes = obtener_por_ids(coleccion_clientes, [
+        venta['cliente_id'] for venta in ventas if 'cliente_nombre' not in venta
+    ])
+    usuarios = obtener_por_ids(coleccion_usuarios, [
+        venta['usuario_id'] for venta in ventas if 'usuario_nombre' not in venta and 'usuario_id' in venta
+    ])
+
+    for venta in ventas:
+        # Asegurarse de que tenemos información del cliente
+        if 'cliente_nombre' not in venta:
+            cliente = clientes.get(venta['cliente_id'])
+            if cliente:
+                venta['cliente_nombre'] = cliente['nombre']
+                venta['cliente_email'] = cliente['email']
+                venta['cliente_telefono'] = cliente.get('telefono', '')
+            else:
+                venta['cliente_nombre'] = 'Cliente no encontrado'
+                venta['cliente_email'] = ''
+                venta['cliente_telefono'] = ''
+
+        # Asegurarse de que tenemos información del usuario
+        if 'usuario_nombre' not in venta and 'usuario_id' in venta:
+            usuario = usuarios.get(venta['usuario_id'])
+            venta['usuario_nombre'] = usuario['nombre'] if usuario else 'Usuario no encontrado'
+    return ventas
+
+# ----------------- MODELOS DE VISTA -----------------
+# Caracteres de la descripción que muestra el catálogo; se pide uno más para saber si poner "..."
+DESCRIPCION_CATALOGO = int(os.environ.get('DESCRIPCION_CATALOGO', 100))
+
+class ModeloVista:
+    """Fila compacta de solo lectura para las plantillas de listados.
+    Cada subclase declara en __slots__ los campos que muestra su plantilla y en
+    PROYECCION lo que se le pide a Mongo (incluyendo los campos de orden del cursor).
+    Los campos que no vienen en el documento quedan sin asignar, igual que con un dict."""
+    __slots__ = ()
+    PROYECCION = {}
+
+    @classmethod
+    def desde_documento(cls, documento):
+        fila = object.__new__(cls)
+        for campo in cls.__slots__:
+            if campo in documento:
+                setattr(fila, campo, documento[campo])
+        return fila
+
+    @classmethod
+    def lista(cls, documentos):
+        return [cls.desde_documento(documento) for documento in documentos]
+
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except AttributeError:
+            raise KeyError(campo) from None
+
+    def get(self, campo, defecto=None):
+        return getattr(self, campo, defecto)
+
+class UsuarioFila(ModeloVista):
+    __slots__ = ('_id', 'nombre', 'email', 'rol', 'fecha_registro')
+    PROYECCION = dict.fromkeys(__slots__, 1)
+
+class ClienteFila(ModeloVista):
+    __slots__ = ('_id', 'nombre', 'email', 'telefono', 'direccion', 'fecha_registro', 'activo')
+    PROYECCION = dict.fromkeys(__slots__, 1)
+
+class LibroFila(ModeloVista):
+    __slots__ = ('_id', 'nombre', 'autor', 'genero', 'isbn', 'precio', 'stock')
+    PROYECCION = dict.fromkeys(__slots__, 1)
+
+class LibroCatalogo(ModeloVista):
+    __slots__ = LibroFila.__slots__ + ('anio_publicacion', 'descripcion')
+    PROYECCION = {
+        **dict.fromkeys(__slots__, 1),
+        'descripcion': {'$substrCP': ['$descripcion', 0, DESCRIPCION_CATALOGO + 1]},
+    }
+
+class VentaFila(ModeloVista):
+    __slots__ = ('_id', 'fecha_venta', 'tipo', 'cliente_nombre', 'cliente_email', 'usuario_nombre',
+                 'items', 'subtotal', 'iva', 'total')
+    # cliente_id y usuario_id solo los usa completar_ventas con las ventas antiguas
+    PROYECCION = {
+        **{campo: 1 for campo in __slots__ if campo != 'items'},
+        'items.titulo': 1, 'items.cantidad': 1, 'cliente_id': 1, 'usuario_id': 1,
+    }
+
+class CompraFila(ModeloVista):
+    __slots__ = ('_id', 'fecha_venta', 'total', 'estado', 'num_items')
+    # El número de items se calcula en el servidor; los items se cargan solo en ver_compra
+    PROYECCION = {
+        **{campo: 1 for campo in __slots__ if campo != 'num_items'},
+        'num_items': {'$size': {'$ifNull': ['$items', []]}},
+    }
+
+# ----------------- SNAPSHOTS CON TTL -----------------
+class Snapshot:
+    """Valor calculado que se reutiliza durante `ttl` segundos.
+    Al vencer (o al invalidarse) se sigue sirviendo el valor anterior mientras
+    se recalcula en segundo plano; solo la primera lectura espera el cálculo."""
+
+    def __init__(self, calcular, ttl):
+        self.calcular = calcular
+        self.ttl = ttl
+        self._valor = None
+        self._calculado_en = 0.0
+        self._recalculando = False
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        with self._lock:
+            valor = self._valor
+            vencido = time.monotonic() - self._calculado_en >= self.ttl
+        if valor is None:
+            return self._recalcular()
+        if vencido:
+            self._recalcular_en_segundo_plano()
+        return valor
+
+    def invalidar(self):
+        """Solo marca el valor como vencido; se recalcula en la siguiente lectura"""
+        with self._lock:
+            self._calculado_en = 0.0
+            self._version += 1
+
+    def _recalcular(self):
+        with self._lock:
+            version = self._version
+        valor = self.calcular()
+        with self._lock:
+            self._valor = valor
+            # Si se invalidó durante el cálculo, el valor ya nace vencido
+            self._calculado_en = time.monotonic() if version == self._version else 0.0
+        return valor
+
+    def _recalcular_en_segundo_plano(self):
+        with self._lock:
+            if self._recalculando:
+                return
+            self._recalculando = True
+
+        def tarea():
+            try:
+                with app.app_context():
+                    self._recalcular()
+            except Exception as e:
+                print(f"ERROR: No se pudo recalcular el snapshot: {e}")
+            finally:
+                with self._lock:
+                    self._recalculando = False
+
+        threading.Thread(target=tarea, daemon=True).start()
+
+# ----------------- BÚSQUEDA DEL CATÁLOGO -----------------
+# Cada libro guarda en `terminos_busqueda` las palabras de su título y autor
+# normalizadas (minúsculas, sin acentos). Las búsquedas usan prefijos anclados
+# sobre ese arreglo, que sí aprovechan el índice multikey. En `relevancia` se
+# guardan el título y el autor por separado para puntuar dentro de la agregación:
+# los resultados se ordenan por puntuación antes de aplicar el límite.
+BUSQUEDA_LIMITE = int(os.environ.get('BUSQUEDA_LIMITE', 200))
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos: 'Cien Años' -> 'cien anos'"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+def tokenizar(texto):
+    return re.findall(r'\w+', normalizar_texto(texto))
+
+def terminos_libro(libro):
+    """Términos de búsqueda de un libro a partir de su título y autor"""
+    return sorted(set(tokenizar(libro.get('nombre')) + tokenizar(libro.get('autor'))))
+
+def campos_busqueda(libro):
+    """Campos derivados que usa la búsqueda: términos indexados y datos de relevancia"""
+    return {
+        'terminos_busqueda': terminos_libro(libro),
+        'relevancia': {
+            'titulo': tokenizar(libro.get('nombre')),
+            'autor': tokenizar(libro.get('autor')),
+            'inicio': normalizar_texto(libro.get('nombre')),
+        },
+    }
+
+def filtro_busqueda(consulta, filtro=None):
+    """Filtro donde cada palabra de la consulta es prefijo de algún término del libro"""
+    condiciones = [{'terminos_busqueda': {'$regex': '^' + re.escape(termino)}}
+                   for termino in tokenizar(consulta)]
+    if filtro:
+        condiciones.append(filtro)
+    return {'$and': condiciones} if condiciones else {}
+
+def _puntos_termino(campo, termino, exacta, prefijo):
+    """Puntos de un término: `exacta` si es una palabra del campo, `prefijo` si solo la inicia"""
+    palabras = {'$ifNull': [campo, []]}
+    con_prefijo = {'$filter': {'input': palabras, 'as': 'palabra', 'cond': {
+        '$regexMatch': {'input': '$$palabra', 'regex': '^' + re.escape(termino)}}}}
+    return {'$cond': [{'$in': [termino, palabras]}, exacta,
+                      {'$cond': [{'$gt': [{'$size': con_prefijo}, 0]}, prefijo, 0]}]}
+
+def expresion_relevancia(consulta):
+    """Relevancia: coincidencias exactas pesan más que prefijos y el título más que el autor"""
+    terminos = tokenizar(consulta)
+    frase = ' '.join(terminos)
+    puntos = []
+    for termino in terminos:
+        puntos.append(_puntos_termino('$relevancia.titulo', termino, 3, 2))
+        puntos.append(_puntos_termino('$relevancia.autor', termino, 1.5, 1))
+    puntos.append({'$cond': [{'$regexMatch': {'input': {'$ifNull': ['$relevancia.inicio', '']},
+                                              'regex': '^' + re.escape(frase)}}, 2, 0]})
+    return {'$add': puntos}
+
+def pipeline_busqueda(consulta, filtro=None, limite=BUSQUEDA_LIMITE, proyeccion=None):
+    """Agregación que filtra por prefijos, puntúa y ordena por relevancia y luego limita"""
+    pipeline = [
+        {'$match': filtro_busqueda(consulta, filtro)},
+        {'$addFields': {'_puntuacion': expresion_relevancia(consulta)}},
+        {'$sort': {'_puntuacion': -1, 'nombre': 1, '_id': 1}},
+        {'$limit': limite},
+    ]
+    pipeline.append({'$project': proyeccion} if proyeccion else {'$project': {'_puntuacion': 0}})
+    return pipeline
+
+def buscar_libros(consulta, filtro=None, limite=BUSQUEDA_LIMITE, proyeccion=None):
+    """Buscar libros por prefijos de título o autor, los `limite` más relevantes"""
+    if not tokenizar(consulta):
+        return []
+    return list(coleccion_libros.aggregate(pipeline_busqueda(consulta, filtro, limite, proyeccion)))
+
+def reindexar_busqueda(lote=1000, filtro=None):
+    """Recalcular los campos de búsqueda de los libros (para datos existentes)"""
+    procesados = 0
+    operaciones = []
+    for libro in coleccion_libros.find(filtro or {}, {'nombre': 1, 'autor': 1}):
+        operaciones.append(UpdateOne({'_id': libro['_id']}, {'$set': campos_busqueda(libro)}))
+        if len(operaciones) >= lote:
+            coleccion_libros.bulk_write(operaciones, ordered=False)
+            procesados += len(operaciones)
+            operaciones = []
+    if operaciones:
+        coleccion_libros.bulk_write(operaciones, ordered=False)
+        procesados += len(operaciones)
+    if procesados or not filtro:
+        print(f"Términos de búsqueda actualizados en {procesados} libros")
+    return procesados
+
+# ----------------- CACHÉ DE LISTADOS -----------------
+CACHE_MAX_ENTRADAS = int(os.environ.get('CACHE_MAX_ENTRADAS', 256))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 60))
+
+class CacheLRU:
+    """Caché de lectura en memoria con tamaño máximo (LRU) y expiración por TTL.
+    Cada entrada puede llevar etiquetas (p. ej. ids de libros) para invalidar
+    solo las entradas que contienen un documento modificado."""
+
+    def __init__(self, nombre, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._entradas = OrderedDict()  # clave -> (expira_en, valor, etiquetas)
+        self._generacion = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, cargar, etiquetar=None):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            generacion = self._generacion
+
+        valor = cargar()
+        etiquetas = frozenset(etiquetar(valor)) if etiquetar else frozenset()
+        with self._lock:
+            # Si hubo una invalidación mientras se cargaba, no guardar un valor viejo
+            if generacion == self._generacion:
+                self._entradas[clave] = (ahora + self.ttl, valor, etiquetas)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+                    self.expulsiones += 1
+        return valor
+
+    def buscar(self, clave):
+        """Valor en caché o None, sin cargarlo (para quien carga de forma asíncrona)"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor, etiquetas=()):
+        """Guardar un valor recién escrito en la base de datos"""
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor, frozenset(etiquetas))
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def invalidar(self, etiquetas=None):
+        """Sin etiquetas vacía la caché; con etiquetas quita solo las entradas que las contienen"""
+        with self._lock:
+            self._generacion += 1
+            if etiquetas is None:
+                self._entradas.clear()
+                return
+            etiquetas = set(etiquetas)
+            for clave in [c for c, e in self._entradas.items() if e[2] & etiquetas]:
+                del self._entradas[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+            }
+
+cache_libros = CacheLRU('libros')
+cache_clientes = CacheLRU('clientes')
+
+def ids_documentos(documentos):
+    return [str(documento['_id']) for documento in documentos]
+
+def libros_disponibles():
+    """Libros con stock, usados por el catálogo y el formulario de venta"""
+    return cache_libros.obtener(
+        ('disponibles',),
+        lambda: LibroCatalogo.lista(coleccion_libros.find({'stock': {'$gt': 0}}, LibroCatalogo.PROYECCION)),
+        ids_documentos
+    )
+
+def clientes_activos():
+    return cache_clientes.obtener(
+        ('activos',),
+        lambda: ClienteFila.lista(coleccion_clientes.find({'activo': True}, ClienteFila.PROYECCION))
+    )
+
+def calentar_caches():
+    """Cargar los listados más usados al arrancar"""
+    try:
+        libros_disponibles()
+        clientes_activos()
+    except Exception as e:
+        print(f"ERROR: No se pudieron precargar las cachés: {e}")
+
+@app.route('/admin/cache')
+@login_required
+@admin_required
+def estadisticas_cache():
+    return jsonify({cache.nombre: cache.estadisticas() for cache in (cache_libros, cache_clientes, cache_carritos)})
+
 # ----------------- INICIALIZAR DATOS -----------------
 def inicializar_datos():
     # Verificar si existe al menos un usuario administrador
@@ -80,6 +657,144 @@ def inicializar_datos():
         coleccion_usuarios.insert_one(usuario_admin)
         print("Usuario administrador creado: admin@biblioteca.com / admin123")
 
+# ----------------- ÍNDICES -----------------
+# Horas que se guardan los trabajos en segundo plano; la usan el índice TTL de
+# `trabajos` y la limpieza de sus archivos de resultado
+TRABAJOS_RETENCION_HORAS = int(os.environ.get('TRABAJOS_RETENCION_HORAS', 24))
+
+# Índices que necesitan las consultas de las rutas, por nombre de colección
+INDICES = {
+    'ventas': [
+        IndexModel([('fecha_venta', DESCENDING), ('_id', DESCENDING)], name='fecha_venta_id'),
+        IndexModel([('cliente_id', ASCENDING), ('fecha_venta', DESCENDING), ('_id', DESCENDING)],
+                   name='cliente_fecha_venta_id'),
+    ],
+    'carritos': [
+        IndexModel([('actualizado', ASCENDING)], name='actualizado_ttl',
+                   expireAfterSeconds=int(os.environ.get('CARRITO_TTL_DIAS', 7)) * 86400),
+    ],
+    'trabajos': [
+        IndexModel([('creado', ASCENDING)], name='creado_ttl',
+                   expireAfterSeconds=TRABAJOS_RETENCION_HORAS * 3600),
+    ],
+    'inventario_lotes': [
+        IndexModel([('creado', ASCENDING)], name='creado_ttl',
+                   expireAfterSeconds=int(os.environ.get('INVENTARIO_LOTES_RETENCION_DIAS', 30)) * 86400),
+    ],
+    'inventario_ajustes': [
+        IndexModel([('creado', ASCENDING)], name='creado_ttl',
+                   expireAfterSeconds=int(os.environ.get('INVENTARIO_LOTES_RETENCION_DIAS', 30)) * 86400),
+    ],
+    'ventas_resumen': [
+        IndexModel([('periodo', ASCENDING), ('inicio', ASCENDING)], name='periodo_inicio'),
+    ],
+    'tipolibro': [
+        IndexModel([('stock', ASCENDING), ('_id', ASCENDING)], name='stock_id'),
+        IndexModel([('nombre', ASCENDING), ('_id', ASCENDING)], name='nombre_id'),
+        IndexModel([('terminos_busqueda', ASCENDING)], name='terminos_busqueda'),
+        # Filtros y órdenes de /api/v1/libros (igualdad, orden y rango sobre el mismo campo)
+        IndexModel([('precio', ASCENDING), ('_id', ASCENDING)], name='precio_id'),
+        IndexModel([('genero', ASCENDING), ('nombre', ASCENDING), ('_id', ASCENDING)], name='genero_nombre_id'),
+        IndexModel([('genero', ASCENDING), ('precio', ASCENDING), ('_id', ASCENDING)], name='genero_precio_id'),
+        IndexModel([('autor', ASCENDING), ('nombre', ASCENDING), ('_id', ASCENDING)], name='autor_nombre_id'),
+        # Clave de la importación; los libros sin isbn quedan fuera del índice
+        IndexModel([('isbn', ASCENDING)], name='isbn_unico', unique=True,
+                   partialFilterExpression={'isbn': {'$gt': ''}}),
+    ],
+    'clientes': [
+        IndexModel([('email', ASCENDING)], name='email_unico', unique=True),
+        IndexModel([('activo', ASCENDING), ('nombre', ASCENDING), ('_id', ASCENDING)], name='activo_nombre_id'),
+    ],
+    'usuarios': [
+        IndexModel([('email', ASCENDING)], name='email_unico', unique=True),
+        IndexModel([('activo', ASCENDING), ('nombre', ASCENDING), ('_id', ASCENDING)], name='activo_nombre_id'),
+    ],
+}
+
+# Consultas representativas de cada ruta: (ruta, colección, filtro, orden)
+def consultas_rutas():
+    inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return [
+        ('listar_ventas', 'ventas', {}, ORDENES_VENTAS['recientes']),
+        ('listar_libros (nombre)', 'tipolibro', {}, ORDENES_LIBROS['nombre']),
+        ('listar_clientes (nombre)', 'clientes', {'activo': True}, ORDENES_PERSONAS['nombre']),
+        ('dashboard (ventas del mes)', 'ventas', {'fecha_venta': {'$gte': inicio_mes}}, None),
+        ('dashboard (stock bajo)', 'tipolibro', {'stock': {'$lt': 5}}, None),
+        ('catalogo_cliente (búsqueda)', 'tipolibro', filtro_busqueda('garcia', {'stock': {'$gt': 0}}), None),
+        ('mis_compras', 'ventas', {'cliente_id': '000000000000000000000000'}, ORDENES_VENTAS['recientes']),
+        ('login', 'usuarios', {'email': 'admin@biblioteca.com', 'password': '', 'activo': True}, None),
+        ('login_cliente', 'clientes', {'email': 'cliente@biblioteca.com', 'password': '', 'activo': True}, None),
+    ]
+
+def crear_indices():
+    """Crear los índices declarados en INDICES (idempotente)"""
+    errores = []
+    for nombre_coleccion, modelos in INDICES.items():
+        for modelo in modelos:
+            try:
+                db[nombre_coleccion].create_indexes([modelo])
+            except Exception as e:
+                errores.append((nombre_coleccion, modelo.document['name'], str(e)))
+                print(f"ERROR: No se pudo crear el índice {nombre_coleccion}.{modelo.document['name']}: {e}")
+    return errores
+
+def diferencias_indices():
+    """Comparar los índices declarados con los existentes en la base de datos"""
+    faltantes, distintos, sobrantes = [], [], []
+    for nombre_coleccion, modelos in INDICES.items():
+        existentes = db[nombre_coleccion].index_information()
+        declarados = {modelo.document['name']: modelo.document for modelo in modelos}
+        for nombre, declarado in declarados.items():
+            existente = existentes.get(nombre)
+            if existente is None:
+                faltantes.append((nombre_coleccion, nombre))
+            elif (list(existente['key']) != list(declarado['key'].items())
+                  or existente.get('unique', False) != declarado.get('unique', False)):
+                distintos.append((nombre_coleccion, nombre))
+        for nombre in existentes:
+            if nombre != '_id_' and nombre not in declarados:
+                sobrantes.append((nombre_coleccion, nombre))
+    return faltantes, distintos, sobrantes
+
+def _etapas_plan(plan):
+    """Recorrer un plan de explain y devolver todas sus etapas"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for valor in plan.values():
+            yield from _etapas_plan(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas_plan(valor)
+
+def consultas_con_collscan():
+    """Devolver las rutas cuyo plan ganador recorre la colección completa"""
+    rutas = []
+    for ruta, nombre_coleccion, filtro, orden in consultas_rutas():
+        cursor = db[nombre_coleccion].find(filtro)
+        if orden:
+            cursor = cursor.sort(orden)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in _etapas_plan(plan):
+            rutas.append((ruta, nombre_coleccion))
+    return rutas
+
+def verificar_indices():
+    """Reportar diferencias de índices y planes COLLSCAN. Regresa True si todo está bien."""
+    faltantes, distintos, sobrantes = diferencias_indices()
+    for nombre_coleccion, nombre in faltantes:
+        print(f"Falta el índice {nombre_coleccion}.{nombre}")
+    for nombre_coleccion, nombre in distintos:
+        print(f"El índice {nombre_coleccion}.{nombre} no coincide con la declaración")
+    for nombre_coleccion, nombre in sobrantes:
+        print(f"Índice no declarado: {nombre_coleccion}.{nombre}")
+
+    collscans = consultas_con_collscan()
+    for ruta, nombre_coleccion in collscans:
+        print(f"COLLSCAN en la consulta de {ruta} sobre {nombre_coleccion}")
+
+    return not (faltantes or distintos or collscans)
+
 # ----------------- RUTAS DE AUTENTICACIÓN -----------------
 
 @app.route('/')
@@ -131,8 +846,9 @@ def login_cliente():
             session['cliente_id'] = str(cliente['_id'])
             session['cliente_nombre'] = cliente['nombre']
             session['cliente_email'] = cliente['email']
-            # Inicializar carrito vacío
-            session['carrito'] = []
+            # Empezar con un carrito vacío; el anterior expira por TTL
+            session.pop('carrito_id', None)
+            session.pop('carrito_version', None)
             flash('¡Bienvenido ' + cliente['nombre'] + '!', 'success')
             return redirect(url_for('catalogo_cliente'))
         else:
@@ -170,6 +886,7 @@ def registro_cliente():
                 'activo': True
             }
             coleccion_clientes.insert_one(cliente)
+            cache_clientes.invalidar()
             flash('Cliente registrado exitosamente. Ahora puedes iniciar sesión.', 'success')
             return redirect(url_for('login_cliente'))
         except Exception as e:
@@ -185,37 +902,61 @@ def logout():
 
 # ----------------- DASHBOARD ADMIN -----------------
 
+DASHBOARD_TTL = float(os.environ.get('DASHBOARD_TTL', 30))
+
+def _rama_facet(coleccion, pipeline):
+    """Sub-pipeline de $facet que descarta el documento marcador y lee de otra colección"""
+    return [
+        {'$match': {'_marcador': {'$exists': False}}},
+        {'$unionWith': {'coll': coleccion.name, 'pipeline': pipeline}},
+    ]
+
+def calcular_dashboard():
+    """Obtener todas las cifras del dashboard con una sola agregación (MongoDB 5.1+)"""
+    inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    resultado = next(db.aggregate([
+        {'$documents': [{'_marcador': True}]},
+        {'$facet': {
+            'total_libros': _rama_facet(coleccion_libros, [{'$count': 'n'}]),
+            'total_clientes': _rama_facet(coleccion_clientes, [
+                {'$match': {'activo': True}}, {'$count': 'n'}
+            ]),
+            'total_ventas': _rama_facet(coleccion_ventas, [{'$count': 'n'}]),
+            'total_ventas_mes': _rama_facet(coleccion_ventas, [
+                {'$match': {'fecha_venta': {'$gte': inicio_mes}}},
+                {'$group': {'_id': None, 'n': {'$sum': '$total'}}}
+            ]),
+            'libros_stock_bajo': _rama_facet(coleccion_libros, [
+                {'$match': {'stock': {'$lt': 5}}},
+                {'$project': {'nombre': 1, 'stock': 1}}
+            ]),
+            'ventas_recientes': _rama_facet(coleccion_ventas, [
+                {'$sort': {'fecha_venta': -1, '_id': -1}},
+                {'$limit': 5},
+                {'$project': {'cliente_id': 1, 'cliente_nombre': 1, 'fecha_venta': 1, 'total': 1, 'tipo': 1}}
+            ]),
+        }}
+    ]))
+
+    def cifra(nombre):
+        return resultado[nombre][0]['n'] if resultado[nombre] else 0
+
+    return {
+        'total_libros': cifra('total_libros'),
+        'total_clientes': cifra('total_clientes'),
+        'total_ventas': cifra('total_ventas'),
+        'total_ventas_mes': cifra('total_ventas_mes'),
+        'libros_stock_bajo': resultado['libros_stock_bajo'],
+        'ventas_recientes': completar_ventas(resultado['ventas_recientes']),
+    }
+
+snapshot_dashboard = Snapshot(calcular_dashboard, DASHBOARD_TTL)
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     try:
-        total_libros = coleccion_libros.count_documents({})
-        total_clientes = coleccion_clientes.count_documents({'activo': True})
-        total_ventas = coleccion_ventas.count_documents({})
-        
-        inicio_mes = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        ventas_mes_cursor = coleccion_ventas.find({'fecha_venta': {'$gte': inicio_mes}})
-        ventas_mes = list(ventas_mes_cursor)
-        total_ventas_mes = sum(venta.get('total', 0) for venta in ventas_mes)
-        
-        libros_stock_bajo = list(coleccion_libros.find({'stock': {'$lt': 5}}))
-        
-        # CORREGIDO: Ventas recientes para el dashboard
-        ventas_recientes_cursor = coleccion_ventas.find().sort('fecha_venta', -1).limit(5)
-        ventas_recientes = list(ventas_recientes_cursor)
-        
-        for venta in ventas_recientes:
-            if 'cliente_nombre' not in venta:
-                cliente = coleccion_clientes.find_one({'_id': ObjectId(venta['cliente_id'])})
-                venta['cliente_nombre'] = cliente['nombre'] if cliente else 'Cliente no encontrado'
-        
-        return render_template('dashboard.html',
-                             total_libros=total_libros,
-                             total_clientes=total_clientes,
-                             total_ventas=total_ventas,
-                             total_ventas_mes=total_ventas_mes,
-                             libros_stock_bajo=libros_stock_bajo,
-                             ventas_recientes=ventas_recientes)
+        return render_template('dashboard.html', **snapshot_dashboard.obtener())
     except Exception as e:
         flash(f'Error al cargar dashboard: {e}', 'error')
         return render_template('dashboard.html')
@@ -227,8 +968,11 @@ def dashboard():
 @admin_required
 def listar_usuarios():
     try:
-        usuarios = list(coleccion_usuarios.find({'activo': True}))
-        return render_template('usuarios.html', usuarios=usuarios)
+        orden, cursor, limite = parametros_paginacion(ORDENES_PERSONAS)
+        pagina = paginar(coleccion_usuarios, {'activo': True}, ORDENES_PERSONAS[orden], cursor, limite,
+                         UsuarioFila.PROYECCION)
+        return render_template('usuarios.html', usuarios=UsuarioFila.lista(pagina['documentos']), pagina=pagina,
+                               orden=orden, ordenes=ORDENES_PERSONAS)
     except Exception as e:
         flash(f'Error al cargar usuarios: {e}', 'error')
         return render_template('usuarios.html', usuarios=[])
@@ -327,31 +1071,64 @@ def eliminar_usuario(id):
 @login_required
 def listar_libros():
     try:
-        libros = list(coleccion_libros.find())
-        return render_template('libros.html', libros=libros)
+        orden, cursor, limite = parametros_paginacion(ORDENES_LIBROS)
+        pagina = cache_libros.obtener(
+            ('listado', orden, cursor, limite),
+            lambda: paginar(coleccion_libros, {}, ORDENES_LIBROS[orden], cursor, limite, LibroFila.PROYECCION),
+            lambda pagina: ids_documentos(pagina['documentos'])
+        )
+        return render_template('libros.html', libros=LibroFila.lista(pagina['documentos']), pagina=pagina,
+                               orden=orden, ordenes=ORDENES_LIBROS)
     except Exception as e:
         flash(f'Error al cargar libros: {e}', 'error')
         return render_template('libros.html', libros=[])
 
+def _texto(valor):
+    return valor.strip() if isinstance(valor, str) else valor
+
+def _isbn(valor):
+    """El isbn siempre como texto: un JSON puede traerlo como número"""
+    return None if valor is None else str(valor).strip()
+
+def _numero(datos, campo, tipo):
+    valor = _texto(datos.get(campo))
+    if valor in (None, ''):
+        return tipo(0)
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f'{campo} inválido: {valor!r}') from None
+
+def datos_libro(datos):
+    """Validar y convertir los campos de un libro (formulario, fila CSV u objeto JSON)"""
+    libro = {
+        'nombre': _texto(datos.get('nombre')),
+        'autor': _texto(datos.get('autor')),
+        'genero': _texto(datos.get('genero')),
+        'stock': _numero(datos, 'stock', int),
+        'isbn': _isbn(datos.get('isbn')),
+        'anio_publicacion': _numero(datos, 'anio_publicacion', int),
+        'precio': _numero(datos, 'precio', float),
+        'descripcion': _texto(datos.get('descripcion')) or '',
+    }
+    if libro['stock'] < 0 or libro['precio'] < 0:
+        raise ValueError('El stock y el precio no pueden ser negativos')
+    libro.update(campos_busqueda(libro))
+    return libro
+
 @app.route('/libros/agregar', methods=['GET', 'POST'])
 @login_required
 def agregar_libro():
     if request.method == 'POST':
         try:
-            libro = {
-                'nombre': request.form.get('nombre'),         
-                'autor': request.form.get('autor'),
-                'genero': request.form.get('genero'),         
-                'stock': int(request.form.get('stock', 0)), 
-                'isbn': request.form.get('isbn'),
-                'anio_publicacion': int(request.form.get('anio_publicacion', 0)),
-                'precio': float(request.form.get('precio', 0)),
-                'descripcion': request.form.get('descripcion', ''),
-                'fecha_agregado': datetime.now()
-            }
+            libro = datos_libro(request.form)
+            libro['fecha_agregado'] = datetime.now()
             coleccion_libros.insert_one(libro)
+            cache_libros.invalidar()
             flash('Libro agregado exitosamente', 'success')
             return redirect(url_for('listar_libros'))
+        except DuplicateKeyError:
+            flash('Ya existe un libro con ese ISBN', 'error')
         except Exception as e:
             flash(f'Error al crear el libro: {e}', 'error')
     
@@ -364,26 +1141,32 @@ def editar_libro(id):
         libro = coleccion_libros.find_one({'_id': ObjectId(id)})
         
         if request.method == 'POST':
-            datos_actualizados = {
-                'nombre': request.form.get('nombre'),         
-                'autor': request.form.get('autor'),
-                'genero': request.form.get('genero'),
-                'stock': int(request.form.get('stock', 0)),
-                'isbn': request.form.get('isbn'),
-                'anio_publicacion': int(request.form.get('anio_publicacion', 0)),
-                'precio': float(request.form.get('precio', 0)),
-                'descripcion': request.form.get('descripcion', '')
-            }
-            
-            coleccion_libros.update_one(
-                {'_id': ObjectId(id)},
-                {'$set': datos_actualizados}
-            )
+            datos_actualizados = datos_libro(request.form)
+            # El stock se aplica como diferencia contra el que vio el formulario,
+            # para no borrar las ventas y ajustes ocurridos mientras se editaba
+            stock_original = libro.get('stock', 0)
+            if request.form.get('stock_original'):
+                stock_original = _numero(request.form, 'stock_original', int)
+            delta = datos_actualizados.pop('stock') - stock_original
+            filtro = {'_id': ObjectId(id)}
+            cambios = {'$set': datos_actualizados}
+            if delta:
+                cambios['$inc'] = {'stock': delta}
+                if delta < 0:
+                    filtro['stock'] = {'$gte': -delta}
+
+            if not coleccion_libros.update_one(filtro, cambios).matched_count:
+                flash('El stock cambió mientras editabas y no alcanza para ese ajuste', 'error')
+                return redirect(url_for('editar_libro', id=id))
+            cache_libros.invalidar()
             flash('Libro actualizado exitosamente', 'success')
             return redirect(url_for('listar_libros'))
         
         return render_template('editar_libro.html', libro=libro)
     
+    except DuplicateKeyError:
+        flash('Ya existe un libro con ese ISBN', 'error')
+        return redirect(url_for('editar_libro', id=id))
     except Exception as e:
         flash(f'Error: {e}', 'error')
         return redirect(url_for('listar_libros'))
@@ -393,20 +1176,331 @@ def editar_libro(id):
 def eliminar_libro(id):
     try:
         coleccion_libros.delete_one({'_id': ObjectId(id)})
+        cache_libros.invalidar([id])
         flash('Libro eliminado exitosamente', 'success')
     except Exception as e:
         flash(f'Error al eliminar libro: {e}', 'error')
-    
+
     return redirect(url_for('listar_libros'))
 
+# ----------------- IMPORTACIÓN DE LIBROS -----------------
+# El archivo se lee fila por fila y se escribe en lotes de upserts por isbn
+# (bulk_write sin orden); una fila inválida se reporta y no detiene el resto.
+# Un libro existente solo cambia en las columnas que trae el archivo y nunca
+# en su stock.
+IMPORTACION_LOTE = int(os.environ.get('IMPORTACION_LOTE', 1000))
+IMPORTACION_MAX_ERRORES = int(os.environ.get('IMPORTACION_MAX_ERRORES', 1000))
+
+def filas_csv(archivo):
+    """Filas (número de línea, dict) de un archivo CSV binario con encabezados"""
+    lector = csv.DictReader(io.TextIOWrapper(archivo, encoding='utf-8-sig', newline=''))
+    for fila in lector:
+        yield lector.line_num, fila
+
+def filas_ndjson(archivo):
+    """Filas (número de línea, texto) de un archivo NDJSON binario; se decodifican al importar"""
+    for numero, linea in enumerate(io.TextIOWrapper(archivo, encoding='utf-8-sig'), 1):
+        if linea.strip():
+            yield numero, linea
+
+FORMATOS_IMPORTACION = {'csv': filas_csv, 'ndjson': filas_ndjson}
+
+def formato_importacion(nombre_archivo, formato=None):
+    """Formato pedido o, si no se indica, el de la extensión del archivo. Un .json
+    (arreglo JSON) no se acepta: solo NDJSON, un objeto por línea (.ndjson o .jsonl)"""
+    formato = formato or os.path.splitext(nombre_archivo or '')[1].lstrip('.').lower()
+    return 'ndjson' if formato == 'jsonl' else formato
+
+CAMPOS_LIBRO = ('nombre', 'autor', 'genero', 'stock', 'isbn', 'anio_publicacion', 'precio', 'descripcion')
+
+def libro_importado(fila):
+    """Solo las columnas que trae la fila; una columna ausente o vacía no borra
+    el valor guardado del libro"""
+    if isinstance(fila, str):
+        fila = json.loads(fila)
+        if not isinstance(fila, dict):
+            raise ValueError('La línea no es un objeto JSON')
+    presentes = [campo for campo in CAMPOS_LIBRO if _texto(fila.get(campo)) not in (None, '')]
+    convertido = datos_libro({campo: fila[campo] for campo in presentes})
+    libro = {campo: convertido[campo] for campo in presentes}
+    if not libro.get('isbn'):
+        raise ValueError('Falta el isbn')
+    if not libro.get('nombre'):
+        raise ValueError('Falta el nombre')
+    return libro
+
+def operacion_importacion(libro, autor_guardado, ahora):
+    """Upsert por isbn: se actualizan las columnas presentes; los valores por
+    omisión y el stock solo se escriben al insertar (el stock de un libro
+    existente se cambia con ajustes de inventario, no importando el catálogo)"""
+    cambios = dict(libro)
+    al_insertar = {campo: valor for campo, valor in datos_libro({}).items()
+                   if campo not in libro and campo not in ('terminos_busqueda', 'relevancia')}
+    al_insertar['stock'] = cambios.pop('stock', 0)
+    al_insertar['fecha_agregado'] = ahora
+    cambios.update(campos_busqueda({'nombre': libro['nombre'], 'autor': libro.get('autor', autor_guardado)}))
+    return UpdateOne({'isbn': libro['isbn']}, {'$set': cambios, '$setOnInsert': al_insertar}, upsert=True)
+
+def importar_libros(filas, lote=IMPORTACION_LOTE, progreso=None):
+    """Insertar o actualizar libros por isbn. `filas` da pares (número, fila);
+    `progreso` se llama con el resumen después de cada lote."""
+    resumen = {'filas': 0, 'insertados': 0, 'actualizados': 0, 'errores': 0, 'detalle_errores': []}
+    pendientes, numeros = [], []
+    ahora = datetime.now()
+
+    def registrar_error(numero, mensaje):
+        resumen['errores'] += 1
+        if len(resumen['detalle_errores']) < IMPORTACION_MAX_ERRORES:
+            resumen['detalle_errores'].append({'fila': numero, 'error': mensaje})
+
+    def escribir():
+        # Los términos de búsqueda dependen del autor; si la fila no lo trae se
+        # usa el que ya tiene el libro (una consulta por lote)
+        sin_autor = [libro['isbn'] for libro in pendientes if 'autor' not in libro]
+        autores = {}
+        if sin_autor:
+            autores = {doc['isbn']: doc.get('autor') for doc in
+                       coleccion_libros.find({'isbn': {'$in': sin_autor}}, {'isbn': 1, 'autor': 1})}
+        operaciones = [operacion_importacion(libro, autores.get(libro['isbn']), ahora) for libro in pendientes]
+        try:
+            resultado = coleccion_libros.bulk_write(operaciones, ordered=False)
+            insertados, actualizados = resultado.upserted_count, resultado.matched_count
+        except BulkWriteError as e:
+            insertados, actualizados = e.details.get('nUpserted', 0), e.details.get('nMatched', 0)
+            for falla in e.details.get('writeErrors', []):
+                registrar_error(numeros[falla['index']], falla.get('errmsg', 'Error al escribir'))
+        resumen['insertados'] += insertados
+        resumen['actualizados'] += actualizados
+        pendientes.clear()
+        numeros.clear()
+        if progreso:
+            progreso(resumen)
+
+    for numero, fila in filas:
+        resumen['filas'] += 1
+        try:
+            libro = libro_importado(fila)
+        except ValueError as e:
+            registrar_error(numero, str(e))
+            continue
+        pendientes.append(libro)
+        numeros.append(numero)
+        if len(pendientes) >= lote:
+            escribir()
+    if pendientes:
+        escribir()
+
+    if resumen['insertados'] or resumen['actualizados']:
+        cache_libros.invalidar()
+    return resumen
+
+@app.route('/libros/importar', methods=['POST'])
+@login_required
+def importar_libros_archivo():
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        flash('Selecciona un archivo para importar', 'error')
+        return redirect(url_for('listar_libros'))
+    formato = formato_importacion(archivo.filename, request.form.get('formato'))
+    if formato not in FORMATOS_IMPORTACION:
+        flash('Formato no soportado; usa CSV o NDJSON (un objeto JSON por línea, .ndjson o .jsonl)', 'error')
+        return redirect(url_for('listar_libros'))
+
+    try:
+        resumen = importar_libros(FORMATOS_IMPORTACION[formato](archivo.stream))
+    except Exception as e:
+        flash(f'Error al importar libros: {e}', 'error')
+        return redirect(url_for('listar_libros'))
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(resumen)
+    flash(f"Importación terminada: {resumen['insertados']} libros nuevos, {resumen['actualizados']} "
+          f"actualizados, {resumen['errores']} filas con error",
+          'error' if resumen['errores'] else 'success')
+    for error in resumen['detalle_errores'][:10]:
+        flash(f"Fila {error['fila']}: {error['error']}", 'error')
+    return redirect(url_for('listar_libros'))
+
+# ----------------- AJUSTES DE INVENTARIO -----------------
+# Un lote de ajustes (isbn o libro_id, delta) se aplica con $inc relativos en
+# bulk_write sin orden. El resultado de cada fila queda en inventario_ajustes
+# con _id "lote:fila", así que repetir el lote (o retomarlo tras una caída) no
+# suma dos veces la misma fila. Mientras se aplica un bloque, el libro guarda la
+# marca "lote:fila" en ajustes_pendientes; se quita en cuanto el resultado de la
+# fila queda registrado.
+INVENTARIO_LOTE = int(os.environ.get('INVENTARIO_LOTE', 1000))
+INVENTARIO_MAX_AJUSTES = int(os.environ.get('INVENTARIO_MAX_AJUSTES', 20000))
+INVENTARIO_LOTE_TIMEOUT = int(os.environ.get('INVENTARIO_LOTE_TIMEOUT', 300))
+
+class LoteEnCurso(Exception):
+    """Otra petición está aplicando el mismo lote"""
+
+def validar_ajuste(ajuste):
+    """Regresa (filtro del libro, delta) o lanza ValueError"""
+    if not isinstance(ajuste, dict):
+        raise ValueError('El ajuste debe ser un objeto')
+    delta = ajuste.get('delta')
+    if isinstance(delta, bool) or not isinstance(delta, int) or delta == 0:
+        raise ValueError('delta debe ser un entero distinto de 0')
+    if ajuste.get('libro_id'):
+        if not ObjectId.is_valid(str(ajuste['libro_id'])):
+            raise ValueError('libro_id inválido')
+        return {'_id': ObjectId(str(ajuste['libro_id']))}, delta
+    if ajuste.get('isbn'):
+        return {'isbn': str(ajuste['isbn']).strip()}, delta
+    raise ValueError('Falta isbn o libro_id')
+
+def _aplicar_ajustes(lote_id, filas):
+    """Aplicar un bloque de filas (número, ajuste); regresa un resultado por fila"""
+    resultados, validas = {}, []
+    for numero, ajuste in filas:
+        try:
+            filtro, delta = validar_ajuste(ajuste)
+            validas.append((numero, filtro, delta))
+        except ValueError as e:
+            resultados[numero] = {'fila': numero, 'estado': 'invalido', 'error': str(e)}
+
+    # Resolver isbn -> _id con una sola consulta
+    isbns = [filtro['isbn'] for _, filtro, _ in validas if 'isbn' in filtro]
+    ids = [filtro['_id'] for _, filtro, _ in validas if '_id' in filtro]
+    por_isbn, existentes = {}, set()
+    if validas:
+        for libro in coleccion_libros.find({'$or': [{'isbn': {'$in': isbns}}, {'_id': {'$in': ids}}]}, {'isbn': 1}):
+            existentes.add(libro['_id'])
+            por_isbn[libro.get('isbn')] = libro['_id']
+
+    candidatas = []
+    for numero, filtro, delta in validas:
+        libro_id = por_isbn.get(filtro['isbn']) if 'isbn' in filtro else filtro['_id']
+        if libro_id not in existentes:
+            resultados[numero] = {'fila': numero, 'estado': 'no_encontrado', 'delta': delta}
+            continue
+        candidatas.append((numero, libro_id, delta, f'{lote_id}:{numero}'))
+    if not candidatas:
+        return [resultados[numero] for numero, _ in filas]
+
+    # Filas que ya tienen resultado registrado (el lote se está retomando)
+    registradas = {ajuste['_id']: ajuste for ajuste in coleccion_ajustes_inventario.find(
+        {'_id': {'$in': [marca for *_, marca in candidatas]}})}
+    operaciones, aplicadas = [], []
+    for numero, libro_id, delta, marca in candidatas:
+        if marca in registradas:
+            resultados[numero] = registradas[marca]['resultado']
+            continue
+        # Si el libro ya tiene la marca, la fila se aplicó antes de una caída
+        condicion = {'_id': libro_id, 'ajustes_pendientes': {'$ne': marca}}
+        if delta < 0:
+            condicion['stock'] = {'$gte': -delta}
+        operaciones.append(UpdateOne(condicion, {'$inc': {'stock': delta}, '$push': {'ajustes_pendientes': marca}}))
+        aplicadas.append((numero, libro_id, delta, marca))
+
+    if operaciones:
+        coleccion_libros.bulk_write(operaciones, ordered=False)
+        # Aplicadas: las que tienen su marca; las demás no tenían stock suficiente
+        marcas = set()
+        for libro in coleccion_libros.find({'_id': {'$in': [a[1] for a in aplicadas]}},
+                                           {'ajustes_pendientes': 1}):
+            marcas.update(libro.get('ajustes_pendientes', []))
+        ahora = datetime.now()
+        registros = []
+        for numero, libro_id, delta, marca in aplicadas:
+            resultados[numero] = {'fila': numero, 'libro_id': str(libro_id), 'delta': delta,
+                                  'estado': 'aplicado' if marca in marcas else 'stock_insuficiente'}
+            registros.append(UpdateOne({'_id': marca}, {'$setOnInsert': {
+                'lote_id': lote_id, 'resultado': resultados[numero], 'creado': ahora
+            }}, upsert=True))
+        coleccion_ajustes_inventario.bulk_write(registros, ordered=False)
+
+    # Con el resultado ya registrado, las marcas del bloque sobran en los libros
+    marcas_por_libro = defaultdict(list)
+    for _, libro_id, _, marca in candidatas:
+        marcas_por_libro[libro_id].append(marca)
+    coleccion_libros.bulk_write([UpdateOne({'_id': libro_id}, {'$pull': {'ajustes_pendientes': {'$in': marcas}}})
+                                 for libro_id, marcas in marcas_por_libro.items()], ordered=False)
+    return [resultados[numero] for numero, _ in filas]
+
+def aplicar_lote_inventario(lote_id, ajustes, usuario_id=None):
+    """Aplicar un lote de ajustes una sola vez. Regresa (reporte, repetido)."""
+    huella = hashlib.sha256(json.dumps(ajustes, sort_keys=True, default=str).encode()).hexdigest()
+    ahora = datetime.now()
+    try:
+        coleccion_lotes_inventario.insert_one({
+            '_id': lote_id, 'estado': 'aplicando', 'huella': huella, 'usuario_id': usuario_id,
+            'creado': ahora, 'actualizado': ahora
+        })
+    except DuplicateKeyError:
+        lote = coleccion_lotes_inventario.find_one({'_id': lote_id})
+        if lote['huella'] != huella:
+            raise ValueError('El lote_id ya se usó con otros ajustes')
+        if lote['estado'] == 'completado':
+            return lote['reporte'], True
+        # Retomar un lote que quedó a medias; las filas registradas no se repiten
+        if not coleccion_lotes_inventario.find_one_and_update(
+            {'_id': lote_id, 'estado': 'aplicando',
+             'actualizado': {'$lt': ahora - timedelta(seconds=INVENTARIO_LOTE_TIMEOUT)}},
+            {'$set': {'actualizado': ahora}}
+        ):
+            raise LoteEnCurso()
+
+    filas = list(enumerate(ajustes, 1))
+    resultados = []
+    for inicio in range(0, len(filas), INVENTARIO_LOTE):
+        resultados.extend(_aplicar_ajustes(lote_id, filas[inicio:inicio + INVENTARIO_LOTE]))
+        coleccion_lotes_inventario.update_one({'_id': lote_id}, {'$set': {'actualizado': datetime.now()}})
+
+    aplicados = [r['libro_id'] for r in resultados if r['estado'] == 'aplicado']
+    reporte = {
+        'lote_id': lote_id,
+        'filas': len(resultados),
+        'aplicados': len(aplicados),
+        'errores': len(resultados) - len(aplicados),
+        'resultados': resultados,
+    }
+    coleccion_lotes_inventario.update_one({'_id': lote_id}, {'$set': {
+        'estado': 'completado', 'reporte': reporte, 'actualizado': datetime.now()
+    }})
+    if aplicados:
+        cache_libros.invalidar(aplicados)
+        snapshot_dashboard.invalidar()
+    return reporte, False
+
+@app.route('/inventario/ajustes', methods=['POST'])
+@login_required
+def ajustes_inventario():
+    """Recibe {"lote_id": "...", "ajustes": [{"isbn": "...", "delta": 10}, {"libro_id": "...", "delta": -2}]}"""
+    datos = request.get_json(silent=True) or {}
+    lote_id, ajustes = datos.get('lote_id'), datos.get('ajustes')
+    if not isinstance(lote_id, str) or not lote_id.strip() or len(lote_id) > 100:
+        return jsonify({'success': False, 'message': 'Falta lote_id'}), 400
+    if not isinstance(ajustes, list) or not ajustes:
+        return jsonify({'success': False, 'message': 'Falta la lista de ajustes'}), 400
+    if len(ajustes) > INVENTARIO_MAX_AJUSTES:
+        return jsonify({'success': False,
+                        'message': f'Máximo {INVENTARIO_MAX_AJUSTES} ajustes por lote'}), 413
+
+    try:
+        reporte, repetido = aplicar_lote_inventario(lote_id.strip(), ajustes, session.get('usuario_id'))
+    except LoteEnCurso:
+        return jsonify({'success': False, 'message': 'El lote se está aplicando'}), 409, {'Retry-After': '5'}
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 422
+    except Exception as e:
+        print(f"ERROR: No se pudo aplicar el lote de inventario {lote_id}: {e}")
+        return jsonify({'success': False, 'message': 'Error al aplicar el lote'}), 500
+
+    return jsonify({'success': True, 'repetido': repetido, **reporte})
+
 # ----------------- CRUD CLIENTES (ADMIN) -----------------
 
 @app.route('/clientes')
 @login_required
 def listar_clientes():
     try:
-        clientes = list(coleccion_clientes.find({'activo': True}))
-        return render_template('clientes.html', clientes=clientes)
+        orden, cursor, limite = parametros_paginacion(ORDENES_PERSONAS)
+        pagina = paginar(coleccion_clientes, {'activo': True}, ORDENES_PERSONAS[orden], cursor, limite,
+                         ClienteFila.PROYECCION)
+        return render_template('clientes.html', clientes=ClienteFila.lista(pagina['documentos']), pagina=pagina,
+                               orden=orden, ordenes=ORDENES_PERSONAS)
     except Exception as e:
         flash(f'Error al cargar clientes: {e}', 'error')
         return render_template('clientes.html', clientes=[])
@@ -435,6 +1529,7 @@ def agregar_cliente():
                 'activo': True
             }
             coleccion_clientes.insert_one(cliente)
+            cache_clientes.invalidar()
             flash('Cliente agregado exitosamente', 'success')
             return redirect(url_for('listar_clientes'))
         except Exception as e:
@@ -472,6 +1567,7 @@ def editar_cliente(id):
                 {'_id': ObjectId(id)},
                 {'$set': datos_actualizados}
             )
+            cache_clientes.invalidar()
             
             if resultado.modified_count > 0:
                 flash('Cliente actualizado exitosamente', 'success')
@@ -494,41 +1590,333 @@ def eliminar_cliente(id):
             {'_id': ObjectId(id)},
             {'$set': {'activo': False}}
         )
+        cache_clientes.invalidar()
         flash('Cliente eliminado exitosamente', 'success')
     except Exception as e:
         flash(f'Error al eliminar cliente: {e}', 'error')
     
     return redirect(url_for('listar_clientes'))
 
+# ----------------- TRABAJOS EN SEGUNDO PLANO -----------------
+# Las tareas que consumen CPU (PDFs, exportaciones) corren en un pool acotado de
+# procesos. El control de admisión limita cuántas pueden estar en vuelo a la vez
+# para que la carga de PDFs no deje sin recursos al catálogo ni al checkout.
+TRABAJOS_PROCESOS = int(os.environ.get('TRABAJOS_PROCESOS', max(1, (os.cpu_count() or 2) // 2)))
+TRABAJOS_MAX_PENDIENTES = int(os.environ.get('TRABAJOS_MAX_PENDIENTES', TRABAJOS_PROCESOS * 4))
+TRABAJOS_TIMEOUT = float(os.environ.get('TRABAJOS_TIMEOUT', 60))
+TRABAJOS_DIR = os.environ.get(
+    'TRABAJOS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trabajos_resultados'))
+
+class TrabajoRechazado(Exception):
+    """El pool de procesos ya tiene el máximo de trabajos pendientes"""
+
+_pool = None
+_pool_lock = threading.Lock()
+_cupos_trabajos = threading.BoundedSemaphore(TRABAJOS_MAX_PENDIENTES)
+trabajos_pendientes = [0]  # Solo para métricas
+
+def _liberar_cupo(_futuro):
+    with _pool_lock:
+        trabajos_pendientes[0] -= 1
+    _cupos_trabajos.release()
+
+def obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=TRABAJOS_PROCESOS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def enviar_trabajo(funcion, *args, esperar=False):
+    """Enviar una tarea al pool. Sin `esperar`, lanza TrabajoRechazado si no hay cupo."""
+    if not _cupos_trabajos.acquire(blocking=esperar, timeout=TRABAJOS_TIMEOUT if esperar else None):
+        raise TrabajoRechazado()
+    try:
+        futuro = obtener_pool().submit(funcion, *args)
+    except Exception:
+        _cupos_trabajos.release()
+        raise
+    with _pool_lock:
+        trabajos_pendientes[0] += 1
+    futuro.add_done_callback(_liberar_cupo)
+    return futuro
+
+def _limpiar_resultados_viejos():
+    limite = time.time() - TRABAJOS_RETENCION_HORAS * 3600
+    if not os.path.isdir(TRABAJOS_DIR):
+        return
+    for archivo in os.listdir(TRABAJOS_DIR):
+        ruta = os.path.join(TRABAJOS_DIR, archivo)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+def crear_trabajo(tipo, funcion, args, extension, parametros):
+    """Registrar un trabajo en MongoDB y enviarlo al pool; regresa su id"""
+    _limpiar_resultados_viejos()
+    trabajo_id = ObjectId()
+    archivo = os.path.join(TRABAJOS_DIR, f'{trabajo_id}.{extension}')
+    coleccion_trabajos.insert_one({
+        '_id': trabajo_id,
+        'tipo': tipo,
+        'estado': 'pendiente',
+        'parametros': parametros,
+        'archivo': archivo,
+        'usuario_id': session.get('usuario_id'),
+        'creado': datetime.now()
+    })
+    try:
+        futuro = enviar_trabajo(funcion, *args, archivo)
+    except TrabajoRechazado:
+        coleccion_trabajos.delete_one({'_id': trabajo_id})
+        raise
+
+    def al_terminar(futuro):
+        try:
+            cambios = {'estado': 'completado', 'resultado': futuro.result()}
+        except Exception as e:
+            cambios = {'estado': 'error', 'error': str(e)}
+        cambios['terminado'] = datetime.now()
+        coleccion_trabajos.update_one({'_id': trabajo_id}, {'$set': cambios})
+
+    futuro.add_done_callback(al_terminar)
+    return trabajo_id
+
+# ----------------- CACHÉ DE COMPROBANTES -----------------
+# Una venta completada no cambia, así que su PDF se genera una sola vez y se
+# guarda en disco con una clave derivada del _id y de la versión de plantilla.
+COMPROBANTES_DIR = os.environ.get(
+    'COMPROBANTES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_comprobantes'))
+COMPROBANTES_MAX_BYTES = int(os.environ.get('COMPROBANTES_MAX_MB', 512)) * 1024 * 1024
+PRERENDER_COMPROBANTES = os.environ.get('PRERENDER_COMPROBANTES', '0') == '1'
+
+# Subir la versión al cambiar el diseño de los comprobantes invalida la caché
+COMPROBANTES_VERSION = '2'
+
+_cache_comprobantes_bytes = None
+_cache_comprobantes_lock = threading.Lock()
+
+def ruta_comprobante(plantilla, venta_id):
+    clave = hashlib.sha256(f'{plantilla}:{venta_id}:{COMPROBANTES_VERSION}'.encode()).hexdigest()
+    return os.path.join(COMPROBANTES_DIR, clave[:2], f'{clave}.pdf')
+
+def _archivos_comprobantes():
+    for raiz, _, archivos in os.walk(COMPROBANTES_DIR):
+        for archivo in archivos:
+            if archivo.endswith('.pdf'):
+                ruta = os.path.join(raiz, archivo)
+                try:
+                    estado = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                yield ruta, estado.st_size, estado.st_mtime
+
+def _registrar_bytes_comprobante(tamano):
+    """Llevar el tamaño de la caché y expulsar los PDFs menos usados al pasar el límite"""
+    global _cache_comprobantes_bytes
+    with _cache_comprobantes_lock:
+        if _cache_comprobantes_bytes is None:
+            _cache_comprobantes_bytes = sum(t for _, t, _ in _archivos_comprobantes())
+        else:
+            _cache_comprobantes_bytes += tamano
+        if _cache_comprobantes_bytes <= COMPROBANTES_MAX_BYTES:
+            return
+
+        # Expulsar por fecha de último uso hasta quedar en 90% del límite
+        archivos = sorted(_archivos_comprobantes(), key=lambda archivo: archivo[2])
+        total = sum(t for _, t, _ in archivos)
+        for ruta, tamano_archivo, _ in archivos:
+            if total <= COMPROBANTES_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano_archivo
+            except FileNotFoundError:
+                pass
+        _cache_comprobantes_bytes = total
+
+def comprobante_en_cache(plantilla, venta, esperar=False):
+    """Regresar la ruta del PDF en caché, generándolo si todavía no existe"""
+    ruta = ruta_comprobante(plantilla, venta['_id'])
+    if os.path.exists(ruta):
+        os.utime(ruta)  # Marca de uso reciente para la expulsión
+        return ruta
+
+    # El PDF se genera en el pool de procesos para no ocupar el GIL del worker web
+    futuro = enviar_trabajo(trabajos.renderizar_comprobante, venta, plantilla, ruta, esperar=esperar)
+    _registrar_bytes_comprobante(futuro.result(timeout=TRABAJOS_TIMEOUT))
+    return ruta
+
+def enviar_comprobante(plantilla, venta, nombre_archivo):
+    try:
+        origen = comprobante_en_cache(plantilla, venta)
+    except (TrabajoRechazado, TiempoAgotado):
+        return "Servidor ocupado generando comprobantes, intenta de nuevo en unos segundos", 503, {'Retry-After': '5'}
+    except OSError as e:
+        # Si no se puede escribir la caché, generar el PDF en memoria
+        print(f"ERROR: Caché de comprobantes no disponible: {e}")
+        origen = io.BytesIO(comprobantes.generar_pdf(venta, comprobantes.DISENOS[plantilla]))
+    # Los validadores HTTP los pone respuesta_condicional a partir de la venta
+    return send_file(origen, as_attachment=True, download_name=nombre_archivo, mimetype='application/pdf',
+                     etag=False, last_modified=venta.get('fecha_venta'))
+
+def prerenderizar_comprobantes(venta):
+    """Generar en segundo plano los comprobantes de una venta recién registrada"""
+    plantillas = ['venta', 'compra'] if venta.get('tipo') == 'online' else ['venta']
+
+    def tarea():
+        for plantilla in plantillas:
+            try:
+                comprobante_en_cache(plantilla, venta)
+            except TrabajoRechazado:
+                pass  # Se generará cuando alguien lo descargue
+            except Exception as e:
+                print(f"ERROR: No se pudo prerenderizar el comprobante: {e}")
+
+    threading.Thread(target=tarea, daemon=True).start()
+
+# ----------------- MOTOR DE CHECKOUT -----------------
+# Las tres rutas de compra (nueva_venta, comprar_carrito, comprar_directo)
+# registran la venta aquí con un número fijo de viajes a MongoDB.
+USAR_TRANSACCIONES = os.environ.get('MONGO_TRANSACCIONES', '0') == '1'
+
+class ErrorCheckout(Exception):
+    """Error de negocio al registrar una venta; el mensaje se muestra al usuario"""
+
+def preparar_items(solicitudes):
+    """Obtener todos los libros con una sola consulta $in y armar los items de la venta.
+    `solicitudes` es una lista de dicts con libro_id, cantidad y opcionalmente titulo."""
+    cantidades = {}
+    titulos = {}
+    for solicitud in solicitudes:
+        libro_id = solicitud['libro_id']
+        if solicitud['cantidad'] <= 0:
+            raise ErrorCheckout('La cantidad debe ser mayor a 0')
+        if not ObjectId.is_valid(libro_id):
+            raise ErrorCheckout(f"Libro {solicitud.get('titulo', 'desconocido')} no encontrado")
+        cantidades[libro_id] = cantidades.get(libro_id, 0) + solicitud['cantidad']
+        titulos.setdefault(libro_id, solicitud.get('titulo', 'desconocido'))
+
+    libros = {
+        str(libro['_id']): libro
+        for libro in coleccion_libros.find({'_id': {'$in': [ObjectId(i) for i in cantidades]}})
+    }
+
+    items = []
+    for libro_id, cantidad in cantidades.items():
+        libro = libros.get(libro_id)
+        if not libro:
+            raise ErrorCheckout(f'Libro {titulos[libro_id]} no encontrado')
+        if libro.get('stock', 0) < cantidad:
+            raise ErrorCheckout(f'Stock insuficiente para {libro["nombre"]}')
+
+        precio = libro.get('precio', 0)
+        items.append({
+            'libro_id': libro_id,
+            'titulo': libro['nombre'],
+            'autor': libro.get('autor', ''),
+            'genero': libro.get('genero', ''),
+            'isbn': libro.get('isbn', ''),
+            'cantidad': cantidad,
+            'precio_unitario': precio,
+            'subtotal': precio * cantidad
+        })
+    return items
+
+def _reservar_stock(items, venta_id, sesion=None):
+    """Descontar el stock de todos los items en un solo bulk_write condicionado.
+    Fuera de una transacción cada libro queda marcado con la venta en
+    reservas_pendientes hasta confirmarla o deshacerla, para devolver solo
+    lo que sí se descontó."""
+    cambios = [{'$inc': {'stock': -item['cantidad']}} for item in items]
+    if sesion is None:
+        for cambio in cambios:
+            cambio['$push'] = {'reservas_pendientes': venta_id}
+    operaciones = [
+        UpdateOne({'_id': ObjectId(item['libro_id']), 'stock': {'$gte': item['cantidad']}}, cambio)
+        for item, cambio in zip(items, cambios)
+    ]
+    resultado = coleccion_libros.bulk_write(operaciones, ordered=False, session=sesion)
+    return resultado.matched_count == len(operaciones)
+
+def _liberar_stock(items, venta_id):
+    """Devolver el stock de las reservas de esta venta que sí se aplicaron"""
+    coleccion_libros.bulk_write([
+        UpdateOne(
+            {'_id': ObjectId(item['libro_id']), 'reservas_pendientes': venta_id},
+            {'$inc': {'stock': item['cantidad']}, '$pull': {'reservas_pendientes': venta_id}}
+        )
+        for item in items
+    ], ordered=False)
+
+def _confirmar_reserva(items, venta_id):
+    """Quitar la marca de la venta ya guardada; su stock queda descontado"""
+    try:
+        coleccion_libros.update_many({'_id': {'$in': [ObjectId(item['libro_id']) for item in items]}},
+                                     {'$pull': {'reservas_pendientes': venta_id}})
+    except Exception as e:
+        print(f"ERROR: No se pudo confirmar la reserva de la venta {venta_id}: {e}")
+
+def registrar_venta(solicitudes, datos_venta):
+    """Reservar stock y guardar la venta. Regresa el documento insertado.
+    Con MONGO_TRANSACCIONES=1 todo ocurre dentro de una transacción; si no,
+    una reserva parcial se deshace antes de reportar el error."""
+    items = preparar_items(solicitudes)
+    subtotal_venta = sum(item['subtotal'] for item in items)
+    iva_venta = calcular_iva(subtotal_venta)
+
+    venta = dict(datos_venta)
+    venta.update({
+        '_id': ObjectId(),
+        'items': items,
+        'subtotal': subtotal_venta,
+        'iva': iva_venta,
+        'total': subtotal_venta + iva_venta,
+        'fecha_venta': datetime.now(),
+        'estado': 'completada'
+    })
+
+    if USAR_TRANSACCIONES:
+        def transaccion(sesion):
+            if not _reservar_stock(items, venta['_id'], sesion):
+                raise ErrorCheckout('Stock insuficiente para completar la venta')
+            coleccion_ventas.insert_one(venta, session=sesion)
+
+        with obtener_cliente().start_session() as sesion:
+            sesion.with_transaction(transaccion)
+    else:
+        if not _reservar_stock(items, venta['_id']):
+            _liberar_stock(items, venta['_id'])
+            raise ErrorCheckout('Stock insuficiente para completar la venta')
+        try:
+            coleccion_ventas.insert_one(venta)
+        except Exception:
+            _liberar_stock(items, venta['_id'])
+            raise
+        _confirmar_reserva(items, venta['_id'])
+
+    snapshot_dashboard.invalidar()
+    cache_libros.invalidar([item['libro_id'] for item in items])
+    actualizar_resumen_ventas(venta)
+    if PRERENDER_COMPROBANTES:
+        prerenderizar_comprobantes(venta)
+    return venta
+
 # ----------------- VENTAS CON IVA -----------------
 
 @app.route('/ventas')
 @login_required
 def listar_ventas():
     try:
-        # CORREGIDO: Convertir cursor a lista correctamente
-        ventas_cursor = coleccion_ventas.find().sort('fecha_venta', -1)
-        ventas = list(ventas_cursor)
-        
-        for venta in ventas:
-            # Asegurarse de que tenemos información del cliente
-            if 'cliente_nombre' not in venta:
-                cliente = coleccion_clientes.find_one({'_id': ObjectId(venta['cliente_id'])})
-                if cliente:
-                    venta['cliente_nombre'] = cliente['nombre']
-                    venta['cliente_email'] = cliente['email']
-                    venta['cliente_telefono'] = cliente.get('telefono', '')
-                else:
-                    venta['cliente_nombre'] = 'Cliente no encontrado'
-                    venta['cliente_email'] = ''
-                    venta['cliente_telefono'] = ''
-            
-            # Asegurarse de que tenemos información del usuario
-            if 'usuario_nombre' not in venta and 'usuario_id' in venta:
-                usuario = coleccion_usuarios.find_one({'_id': ObjectId(venta['usuario_id'])})
-                venta['usuario_nombre'] = usuario['nombre'] if usuario else 'Usuario no encontrado'
-        
-        return render_template('ventas.html', ventas=ventas)
+        orden, cursor, limite = parametros_paginacion(ORDENES_VENTAS)
+        pagina = paginar(coleccion_ventas, {}, ORDENES_VENTAS[orden], cursor, limite, VentaFila.PROYECCION)
+        ventas = VentaFila.lista(completar_ventas(pagina['documentos']))
+
+        return render_template('ventas.html', ventas=ventas, pagina=pagina,
+                               orden=orden, ordenes=ORDENES_VENTAS)
     except Exception as e:
         flash(f'Error al cargar ventas: {str(e)}', 'error')
         return render_template('ventas.html', ventas=[])
@@ -543,83 +1931,42 @@ def nueva_venta():
                 flash('Selecciona un cliente', 'error')
                 return redirect(url_for('nueva_venta'))
             
-            items = []
             libro_ids = request.form.getlist('libro_id[]')
             cantidades = request.form.getlist('cantidad[]')
+            solicitudes = [
+                {'libro_id': libro_id, 'cantidad': int(cantidades[i])}
+                for i, libro_id in enumerate(libro_ids)
+                if libro_id and cantidades[i] and int(cantidades[i]) > 0
+            ]
             
-            subtotal_venta = 0
-            
-            for i, libro_id in enumerate(libro_ids):
-                if libro_id and cantidades[i] and int(cantidades[i]) > 0:
-                    cantidad = int(cantidades[i])
-                    libro = coleccion_libros.find_one({'_id': ObjectId(libro_id)})
-                    
-                    if libro and libro.get('stock', 0) >= cantidad:
-                        precio = libro.get('precio', 0)
-                        subtotal = precio * cantidad
-                        subtotal_venta += subtotal
-                        
-                        # Guardar información completa del libro
-                        items.append({
-                            'libro_id': str(libro['_id']),
-                            'titulo': libro['nombre'],
-                            'autor': libro.get('autor', ''),
-                            'genero': libro.get('genero', ''),
-                            'isbn': libro.get('isbn', ''),
-                            'cantidad': cantidad,
-                            'precio_unitario': precio,
-                            'subtotal': subtotal
-                        })
-                        
-                        # Actualizar stock
-                        nuevo_stock = libro['stock'] - cantidad
-                        coleccion_libros.update_one(
-                            {'_id': ObjectId(libro_id)},
-                            {'$set': {'stock': nuevo_stock}}
-                        )
-                    else:
-                        libro_nombre = libro['nombre'] if libro else 'Libro desconocido'
-                        flash(f'Stock insuficiente para {libro_nombre}', 'error')
-                        return redirect(url_for('nueva_venta'))
-            
-            if not items:
+            if not solicitudes:
                 flash('Agrega al menos un libro a la venta', 'error')
                 return redirect(url_for('nueva_venta'))
             
-            # Calcular IVA y total
-            iva_venta = calcular_iva(subtotal_venta)
-            total_con_iva = subtotal_venta + iva_venta
-            
             # Obtener información completa del cliente
             cliente = coleccion_clientes.find_one({'_id': ObjectId(cliente_id)})
             
             # Crear venta con información completa e IVA
-            venta = {
+            venta = registrar_venta(solicitudes, {
                 'cliente_id': cliente_id,
                 'cliente_nombre': cliente['nombre'] if cliente else 'Cliente no encontrado',
                 'cliente_email': cliente['email'] if cliente else '',
-                'cliente_telefono': cliente.get('telefono', ''),
+                'cliente_telefono': cliente.get('telefono', '') if cliente else '',
                 'usuario_id': session['usuario_id'],
                 'usuario_nombre': session['usuario_nombre'],
-                'items': items,
-                'subtotal': subtotal_venta,
-                'iva': iva_venta,
-                'total': total_con_iva,
-                'fecha_venta': datetime.now(),
-                'estado': 'completada',
                 'tipo': 'presencial'
-            }
-            
-            resultado = coleccion_ventas.insert_one(venta)
+            })
+            total_con_iva = venta['total']
             flash(f'Venta registrada exitosamente! Total con IVA: ${total_con_iva:.2f}', 'success')
-            return redirect(url_for('ver_venta', id=resultado.inserted_id))
+            return redirect(url_for('ver_venta', id=venta['_id']))
             
+        except ErrorCheckout as e:
+            flash(str(e), 'error')
+            return redirect(url_for('nueva_venta'))
         except Exception as e:
             flash(f'Error al procesar venta: {str(e)}', 'error')
     
-    clientes = list(coleccion_clientes.find({'activo': True}))
-    libros = list(coleccion_libros.find({'stock': {'$gt': 0}}))
-    return render_template('nueva_venta.html', clientes=clientes, libros=libros)
+    return render_template('nueva_venta.html', clientes=clientes_activos(), libros=libros_disponibles())
 
 @app.route('/ventas/<id>')
 @login_required
@@ -630,7 +1977,12 @@ def ver_venta(id):
             flash('Venta no encontrada', 'error')
             return redirect(url_for('listar_ventas'))
         
-        return render_template('ver_venta.html', venta=venta)
+        # Las ventas no cambian después de registrarse
+        return respuesta_condicional(
+            etag_documentos('ver_venta', venta['_id'], venta.get('estado')),
+            lambda: render_template('ver_venta.html', venta=venta),
+            venta.get('fecha_venta')
+        )
     except Exception as e:
         flash(f'Error al cargar venta: {e}', 'error')
         return redirect(url_for('listar_ventas'))
@@ -643,143 +1995,361 @@ def comprobante_venta(id):
         if not venta:
             return "Venta no encontrada", 404
         
-        # Crear PDF
-        buffer = io.BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-        
-        # Configuración inicial
-        pdf.setTitle(f"Comprobante de Venta - {venta['_id']}")
-        
-        # Encabezado
-        pdf.setFont("Helvetica-Bold", 18)
-        pdf.drawString(100, height - 50, "BIBLIOTECA DIGITAL")
-        pdf.setFont("Helvetica-Bold", 16)
-        pdf.drawString(100, height - 70, "COMPROBANTE DE VENTA")
-        pdf.line(100, height - 75, 500, height - 75)
-        
-        # Información de la venta
-        y_position = height - 100
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "INFORMACIÓN DE LA VENTA:")
-        pdf.setFont("Helvetica", 10)
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Folio: {str(venta['_id'])}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Fecha: {venta['fecha_venta'].strftime('%d/%m/%Y')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Hora: {venta['fecha_venta'].strftime('%H:%M:%S')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Estado: {venta.get('estado', 'Completada')}")
-        
-        # Información del cliente
-        y_position -= 25
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "INFORMACIÓN DEL CLIENTE:")
-        pdf.setFont("Helvetica", 10)
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Nombre: {venta.get('cliente_nombre', 'N/A')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Email: {venta.get('cliente_email', 'N/A')}")
-        if venta.get('cliente_telefono'):
-            y_position -= 15
-            pdf.drawString(100, y_position, f"Teléfono: {venta['cliente_telefono']}")
-        
-        # Información del vendedor
-        y_position -= 25
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "INFORMACIÓN DEL VENDEDOR:")
-        pdf.setFont("Helvetica", 10)
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Atendió: {venta.get('usuario_nombre', 'N/A')}")
-        
-        # Tabla de productos
-        y_position -= 30
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "DETALLE DE PRODUCTOS:")
-        
-        # Encabezados de la tabla
-        y_position -= 20
-        pdf.setFont("Helvetica-Bold", 10)
-        pdf.drawString(100, y_position, "Producto")
-        pdf.drawString(300, y_position, "Cant.")
-        pdf.drawString(350, y_position, "Precio Unit.")
-        pdf.drawString(450, y_position, "Subtotal")
-        
-        y_position -= 10
-        pdf.line(100, y_position, 500, y_position)
-        y_position -= 10
-        
-        # Items de la venta
-        pdf.setFont("Helvetica", 9)
-        for item in venta.get('items', []):
-            if y_position < 150:  # Nueva página si es necesario
-                pdf.showPage()
-                y_position = height - 50
-                pdf.setFont("Helvetica", 9)
-            
-            # Título del libro
-            titulo = item['titulo']
-            if len(titulo) > 40:
-                titulo = titulo[:37] + "..."
-            
-            pdf.drawString(100, y_position, titulo)
-            pdf.drawString(300, y_position, str(item['cantidad']))
-            pdf.drawString(350, y_position, f"${item['precio_unitario']:.2f}")
-            pdf.drawString(450, y_position, f"${item['subtotal']:.2f}")
-            
-            # Información adicional del libro
-            if y_position > 160:
-                info_extra = f"Autor: {item.get('autor', 'N/A')}"
-                if len(info_extra) > 50:
-                    info_extra = info_extra[:47] + "..."
-                y_position -= 12
-                pdf.setFont("Helvetica-Oblique", 8)
-                pdf.drawString(100, y_position, info_extra)
-                pdf.setFont("Helvetica", 9)
-            
-            y_position -= 20
-        
-        # Línea separadora
-        y_position -= 10
-        pdf.line(100, y_position, 500, y_position)
-        
-        # Totales
-        subtotal = venta.get('subtotal', 0)
-        iva = venta.get('iva', 0)
-        total = venta.get('total', 0)
-        
-        y_position -= 20
-        pdf.setFont("Helvetica", 10)
-        pdf.drawString(350, y_position, f"Subtotal: ${subtotal:.2f}")
-        y_position -= 15
-        pdf.drawString(350, y_position, f"IVA (16%): ${iva:.2f}")
-        y_position -= 15
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(350, y_position, f"TOTAL: ${total:.2f}")
-        
-        # Pie de página con agradecimiento
-        y_position -= 40
-        pdf.setFont("Helvetica-Oblique", 10)
-        pdf.drawString(100, y_position, "¡Gracias por su compra en Biblioteca Digital!")
-        y_position -= 15
-        pdf.drawString(100, y_position, "Esperamos volver a servirle pronto.")
-        y_position -= 15
-        pdf.drawString(100, y_position, "Sistema de Gestión de Libros - Venta segura y confiable")
-        
-        pdf.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"comprobante_venta_{id}.pdf",
-            mimetype='application/pdf'
+        return respuesta_condicional(
+            etag_documentos('comprobante_venta', venta['_id'], venta.get('estado')),
+            lambda: enviar_comprobante('venta', venta, f"comprobante_venta_{id}.pdf"),
+            venta.get('fecha_venta')
         )
         
     except Exception as e:
         return f"Error al generar comprobante: {e}", 500
 
+class _FlujoZip(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+def filtro_exportacion_ventas():
+    """Filtro de ventas por rango de fechas (desde/hasta AAAA-MM-DD), cliente y vendedor"""
+    filtro = {}
+    rango = {}
+    if request.args.get('desde'):
+        rango['$gte'] = datetime.strptime(request.args['desde'], '%Y-%m-%d')
+    if request.args.get('hasta'):
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d')
+        rango['$lte'] = hasta.replace(hour=23, minute=59, second=59, microsecond=999999)
+    if rango:
+        filtro['fecha_venta'] = rango
+    if request.args.get('cliente_id'):
+        filtro['cliente_id'] = request.args['cliente_id']
+    if request.args.get('usuario_id'):
+        filtro['usuario_id'] = request.args['usuario_id']
+    return filtro
+
+@app.route('/ventas/comprobantes')
+@login_required
+def exportar_comprobantes():
+    """Todos los comprobantes de un rango de fechas o de un cliente en un PDF o un ZIP"""
+    try:
+        filtro = filtro_exportacion_ventas()
+    except ValueError:
+        flash('Fecha inválida, usa AAAA-MM-DD', 'error')
+        return redirect(url_for('listar_ventas'))
+
+    if request.args.get('formato') == 'zip':
+        ventas = coleccion_ventas.find(filtro).sort([('fecha_venta', ASCENDING), ('_id', ASCENDING)]).batch_size(100)
+
+        def generar():
+            # Cada PDF sale de la caché de disco y se envía en cuanto se agrega al ZIP
+            flujo = _FlujoZip()
+            with zipfile.ZipFile(flujo, 'w', zipfile.ZIP_STORED) as archivo_zip:
+                for venta in ventas:
+                    with open(comprobante_en_cache('venta', venta, esperar=True), 'rb') as pdf:
+                        archivo_zip.writestr(f"comprobante_venta_{venta['_id']}.pdf", pdf.read())
+                    yield flujo.vaciar()
+            yield flujo.vaciar()
+
+        return Response(stream_with_context(generar()), mimetype='application/zip', headers={
+            'Content-Disposition': 'attachment; filename=comprobantes.zip'
+        })
+
+    # Un solo PDF: se genera en el pool de procesos, igual que /trabajos/comprobantes
+    try:
+        trabajo_id = crear_trabajo(
+            'exportacion_comprobantes', trabajos.exportar_comprobantes,
+            (MONGO_URI, MONGO_DB, filtro), 'pdf', dict(request.args)
+        )
+    except TrabajoRechazado:
+        flash('Hay demasiados trabajos en proceso, intenta de nuevo en unos segundos', 'error')
+        return redirect(url_for('listar_ventas'))
+    return redirect(url_for('estado_trabajo', id=trabajo_id))
+
+# ----------------- EXPORTACIÓN DE VENTAS -----------------
+# Una fila por item vendido; los datos de la venta se repiten en cada fila.
+# El cursor se consume por lotes y cada bloque de filas se envía en cuanto
+# está listo, así la memoria no depende del tamaño de la exportación.
+EXPORTACION_LOTE = int(os.environ.get('EXPORTACION_LOTE', 1000))
+EXPORTACION_FILAS_POR_BLOQUE = 500
+
+COLUMNAS_VENTA_EXPORTACION = [
+    'venta_id', 'fecha_venta', 'tipo', 'estado', 'cliente_id', 'cliente_nombre',
+    'cliente_email', 'usuario_id', 'usuario_nombre', 'subtotal_venta', 'iva_venta', 'total_venta'
+]
+COLUMNAS_ITEM_EXPORTACION = [
+    'libro_id', 'titulo', 'autor', 'genero', 'isbn', 'cantidad', 'precio_unitario', 'subtotal'
+]
+COLUMNAS_EXPORTACION = COLUMNAS_VENTA_EXPORTACION + COLUMNAS_ITEM_EXPORTACION
+
+PROYECCION_EXPORTACION = {
+    'fecha_venta': 1, 'tipo': 1, 'estado': 1, 'cliente_id': 1, 'cliente_nombre': 1,
+    'cliente_email': 1, 'usuario_id': 1, 'usuario_nombre': 1, 'subtotal': 1, 'iva': 1, 'total': 1,
+    **{f'items.{campo}': 1 for campo in COLUMNAS_ITEM_EXPORTACION}
+}
+
+def filas_venta(venta):
+    """Aplanar una venta en una fila por item"""
+    base = {
+        'venta_id': str(venta['_id']),
+        'fecha_venta': venta['fecha_venta'].isoformat() if venta.get('fecha_venta') else '',
+        'tipo': venta.get('tipo', ''),
+        'estado': venta.get('estado', ''),
+        'cliente_id': str(venta.get('cliente_id', '')),
+        'cliente_nombre': venta.get('cliente_nombre', ''),
+        'cliente_email': venta.get('cliente_email', ''),
+        'usuario_id': str(venta.get('usuario_id', '')),
+        'usuario_nombre': venta.get('usuario_nombre', ''),
+        'subtotal_venta': venta.get('subtotal', 0),
+        'iva_venta': venta.get('iva', 0),
+        'total_venta': venta.get('total', 0),
+    }
+    for item in venta.get('items') or [{}]:
+        fila = dict(base)
+        for campo in COLUMNAS_ITEM_EXPORTACION:
+            valor = item.get(campo, '')
+            fila[campo] = str(valor) if isinstance(valor, ObjectId) else valor
+        yield fila
+
+def generar_csv(ventas):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUMNAS_EXPORTACION)
+    escritor.writeheader()
+    # Primer bloque inmediato: solo encabezados, para un tiempo al primer byte mínimo
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    filas = 0
+    for venta in ventas:
+        for fila in filas_venta(venta):
+            escritor.writerow(fila)
+            filas += 1
+        if filas >= EXPORTACION_FILAS_POR_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            filas = 0
+    yield buffer.getvalue()
+
+def generar_ndjson(ventas):
+    bloque = []
+    for venta in ventas:
+        for fila in filas_venta(venta):
+            bloque.append(json.dumps(fila, ensure_ascii=False))
+        if len(bloque) >= EXPORTACION_FILAS_POR_BLOQUE:
+            yield '\n'.join(bloque) + '\n'
+            bloque = []
+    if bloque:
+        yield '\n'.join(bloque) + '\n'
+
+FORMATOS_EXPORTACION = {
+    'csv': (generar_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (generar_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+@app.route('/ventas/exportar')
+@login_required
+def exportar_ventas():
+    """Exportar ventas en CSV o NDJSON (una línea por item), filtradas como los comprobantes"""
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        flash('Formato de exportación no soportado', 'error')
+        return redirect(url_for('listar_ventas'))
+    try:
+        filtro = filtro_exportacion_ventas()
+    except ValueError:
+        flash('Fecha inválida, usa AAAA-MM-DD', 'error')
+        return redirect(url_for('listar_ventas'))
+
+    generar, mimetype, extension = FORMATOS_EXPORTACION[formato]
+    ventas = (coleccion_ventas.find(filtro, PROYECCION_EXPORTACION)
+              .sort([('fecha_venta', ASCENDING), ('_id', ASCENDING)])
+              .batch_size(EXPORTACION_LOTE))
+    return Response(stream_with_context(generar(ventas)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=ventas.{extension}',
+        'X-Accel-Buffering': 'no'  # Que el proxy no acumule la respuesta
+    })
+
+@app.route('/trabajos/comprobantes', methods=['POST'])
+@login_required
+def trabajo_exportar_comprobantes():
+    """Generar en segundo plano el PDF de comprobantes de un rango de fechas o de un cliente"""
+    try:
+        filtro = filtro_exportacion_ventas()
+        trabajo_id = crear_trabajo(
+            'exportacion_comprobantes', trabajos.exportar_comprobantes,
+            (MONGO_URI, MONGO_DB, filtro), 'pdf', dict(request.args)
+        )
+        return jsonify({
+            'success': True,
+            'trabajo_id': str(trabajo_id),
+            'estado': url_for('estado_trabajo', id=trabajo_id),
+            'descarga': url_for('descargar_trabajo', id=trabajo_id)
+        }), 202
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Fecha inválida, usa AAAA-MM-DD'}), 400
+    except TrabajoRechazado:
+        return jsonify({'success': False, 'message': 'Hay demasiados trabajos en proceso'}), 429, {'Retry-After': '10'}
+
+@app.route('/trabajos/<id>')
+@login_required
+def estado_trabajo(id):
+    if not ObjectId.is_valid(id):
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    trabajo = coleccion_trabajos.find_one({'_id': ObjectId(id)}, {'archivo': 0})
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, 'trabajo': json.loads(json_util.dumps(trabajo)),
+                    'descarga': url_for('descargar_trabajo', id=id)})
+
+@app.route('/trabajos/<id>/descarga')
+@login_required
+def descargar_trabajo(id):
+    if not ObjectId.is_valid(id):
+        return "Trabajo no encontrado", 404
+    trabajo = coleccion_trabajos.find_one({'_id': ObjectId(id)})
+    if not trabajo:
+        return "Trabajo no encontrado", 404
+    if trabajo['estado'] != 'completado' or not os.path.exists(trabajo['archivo']):
+        return jsonify({'success': False, 'estado': trabajo['estado']}), 409
+    return send_file(trabajo['archivo'], as_attachment=True,
+                     download_name=f"{trabajo['tipo']}_{id}{os.path.splitext(trabajo['archivo'])[1]}")
+
+# ----------------- CARRITOS EN EL SERVIDOR -----------------
+# La cookie de sesión solo guarda un id opaco del carrito y su versión. Los
+# items viven en la colección `carritos` como un mapa libro_id -> item, así cada
+# cambio es un $set/$inc/$unset sobre un solo item. Cada escritura incrementa
+# `version`; la caché en memoria usa (id, versión) como clave, de modo que un
+# worker nunca sirve un carrito más viejo que el que conoce la cookie.
+#
+# Las funciones cambios_* solo construyen filtros y actualizaciones: las usan
+# tanto estas rutas como las rutas asíncronas de asgi.py.
+cache_carritos = CacheLRU('carritos', ttl=float(os.environ.get('CARRITO_CACHE_TTL', 300)))
+
+class ErrorCarrito(Exception):
+    pass
+
+def carrito_vacio(carrito_id):
+    return {'_id': carrito_id, 'items': {}, 'version': 0}
+
+def nuevo_id_carrito():
+    return secrets.token_urlsafe(16)
+
+def validar_item_carrito(libro, cantidad):
+    """Validaciones comunes antes de agregar o cambiar un item"""
+    if cantidad <= 0:
+        raise ErrorCarrito('La cantidad debe ser mayor a 0')
+    if not libro:
+        raise ErrorCarrito('Libro no encontrado')
+    if libro.get('stock', 0) < cantidad:
+        raise ErrorCarrito('Stock insuficiente')
+
+def items_carrito(carrito):
+    """Lista de items con subtotal, en el orden en que se agregaron"""
+    items = []
+    for libro_id, item in carrito.get('items', {}).items():
+        items.append(dict(item, libro_id=libro_id, subtotal=item['precio'] * item['cantidad']))
+    return items
+
+def totales_carrito(items):
+    subtotal = sum(item['subtotal'] for item in items)
+    iva = calcular_iva(subtotal)
+    return {'subtotal': subtotal, 'iva': iva, 'total': subtotal + iva}
+
+def _versionar(cambios):
+    cambios.setdefault('$inc', {})['version'] = 1
+    cambios.setdefault('$set', {})['actualizado'] = datetime.now()
+    return cambios
+
+def cambios_agregar_item(carrito_id, libro, cantidad, cliente_id):
+    """Sumar `cantidad` del libro sin pasar del stock disponible (con upsert).
+
+    La condición sobre la cantidad también acepta un item que todavía no existe;
+    si el carrito existe pero no la cumple, el upsert choca con el _id
+    (DuplicateKeyError), lo que significa stock insuficiente."""
+    ruta = f"items.{libro['_id']}"
+    filtro = {'_id': carrito_id, f'{ruta}.cantidad': {'$not': {'$gt': libro.get('stock', 0) - cantidad}}}
+    return filtro, _versionar({
+        '$inc': {f'{ruta}.cantidad': cantidad},
+        '$set': {
+            f'{ruta}.titulo': libro['nombre'],
+            f'{ruta}.autor': libro.get('autor', ''),
+            f'{ruta}.precio': libro['precio'],
+        },
+        '$setOnInsert': {'cliente_id': cliente_id},
+    })
+
+def cambios_cantidad_item(carrito_id, libro, cantidad):
+    ruta = f"items.{libro['_id']}"
+    return ({'_id': carrito_id, ruta: {'$exists': True}},
+            _versionar({'$set': {f'{ruta}.cantidad': cantidad, f'{ruta}.precio': libro['precio']}}))
+
+def cambios_quitar_item(carrito_id, libro_id):
+    if not ObjectId.is_valid(libro_id):
+        raise ErrorCarrito('Libro no encontrado')
+    return {'_id': carrito_id}, _versionar({'$unset': {f'items.{libro_id}': ''}})
+
+def cambios_vaciar_carrito(carrito_id):
+    return {'_id': carrito_id}, _versionar({'$set': {'items': {}}})
+
+def id_carrito():
+    """Id del carrito de la sesión; se asigna uno nuevo si no existe"""
+    if 'carrito_id' not in session:
+        session['carrito_id'] = nuevo_id_carrito()
+        session['carrito_version'] = 0
+    return session['carrito_id']
+
+def obtener_carrito():
+    carrito_id = session.get('carrito_id')
+    if not carrito_id:
+        return carrito_vacio(None)
+    return cache_carritos.obtener(
+        (carrito_id, session.get('carrito_version', 0)),
+        lambda: coleccion_carritos.find_one({'_id': carrito_id}) or carrito_vacio(carrito_id)
+    )
+
+def _modificar_carrito(filtro, cambios, upsert=False):
+    carrito = coleccion_carritos.find_one_and_update(
+        filtro, cambios, upsert=upsert, return_document=ReturnDocument.AFTER
+    )
+    if carrito is not None:
+        session['carrito_version'] = carrito['version']
+        cache_carritos.guardar((carrito['_id'], carrito['version']), carrito)
+    return carrito
+
+def agregar_item_carrito(libro, cantidad):
+    try:
+        return _modificar_carrito(
+            *cambios_agregar_item(id_carrito(), libro, cantidad, session.get('cliente_id')), upsert=True
+        )
+    except DuplicateKeyError:
+        raise ErrorCarrito('Stock insuficiente para la cantidad solicitada')
+
+def cambiar_cantidad_carrito(libro, cantidad):
+    carrito = _modificar_carrito(*cambios_cantidad_item(id_carrito(), libro, cantidad))
+    if carrito is None:
+        raise ErrorCarrito('El libro no está en el carrito')
+    return carrito
+
+def quitar_item_carrito(libro_id):
+    return _modificar_carrito(*cambios_quitar_item(id_carrito(), libro_id))
+
+def vaciar_carrito_actual():
+    carrito_id = session.get('carrito_id')
+    if carrito_id:
+        _modificar_carrito(*cambios_vaciar_carrito(carrito_id))
+
 # ----------------- CLIENTE - CATÁLOGO Y CARRITO CON IVA -----------------
 
 @app.route('/catalogo')
@@ -788,20 +2358,22 @@ def catalogo_cliente():
     try:
         query = request.args.get('q', '')
         if query:
-            libros = list(coleccion_libros.find({
-                '$or': [
-                    {'nombre': {'$regex': query, '$options': 'i'}},
-                    {'autor': {'$regex': query, '$options': 'i'}}
-                ],
-                'stock': {'$gt': 0}
-            }))
+            libros = cache_libros.obtener(
+                ('catalogo', normalizar_texto(query)),
+                lambda: LibroCatalogo.lista(
+                    buscar_libros(query, {'stock': {'$gt': 0}}, proyeccion=LibroCatalogo.PROYECCION)
+                ),
+                ids_documentos
+            )
         else:
-            libros = list(coleccion_libros.find({'stock': {'$gt': 0}}))
+            libros = libros_disponibles()
         
-        # Inicializar carrito si no existe
-        if 'carrito' not in session:
-            session['carrito'] = []
-        return render_template('catalogo_cliente.html', libros=libros, query=query)
+        # El ETag sale de los mismos campos que muestra la plantilla
+        return respuesta_condicional(
+            etag_documentos('catalogo', query, [[libro.get(campo) for campo in LibroCatalogo.__slots__]
+                                                 for libro in libros]),
+            lambda: render_template('catalogo_cliente.html', libros=libros, query=query)
+        )
     except Exception as e:
         flash(f'Error al cargar catálogo: {e}', 'error')
         return render_template('catalogo_cliente.html', libros=[], query='')
@@ -814,49 +2386,16 @@ def agregar_carrito():
         cantidad = int(request.form.get('cantidad', 1))
         
         libro = coleccion_libros.find_one({'_id': ObjectId(libro_id)})
-        if not libro:
-            return jsonify({'success': False, 'message': 'Libro no encontrado'})
-        
-        if libro.get('stock', 0) < cantidad:
-            return jsonify({'success': False, 'message': 'Stock insuficiente'})
-        
-        # Inicializar carrito si no existe
-        if 'carrito' not in session:
-            session['carrito'] = []
-        
-        # Verificar si el libro ya está en el carrito
-        carrito = session['carrito']
-        libro_en_carrito = None
-        for item in carrito:
-            if item['libro_id'] == libro_id:
-                libro_en_carrito = item
-                break
-        
-        if libro_en_carrito:
-            # Actualizar cantidad si ya está en el carrito
-            nueva_cantidad = libro_en_carrito['cantidad'] + cantidad
-            if nueva_cantidad > libro['stock']:
-                return jsonify({'success': False, 'message': 'Stock insuficiente para la cantidad solicitada'})
-            libro_en_carrito['cantidad'] = nueva_cantidad
-            libro_en_carrito['subtotal'] = libro['precio'] * nueva_cantidad
-        else:
-            # Agregar nuevo item al carrito
-            carrito.append({
-                'libro_id': libro_id,
-                'titulo': libro['nombre'],
-                'autor': libro.get('autor', ''),
-                'precio': libro['precio'],
-                'cantidad': cantidad,
-                'subtotal': libro['precio'] * cantidad
-            })
-        
-        session['carrito'] = carrito
-        session.modified = True
+        try:
+            validar_item_carrito(libro, cantidad)
+            carrito = agregar_item_carrito(libro, cantidad)
+        except ErrorCarrito as e:
+            return jsonify({'success': False, 'message': str(e)})
         
         return jsonify({
             'success': True, 
             'message': 'Libro agregado al carrito',
-            'carrito_count': len(carrito)
+            'carrito_count': len(carrito['items'])
         })
         
     except Exception as e:
@@ -866,11 +2405,8 @@ def agregar_carrito():
 @cliente_required
 def ver_carrito():
     try:
-        carrito = session.get('carrito', [])
-        subtotal = sum(item['subtotal'] for item in carrito)
-        iva = calcular_iva(subtotal)
-        total = subtotal + iva
-        return render_template('carrito.html', carrito=carrito, subtotal=subtotal, iva=iva, total=total)
+        carrito = items_carrito(obtener_carrito())
+        return render_template('carrito.html', carrito=carrito, **totales_carrito(carrito))
     except Exception as e:
         flash(f'Error al cargar carrito: {e}', 'error')
         return render_template('carrito.html', carrito=[], subtotal=0, iva=0, total=0)
@@ -882,36 +2418,17 @@ def actualizar_carrito():
         libro_id = request.form.get('libro_id')
         nueva_cantidad = int(request.form.get('cantidad', 1))
         
-        if nueva_cantidad <= 0:
-            return jsonify({'success': False, 'message': 'La cantidad debe ser mayor a 0'})
-        
         libro = coleccion_libros.find_one({'_id': ObjectId(libro_id)})
-        if not libro:
-            return jsonify({'success': False, 'message': 'Libro no encontrado'})
-        
-        if libro.get('stock', 0) < nueva_cantidad:
-            return jsonify({'success': False, 'message': 'Stock insuficiente'})
-        
-        carrito = session.get('carrito', [])
-        for item in carrito:
-            if item['libro_id'] == libro_id:
-                item['cantidad'] = nueva_cantidad
-                item['subtotal'] = libro['precio'] * nueva_cantidad
-                break
-        
-        session['carrito'] = carrito
-        session.modified = True
-        
-        subtotal = sum(item['subtotal'] for item in carrito)
-        iva = calcular_iva(subtotal)
-        total = subtotal + iva
+        try:
+            validar_item_carrito(libro, nueva_cantidad)
+            carrito = items_carrito(cambiar_cantidad_carrito(libro, nueva_cantidad))
+        except ErrorCarrito as e:
+            return jsonify({'success': False, 'message': str(e)})
         
         return jsonify({
             'success': True, 
             'message': 'Carrito actualizado',
-            'subtotal': subtotal,
-            'iva': iva,
-            'total': total
+            **totales_carrito(carrito)
         })
         
     except Exception as e:
@@ -921,10 +2438,7 @@ def actualizar_carrito():
 @cliente_required
 def eliminar_del_carrito(libro_id):
     try:
-        carrito = session.get('carrito', [])
-        carrito = [item for item in carrito if item['libro_id'] != libro_id]
-        session['carrito'] = carrito
-        session.modified = True
+        quitar_item_carrito(libro_id)
         
         flash('Libro eliminado del carrito', 'success')
         return redirect(url_for('ver_carrito'))
@@ -937,8 +2451,7 @@ def eliminar_del_carrito(libro_id):
 @cliente_required
 def vaciar_carrito():
     try:
-        session['carrito'] = []
-        session.modified = True
+        vaciar_carrito_actual()
         flash('Carrito vaciado', 'success')
         return redirect(url_for('ver_carrito'))
     except Exception as e:
@@ -949,72 +2462,29 @@ def vaciar_carrito():
 @cliente_required
 def comprar_carrito():
     try:
-        carrito = session.get('carrito', [])
+        carrito = items_carrito(obtener_carrito())
         if not carrito:
             flash('El carrito está vacío', 'error')
             return redirect(url_for('ver_carrito'))
         
-        items = []
-        subtotal_venta = 0
-        
-        # Verificar stock y preparar items
-        for item_carrito in carrito:
-            libro = coleccion_libros.find_one({'_id': ObjectId(item_carrito['libro_id'])})
-            if not libro:
-                flash(f'Libro {item_carrito["titulo"]} no encontrado', 'error')
-                return redirect(url_for('ver_carrito'))
-            
-            if libro.get('stock', 0) < item_carrito['cantidad']:
-                flash(f'Stock insuficiente para {libro["nombre"]}', 'error')
-                return redirect(url_for('ver_carrito'))
-            
-            items.append({
-                'libro_id': str(libro['_id']),
-                'titulo': libro['nombre'],
-                'autor': libro.get('autor', ''),
-                'genero': libro.get('genero', ''),
-                'isbn': libro.get('isbn', ''),
-                'cantidad': item_carrito['cantidad'],
-                'precio_unitario': libro['precio'],
-                'subtotal': item_carrito['subtotal']
-            })
-            
-            subtotal_venta += item_carrito['subtotal']
-            
-            # Actualizar stock
-            nuevo_stock = libro['stock'] - item_carrito['cantidad']
-            coleccion_libros.update_one(
-                {'_id': ObjectId(item_carrito['libro_id'])},
-                {'$set': {'stock': nuevo_stock}}
-            )
-        
-        # Calcular IVA y total
-        iva_venta = calcular_iva(subtotal_venta)
-        total_venta = subtotal_venta + iva_venta
-        
-        # Crear venta con información completa e IVA
-        venta = {
+        # Verificar stock, descontarlo y crear venta con información completa e IVA
+        venta = registrar_venta(carrito, {
             'cliente_id': session['cliente_id'],
             'cliente_nombre': session['cliente_nombre'],
             'cliente_email': session['cliente_email'],
-            'items': items,
-            'subtotal': subtotal_venta,
-            'iva': iva_venta,
-            'total': total_venta,
-            'fecha_venta': datetime.now(),
-            'estado': 'completada',
             'tipo': 'online'
-        }
-        
-        resultado = coleccion_ventas.insert_one(venta)
+        })
+        total_venta = venta['total']
         
         # Vaciar carrito después de la compra
-        session['carrito'] = []
-        session.modified = True
+        vaciar_carrito_actual()
         
         flash(f'¡Compra realizada exitosamente! Total con IVA: ${total_venta:.2f}', 'success')
-        return redirect(url_for('ver_compra', id=resultado.inserted_id))
+        return redirect(url_for('ver_compra', id=venta['_id']))
         
+    except ErrorCheckout as e:
+        flash(str(e), 'error')
+        return redirect(url_for('ver_carrito'))
     except Exception as e:
         flash(f'Error al procesar compra: {e}', 'error')
         return redirect(url_for('ver_carrito'))
@@ -1026,73 +2496,139 @@ def comprar_directo():
         libro_id = request.form.get('libro_id')
         cantidad = int(request.form.get('cantidad', 1))
         
-        libro = coleccion_libros.find_one({'_id': ObjectId(libro_id)})
-        if not libro:
-            flash('Libro no encontrado', 'error')
-            return redirect(url_for('catalogo_cliente'))
-        
-        if libro.get('stock', 0) < cantidad:
-            flash('Stock insuficiente', 'error')
-            return redirect(url_for('catalogo_cliente'))
-        
         # Crear venta con información completa
-        subtotal = libro.get('precio', 0) * cantidad
-        iva = calcular_iva(subtotal)
-        total = subtotal + iva
-        
-        items = [{
-            'libro_id': str(libro['_id']),
-            'titulo': libro['nombre'],
-            'autor': libro.get('autor', ''),
-            'genero': libro.get('genero', ''),
-            'isbn': libro.get('isbn', ''),
-            'cantidad': cantidad,
-            'precio_unitario': libro.get('precio', 0),
-            'subtotal': subtotal
-        }]
-        
-        venta = {
+        venta = registrar_venta([{'libro_id': libro_id, 'cantidad': cantidad}], {
             'cliente_id': session['cliente_id'],
             'cliente_nombre': session['cliente_nombre'],
             'cliente_email': session['cliente_email'],
-            'items': items,
-            'subtotal': subtotal,
-            'iva': iva,
-            'total': total,
-            'fecha_venta': datetime.now(),
-            'estado': 'completada',
             'tipo': 'online'
-        }
-        
-        # Actualizar stock
-        nuevo_stock = libro['stock'] - cantidad
-        coleccion_libros.update_one(
-            {'_id': ObjectId(libro_id)},
-            {'$set': {'stock': nuevo_stock}}
-        )
-        
-        resultado = coleccion_ventas.insert_one(venta)
+        })
+        total = venta['total']
         flash(f'¡Compra realizada exitosamente! Total con IVA: ${total:.2f}', 'success')
-        return redirect(url_for('ver_compra', id=resultado.inserted_id))
+        return redirect(url_for('ver_compra', id=venta['_id']))
         
+    except ErrorCheckout as e:
+        flash(str(e), 'error')
+        return redirect(url_for('catalogo_cliente'))
     except Exception as e:
         flash(f'Error al procesar compra: {e}', 'error')
         return redirect(url_for('catalogo_cliente'))
 
+# ----------------- API JSON DEL CATÁLOGO (v1) -----------------
+# Solo lectura, para los kioscos y la app móvil. Usa la misma paginación por
+# cursor que los listados; los filtros y órdenes están pensados para los
+# índices declarados en INDICES['tipolibro'].
+API_CATALOGO_MAX_AGE = int(os.environ.get('API_CATALOGO_MAX_AGE', 60))
+CAMPOS_API_LIBROS = ('nombre', 'autor', 'genero', 'isbn', 'anio_publicacion', 'precio', 'stock', 'descripcion')
+CAMPOS_API_PREDETERMINADOS = ('nombre', 'autor', 'genero', 'precio', 'stock')
+
+ORDENES_API_LIBROS = {
+    'nombre': [('nombre', ASCENDING), ('_id', ASCENDING)],
+    'precio': [('precio', ASCENDING), ('_id', ASCENDING)],
+    'precio_desc': [('precio', DESCENDING), ('_id', DESCENDING)],
+    'recientes': [('_id', DESCENDING)],
+}
+
+class ErrorApi(Exception):
+    """Parámetro inválido en la API; el mensaje se regresa con 400"""
+
+def campos_api(texto):
+    if not texto:
+        return CAMPOS_API_PREDETERMINADOS
+    campos = tuple(dict.fromkeys(campo.strip() for campo in texto.split(',') if campo.strip()))
+    desconocidos = [campo for campo in campos if campo not in CAMPOS_API_LIBROS and campo != '_id']
+    if desconocidos:
+        raise ErrorApi(f"Campos desconocidos: {', '.join(desconocidos)}")
+    return tuple(campo for campo in campos if campo != '_id')
+
+def filtro_api_libros(argumentos):
+    filtro = {}
+    if argumentos.get('genero'):
+        filtro['genero'] = argumentos['genero']
+    if argumentos.get('autor'):
+        filtro['autor'] = argumentos['autor']
+    precio = {}
+    for parametro, operador in (('precio_min', '$gte'), ('precio_max', '$lte')):
+        if argumentos.get(parametro):
+            try:
+                precio[operador] = float(argumentos[parametro])
+            except ValueError:
+                raise ErrorApi(f'{parametro} debe ser un número') from None
+    if precio:
+        filtro['precio'] = precio
+    if argumentos.get('disponibles', '1') != '0':
+        filtro['stock'] = {'$gt': 0}
+    return filtro
+
+def libro_api(documento, campos):
+    libro = {'_id': str(documento['_id'])}
+    for campo in campos:
+        libro[campo] = documento.get(campo)
+    return libro
+
+def respuesta_api_libros(datos):
+    return respuesta_condicional(
+        etag_documentos('api_libros', datos),
+        lambda: jsonify(datos),
+        cache_control=f'public, max-age={API_CATALOGO_MAX_AGE}'
+    )
+
+@app.route('/api/v1/libros')
+def api_libros():
+    """Parámetros: campos, genero, autor, precio_min, precio_max, disponibles (1/0), orden, cursor, limite"""
+    try:
+        campos = campos_api(request.args.get('campos'))
+        filtro = filtro_api_libros(request.args)
+    except ErrorApi as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    orden, cursor, limite = parametros_paginacion(ORDENES_API_LIBROS)
+    if cursor:
+        # Solo los cursores que generó la API (y de este orden) llegan a la caché
+        datos_cursor = decodificar_cursor(cursor)
+        if not datos_cursor or datos_cursor['o'] != [campo for campo, _ in ORDENES_API_LIBROS[orden]]:
+            return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
+    # El cursor se arma con los campos de orden, así que siempre se piden
+    proyeccion = dict.fromkeys(campos + tuple(campo for campo, _ in ORDENES_API_LIBROS[orden]), 1)
+
+    pagina = cache_libros.obtener(
+        ('api', orden, cursor, limite, campos, json_util.dumps(filtro, sort_keys=True)),
+        lambda: paginar(coleccion_libros, filtro, ORDENES_API_LIBROS[orden], cursor, limite, proyeccion),
+        lambda pagina: ids_documentos(pagina['documentos'])
+    )
+    return respuesta_api_libros({
+        'libros': [libro_api(documento, campos) for documento in pagina['documentos']],
+        'orden': orden,
+        'limite': limite,
+        'siguiente': pagina['siguiente'],
+        'anterior': pagina['anterior'],
+    })
+
+@app.route('/api/v1/libros/<id>')
+def api_libro(id):
+    try:
+        campos = campos_api(request.args.get('campos') or ','.join(CAMPOS_API_LIBROS))
+    except ErrorApi as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if not ObjectId.is_valid(id):
+        return jsonify({'success': False, 'message': 'Libro no encontrado'}), 404
+    documento = coleccion_libros.find_one({'_id': ObjectId(id)}, dict.fromkeys(campos, 1))
+    if not documento:
+        return jsonify({'success': False, 'message': 'Libro no encontrado'}), 404
+    return respuesta_api_libros(libro_api(documento, campos))
+
 # ----------------- MIS COMPRAS - CORREGIDA COMPLETAMENTE -----------------
 
 @app.route('/mis-compras')
 @cliente_required
 def mis_compras():
     try:
-        # CORREGIDO: Convertir el cursor a lista correctamente
-        ventas_cursor = coleccion_ventas.find({'cliente_id': session['cliente_id']})
-        ventas = list(ventas_cursor)  # Convertir cursor a lista
-        
-        # Ordenar por fecha descendente
-        ventas.sort(key=lambda x: x['fecha_venta'], reverse=True)
-        
-        return render_template('mis_compras.html', ventas=ventas)
+        # Paginada y ordenada en el servidor con el índice (cliente_id, fecha_venta, _id)
+        orden, cursor, limite = parametros_paginacion(ORDENES_VENTAS)
+        pagina = paginar(coleccion_ventas, {'cliente_id': session['cliente_id']}, ORDENES_VENTAS[orden],
+                         cursor, limite, CompraFila.PROYECCION)
+        return render_template('mis_compras.html', ventas=CompraFila.lista(pagina['documentos']),
+                               pagina=pagina, orden=orden, ordenes=ORDENES_VENTAS,
+                               resumen=resumen_cliente(session['cliente_id']))
     except Exception as e:
         flash(f'Error al cargar compras: {str(e)}', 'error')
         return render_template('mis_compras.html', ventas=[])
@@ -1106,7 +2642,11 @@ def ver_compra(id):
             flash('Compra no encontrada', 'error')
             return redirect(url_for('mis_compras'))
         
-        return render_template('ver_compra.html', venta=venta)
+        return respuesta_condicional(
+            etag_documentos('ver_compra', venta['_id'], venta.get('estado')),
+            lambda: render_template('ver_compra.html', venta=venta),
+            venta.get('fecha_venta')
+        )
     except Exception as e:
         flash(f'Error al cargar compra: {e}', 'error')
         return redirect(url_for('mis_compras'))
@@ -1122,124 +2662,758 @@ def comprobante_cliente(id):
             flash('Compra no encontrada', 'error')
             return redirect(url_for('mis_compras'))
         
-        # Crear PDF
-        buffer = io.BytesIO()
-        pdf = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-        
-        # Configuración inicial
-        pdf.setTitle(f"Comprobante de Compra - {venta['_id']}")
-        
-        # Encabezado
-        pdf.setFont("Helvetica-Bold", 18)
-        pdf.drawString(100, height - 50, "BIBLIOTECA DIGITAL")
-        pdf.setFont("Helvetica-Bold", 16)
-        pdf.drawString(100, height - 70, "COMPROBANTE DE COMPRA")
-        pdf.line(100, height - 75, 500, height - 75)
-        
-        # Información de la compra
-        y_position = height - 100
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "INFORMACIÓN DE LA COMPRA:")
-        pdf.setFont("Helvetica", 10)
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Folio: {str(venta['_id'])}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Fecha: {venta['fecha_venta'].strftime('%d/%m/%Y')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Hora: {venta['fecha_venta'].strftime('%H:%M:%S')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Estado: {venta.get('estado', 'Completada')}")
-        
-        # Información del cliente
-        y_position -= 25
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "INFORMACIÓN DEL CLIENTE:")
-        pdf.setFont("Helvetica", 10)
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Nombre: {venta.get('cliente_nombre', 'N/A')}")
-        y_position -= 15
-        pdf.drawString(100, y_position, f"Email: {venta.get('cliente_email', 'N/A')}")
-        
-        # Tabla de productos
-        y_position -= 30
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(100, y_position, "DETALLE DE PRODUCTOS:")
-        
-        # Encabezados de la tabla
-        y_position -= 20
-        pdf.setFont("Helvetica-Bold", 10)
-        pdf.drawString(100, y_position, "Producto")
-        pdf.drawString(300, y_position, "Cant.")
-        pdf.drawString(350, y_position, "Precio Unit.")
-        pdf.drawString(450, y_position, "Subtotal")
-        
-        y_position -= 10
-        pdf.line(100, y_position, 500, y_position)
-        y_position -= 10
-        
-        # Items de la venta
-        pdf.setFont("Helvetica", 9)
-        for item in venta.get('items', []):
-            if y_position < 150:  # Nueva página si es necesario
-                pdf.showPage()
-                y_position = height - 50
-                pdf.setFont("Helvetica", 9)
-            
-            # Título del libro
-            titulo = item['titulo']
-            if len(titulo) > 40:
-                titulo = titulo[:37] + "..."
-            
-            pdf.drawString(100, y_position, titulo)
-            pdf.drawString(300, y_position, str(item['cantidad']))
-            pdf.drawString(350, y_position, f"${item['precio_unitario']:.2f}")
-            pdf.drawString(450, y_position, f"${item['subtotal']:.2f}")
-            
-            y_position -= 20
-        
-        # Línea separadora
-        y_position -= 10
-        pdf.line(100, y_position, 500, y_position)
-        
-        # Totales
-        subtotal = venta.get('subtotal', 0)
-        iva = venta.get('iva', 0)
-        total = venta.get('total', 0)
-        
-        y_position -= 20
-        pdf.setFont("Helvetica", 10)
-        pdf.drawString(350, y_position, f"Subtotal: ${subtotal:.2f}")
-        y_position -= 15
-        pdf.drawString(350, y_position, f"IVA (16%): ${iva:.2f}")
-        y_position -= 15
-        pdf.setFont("Helvetica-Bold", 12)
-        pdf.drawString(350, y_position, f"TOTAL: ${total:.2f}")
-        
-        # Pie de página con agradecimiento
-        y_position -= 40
-        pdf.setFont("Helvetica-Oblique", 10)
-        pdf.drawString(100, y_position, "¡Gracias por su compra en Biblioteca Digital!")
-        y_position -= 15
-        pdf.drawString(100, y_position, "Esperamos volver a servirle pronto.")
-        y_position -= 15
-        pdf.drawString(100, y_position, "Para consultas: contacto@bibliotecadigital.com")
-        
-        pdf.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f"comprobante_compra_{id}.pdf",
-            mimetype='application/pdf'
+        return respuesta_condicional(
+            etag_documentos('comprobante_compra', venta['_id'], venta.get('estado')),
+            lambda: enviar_comprobante('compra', venta, f"comprobante_compra_{id}.pdf"),
+            venta.get('fecha_venta')
         )
         
     except Exception as e:
         return f"Error al generar comprobante: {e}", 500
 
+# ----------------- RESÚMENES DE VENTAS (ROLLUPS) -----------------
+# Un documento por día y por mes con unidades e ingresos por libro, género,
+# vendedor y tipo de venta, y uno por cliente ("cliente:<id>") con sus
+# totales; se actualizan con $inc en cada venta registrada. La reconstrucción
+# (resumen-ventas) recalcula cada mes completo y lo reemplaza.
+CAMPOS_RESUMEN_CLIENTE = ('ventas', 'total', 'unidades')
+
+def clave_resumen(texto):
+    """Convertir un valor en una clave de campo válida para MongoDB"""
+    texto = str(texto or '').replace('.', '_').lstrip('$')
+    return texto or 'sin_dato'
+
+def incrementos_venta(venta):
+    """Calcular los $inc que aporta una venta a su resumen"""
+    incrementos = defaultdict(int)
+    tipo = clave_resumen(venta.get('tipo', 'presencial'))
+    incrementos['ventas'] += 1
+    incrementos['subtotal'] += venta.get('subtotal', 0)
+    incrementos['total'] += venta.get('total', 0)
+    incrementos[f'tipos.{tipo}.ventas'] += 1
+    incrementos[f'tipos.{tipo}.total'] += venta.get('total', 0)
+
+    if venta.get('usuario_id'):
+        usuario = clave_resumen(venta['usuario_id'])
+        incrementos[f'usuarios.{usuario}.ventas'] += 1
+        incrementos[f'usuarios.{usuario}.total'] += venta.get('total', 0)
+
+    for item in venta.get('items', []):
+        libro = clave_resumen(item.get('libro_id'))
+        genero = clave_resumen(item.get('genero'))
+        incrementos['unidades'] += item.get('cantidad', 0)
+        incrementos[f'libros.{libro}.unidades'] += item.get('cantidad', 0)
+        incrementos[f'libros.{libro}.ingresos'] += item.get('subtotal', 0)
+        incrementos[f'generos.{genero}.unidades'] += item.get('cantidad', 0)
+        incrementos[f'generos.{genero}.ingresos'] += item.get('subtotal', 0)
+    return incrementos
+
+def periodos_venta(fecha):
+    """Periodos (id, periodo, inicio) a los que pertenece una fecha de venta"""
+    dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    mes = dia.replace(day=1)
+    return [
+        (f"dia:{dia.strftime('%Y-%m-%d')}", 'dia', dia),
+        (f"mes:{mes.strftime('%Y-%m')}", 'mes', mes),
+    ]
+
+def operaciones_resumen(ventas):
+    """Agrupar los incrementos de varias ventas en un UpdateOne por periodo y por cliente"""
+    acumulado, clientes = {}, {}
+    for venta in ventas:
+        incrementos = incrementos_venta(venta)
+        for id_resumen, periodo, inicio in periodos_venta(venta['fecha_venta']):
+            entrada = acumulado.setdefault(id_resumen, (periodo, inicio, defaultdict(int)))
+            for campo, valor in incrementos.items():
+                entrada[2][campo] += valor
+        if venta.get('cliente_id'):
+            cliente = clientes.setdefault(str(venta['cliente_id']), {
+                'incrementos': defaultdict(int), 'primera': venta['fecha_venta'], 'ultima': venta['fecha_venta']
+            })
+            for campo in CAMPOS_RESUMEN_CLIENTE:
+                cliente['incrementos'][campo] += incrementos.get(campo, 0)
+            cliente['primera'] = min(cliente['primera'], venta['fecha_venta'])
+            cliente['ultima'] = max(cliente['ultima'], venta['fecha_venta'])
+
+    operaciones = [
+        UpdateOne(
+            {'_id': id_resumen},
+            {'$inc': dict(incrementos), '$setOnInsert': {'periodo': periodo, 'inicio': inicio}},
+            upsert=True
+        )
+        for id_resumen, (periodo, inicio, incrementos) in acumulado.items()
+    ]
+    # Sin upsert: el resumen de un cliente nuevo para el sistema de resúmenes se
+    # calcula completo desde sus ventas (resumen_cliente), no desde esta venta
+    operaciones.extend(
+        UpdateOne(
+            {'_id': f'cliente:{cliente_id}'},
+            {'$inc': dict(datos['incrementos']),
+             '$min': {'primera_compra': datos['primera']},
+             '$max': {'ultima_compra': datos['ultima']}}
+        )
+        for cliente_id, datos in clientes.items()
+    )
+    return operaciones
+
+def pipeline_resumen_clientes(filtro):
+    """Totales por cliente calculados desde sus ventas"""
+    return [
+        {'$match': filtro},
+        {'$group': {
+            '_id': '$cliente_id',
+            'ventas': {'$sum': 1},
+            'total': {'$sum': '$total'},
+            'unidades': {'$sum': {'$sum': '$items.cantidad'}},
+            'primera_compra': {'$min': '$fecha_venta'},
+            'ultima_compra': {'$max': '$fecha_venta'},
+        }},
+    ]
+
+def documento_resumen_cliente(cliente_id, totales=None):
+    documento = {'_id': f'cliente:{cliente_id}', 'periodo': 'cliente', 'cliente_id': cliente_id,
+                 'ventas': 0, 'total': 0, 'unidades': 0}
+    if totales:
+        documento.update({campo: valor for campo, valor in totales.items() if campo != '_id'})
+    return documento
+
+def resumen_cliente(cliente_id):
+    """Totales de compras de un cliente, sin recorrer su historial. Si el
+    cliente aún no tiene resumen (compró antes de que existieran), se calcula
+    una vez con el índice (cliente_id, fecha_venta, _id) y se guarda."""
+    resumen = coleccion_resumen_ventas.find_one({'_id': f'cliente:{cliente_id}'})
+    if resumen is not None:
+        return resumen
+    totales = next(coleccion_ventas.aggregate(pipeline_resumen_clientes({'cliente_id': cliente_id})), None)
+    resumen = documento_resumen_cliente(cliente_id, totales)
+    try:
+        # $setOnInsert: si otra petición lo guardó primero, se conserva el suyo
+        coleccion_resumen_ventas.update_one({'_id': resumen['_id']},
+                                            {'$setOnInsert': {k: v for k, v in resumen.items() if k != '_id'}},
+                                            upsert=True)
+    except Exception as e:
+        print(f"ERROR: No se pudo guardar el resumen del cliente {cliente_id}: {e}")
+    return resumen
+
+def actualizar_resumen_ventas(venta):
+    """Sumar una venta recién registrada a sus resúmenes diario y mensual"""
+    try:
+        coleccion_resumen_ventas.bulk_write(operaciones_resumen([venta]), ordered=False)
+    except Exception as e:
+        print(f"ERROR: No se pudo actualizar el resumen de ventas: {e}")
+
+def anidar(campos):
+    """{'libros.x.unidades': 3} -> {'libros': {'x': {'unidades': 3}}}"""
+    documento = {}
+    for ruta, valor in campos.items():
+        *padres, hoja = ruta.split('.')
+        destino = documento
+        for padre in padres:
+            destino = destino.setdefault(padre, {})
+        destino[hoja] = valor
+    return documento
+
+def reconstruir_resumen_ventas(lote=1000, reiniciar=False):
+    """Recalcular los resúmenes diarios, mensuales y por cliente a partir de las ventas.
+    Cada mes se recalcula completo y se escribe reemplazando sus documentos (no
+    con $inc), así que repetir un mes tras una interrupción no cuenta nada dos
+    veces; el avance en rollups_estado solo evita repetir trabajo. No se borra
+    nada al empezar: los reportes ven los resúmenes anteriores hasta que se
+    reemplazan y las ventas nuevas se siguen sumando en línea. Una venta que se
+    registra justo mientras se recalcula su propio mes puede quedar fuera o
+    contarse dos veces; solo puede pasar en el día y el mes en curso."""
+    coleccion_estado = db['rollups_estado']
+    estado = coleccion_estado.find_one({'_id': 'ventas_resumen'})
+    if reiniciar or not estado or 'inicio' not in estado or estado.get('terminado'):
+        # Sin microsegundos: MongoDB guarda milisegundos y la fecha se compara al final
+        estado = {'_id': 'ventas_resumen', 'inicio': datetime.now().replace(microsecond=0),
+                  'mes': None, 'ultimo_cliente': None, 'procesadas': 0, 'terminado': False}
+        coleccion_estado.replace_one({'_id': 'ventas_resumen'}, estado, upsert=True)
+
+    def reemplazo(id_resumen, periodo, inicio, totales):
+        return ReplaceOne({'_id': id_resumen}, {
+            'periodo': periodo, 'inicio': inicio, **anidar(totales), 'reconstruido': estado['inicio']
+        }, upsert=True)
+
+    def escribir_mes(mes, dias, ventas_mes):
+        operaciones = [reemplazo(id_dia, 'dia', inicio, totales) for id_dia, (inicio, totales) in dias.items()]
+        id_mes, _, inicio_mes = periodos_venta(mes)[1]
+        totales_mes = defaultdict(int)
+        for _, totales in dias.values():
+            for campo, valor in totales.items():
+                totales_mes[campo] += valor
+        operaciones.append(reemplazo(id_mes, 'mes', inicio_mes, totales_mes))
+        coleccion_resumen_ventas.bulk_write(operaciones, ordered=False)
+        estado['mes'] = (inicio_mes + timedelta(days=32)).replace(day=1)
+        estado['procesadas'] += ventas_mes
+        coleccion_estado.update_one({'_id': 'ventas_resumen'},
+                                    {'$set': {'mes': estado['mes'], 'procesadas': estado['procesadas']}})
+        print(f"Resúmenes: {id_mes} listo, {estado['procesadas']} ventas procesadas")
+
+    proyeccion = {'fecha_venta': 1, 'tipo': 1, 'cliente_id': 1, 'usuario_id': 1, 'subtotal': 1, 'total': 1,
+                  'items.libro_id': 1, 'items.genero': 1, 'items.cantidad': 1, 'items.subtotal': 1}
+    filtro = {'fecha_venta': {'$gte': estado['mes']}} if estado['mes'] else {}
+    ventas = (coleccion_ventas.find(filtro, proyeccion)
+              .sort([('fecha_venta', ASCENDING), ('_id', ASCENDING)]).batch_size(lote))
+    mes_actual, dias, ventas_mes = None, {}, 0
+    for venta in ventas:
+        (id_dia, _, dia), (_, _, mes) = periodos_venta(venta['fecha_venta'])
+        if mes != mes_actual:
+            if mes_actual is not None:
+                escribir_mes(mes_actual, dias, ventas_mes)
+            mes_actual, dias, ventas_mes = mes, {}, 0
+        totales = dias.setdefault(id_dia, (dia, defaultdict(int)))[1]
+        for campo, valor in incrementos_venta(venta).items():
+            totales[campo] += valor
+        ventas_mes += 1
+    if mes_actual is not None:
+        escribir_mes(mes_actual, dias, ventas_mes)
+
+    # Clientes: también se reemplazan con sus totales recalculados
+    filtro_clientes = {'cliente_id': {'$gt': estado['ultimo_cliente']}} if estado.get('ultimo_cliente') else {}
+    totales_clientes = coleccion_ventas.aggregate(
+        pipeline_resumen_clientes(filtro_clientes) + [{'$sort': {'_id': ASCENDING}}], allowDiskUse=True)
+    operaciones = []
+    for totales in totales_clientes:
+        if totales['_id'] is None:
+            continue  # Ventas presenciales sin cliente
+        cliente_id = str(totales['_id'])
+        operaciones.append(ReplaceOne({'_id': f'cliente:{cliente_id}'},
+                                      documento_resumen_cliente(cliente_id, totales), upsert=True))
+        if len(operaciones) >= lote:
+            coleccion_resumen_ventas.bulk_write(operaciones, ordered=False)
+            operaciones = []
+            coleccion_estado.update_one({'_id': 'ventas_resumen'}, {'$set': {'ultimo_cliente': totales['_id']}})
+    if operaciones:
+        coleccion_resumen_ventas.bulk_write(operaciones, ordered=False)
+
+    # Periodos ya cerrados que no se recalcularon no tienen ventas: sobran
+    dia_inicio = estado['inicio'].replace(hour=0, minute=0, second=0)
+    coleccion_resumen_ventas.delete_many({
+        '$or': [{'periodo': 'dia', 'inicio': {'$lt': dia_inicio}},
+                {'periodo': 'mes', 'inicio': {'$lt': dia_inicio.replace(day=1)}}],
+        'reconstruido': {'$ne': estado['inicio']},
+    })
+    coleccion_estado.update_one({'_id': 'ventas_resumen'}, {'$set': {'terminado': True}})
+    return estado['procesadas']
+
+@app.route('/reportes/ventas')
+@login_required
+@admin_required
+def reporte_ventas():
+    try:
+        periodo = request.args.get('periodo', 'dia')
+        if periodo not in ('dia', 'mes'):
+            return jsonify({'success': False, 'message': 'Periodo inválido'}), 400
+        filtro = {'periodo': periodo}
+        rango = {}
+        if request.args.get('desde'):
+            rango['$gte'] = datetime.strptime(request.args['desde'], '%Y-%m-%d')
+        if request.args.get('hasta'):
+            rango['$lte'] = datetime.strptime(request.args['hasta'], '%Y-%m-%d')
+        if rango:
+            filtro['inicio'] = rango
+        resumenes = list(coleccion_resumen_ventas.find(filtro).sort('inicio', ASCENDING))
+        return jsonify({'success': True, 'resumenes': json.loads(json_util.dumps(resumenes))})
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Fecha inválida, usa AAAA-MM-DD'}), 400
+    except Exception as e:
+        print(f"ERROR: No se pudo consultar el reporte de ventas: {e}")
+        return jsonify({'success': False, 'message': 'Error al consultar el reporte'}), 500
+
+# ----------------- MÉTRICAS -----------------
+# Un CommandListener de pymongo cuenta comandos, bytes y tiempo en MongoDB, por
+# comando y por petición; los hooks de Flask registran la latencia de cada ruta.
+# /metrics expone todo en el formato de texto de Prometheus, solo con el token
+# de METRICAS_TOKEN o a un administrador.
+# Contar bytes vuelve a codificar en BSON cada comando y respuesta, así que
+# solo se activa para diagnosticar (METRICAS_BYTES=1).
+METRICAS_BYTES = os.environ.get('METRICAS_BYTES', '0') == '1'
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_COMANDOS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * len(limites)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cuentas[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, cuenta in zip(self.limites, self.cuentas):
+            acumulado += cuenta
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {self.total}'
+        yield f'{nombre}_sum{{{etiquetas}}} {self.suma}'
+        yield f'{nombre}_count{{{etiquetas}}} {self.total}'
+
+_metricas_lock = threading.Lock()
+metricas_rutas = {}      # endpoint -> {'latencia', 'comandos', 'mongo', 'codigos'}
+metricas_comandos = {}   # comando -> {'total', 'errores', 'segundos', 'bytes_enviados', 'bytes_recibidos'}
+metricas_pool = defaultdict(int)
+
+def _metricas_comando(nombre):
+    if nombre not in metricas_comandos:
+        metricas_comandos[nombre] = {'total': 0, 'errores': 0, 'segundos': 0.0,
+                                     'bytes_enviados': 0, 'bytes_recibidos': 0}
+    return metricas_comandos[nombre]
+
+class MonitorComandos(monitoring.CommandListener):
+    """Los eventos llegan en el hilo que ejecuta el comando, así que se pueden
+    sumar a la petición en curso a través de `g`"""
+
+    def started(self, evento):
+        if METRICAS_BYTES:
+            enviados = len(bson_encode(evento.command)) if evento.command else 0
+            with _metricas_lock:
+                _metricas_comando(evento.command_name)['bytes_enviados'] += enviados
+        registrar_inicio_comando(evento)
+
+    def _terminar(self, evento, error, recibidos=0):
+        segundos = evento.duration_micros / 1e6
+        with _metricas_lock:
+            datos = _metricas_comando(evento.command_name)
+            datos['total'] += 1
+            datos['segundos'] += segundos
+            datos['bytes_recibidos'] += recibidos
+            if error:
+                datos['errores'] += 1
+        if has_request_context() and 'metricas_comandos' in g:
+            g.metricas_comandos += 1
+            g.metricas_mongo += segundos
+        revisar_comando_lento(evento, segundos, error)
+
+    def succeeded(self, evento):
+        recibidos = len(bson_encode(evento.reply)) if METRICAS_BYTES and evento.reply else 0
+        self._terminar(evento, False, recibidos)
+
+    def failed(self, evento):
+        self._terminar(evento, True)
+
+class MonitorPool(monitoring.ConnectionPoolListener):
+    def _sumar(self, clave, cantidad=1):
+        with _metricas_lock:
+            metricas_pool[clave] += cantidad
+
+    def connection_created(self, evento):
+        self._sumar('creadas')
+
+    def connection_closed(self, evento):
+        self._sumar('cerradas')
+
+    def connection_checked_out(self, evento):
+        self._sumar('en_uso')
+        self._sumar('prestamos')
+
+    def connection_checked_in(self, evento):
+        self._sumar('en_uso', -1)
+
+    def connection_check_out_failed(self, evento):
+        self._sumar('prestamos_fallidos')
+
+    def pool_created(self, evento): pass
+    def pool_ready(self, evento): pass
+    def pool_cleared(self, evento): self._sumar('limpiezas')
+    def pool_closed(self, evento): pass
+    def connection_ready(self, evento): pass
+    def connection_check_out_started(self, evento): pass
+
+monitor_comandos = MonitorComandos()
+monitor_pool = MonitorPool()
+
+@app.before_request
+def iniciar_metricas():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_comandos = 0
+    g.metricas_mongo = 0.0
+
+@app.after_request
+def registrar_metricas(respuesta):
+    if 'metricas_inicio' not in g:
+        return respuesta
+    ruta = request.endpoint or 'desconocida'
+    with _metricas_lock:
+        if ruta not in metricas_rutas:
+            metricas_rutas[ruta] = {
+                'latencia': Histograma(LIMITES_LATENCIA),
+                'comandos': Histograma(LIMITES_COMANDOS),
+                'mongo': 0.0,
+                'codigos': defaultdict(int),
+            }
+        datos = metricas_rutas[ruta]
+        datos['latencia'].observar(time.perf_counter() - g.metricas_inicio)
+        datos['comandos'].observar(g.metricas_comandos)
+        datos['mongo'] += g.metricas_mongo
+        datos['codigos'][respuesta.status_code] += 1
+    return respuesta
+
+def texto_prometheus():
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda):
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+
+    with _metricas_lock:
+        metrica('biblioteca_peticion_segundos', 'histogram', 'Latencia de las peticiones por ruta')
+        for ruta, datos in sorted(metricas_rutas.items()):
+            lineas.extend(datos['latencia'].lineas('biblioteca_peticion_segundos', f'ruta="{ruta}"'))
+        metrica('biblioteca_peticion_comandos_mongo', 'histogram', 'Comandos de MongoDB por petición')
+        for ruta, datos in sorted(metricas_rutas.items()):
+            lineas.extend(datos['comandos'].lineas('biblioteca_peticion_comandos_mongo', f'ruta="{ruta}"'))
+        metrica('biblioteca_peticion_mongo_segundos_total', 'counter', 'Tiempo en MongoDB por ruta')
+        for ruta, datos in sorted(metricas_rutas.items()):
+            lineas.append(f'biblioteca_peticion_mongo_segundos_total{{ruta="{ruta}"}} {datos["mongo"]}')
+        metrica('biblioteca_peticiones_total', 'counter', 'Peticiones por ruta y código de estado')
+        for ruta, datos in sorted(metricas_rutas.items()):
+            for codigo, total in sorted(datos['codigos'].items()):
+                lineas.append(f'biblioteca_peticiones_total{{ruta="{ruta}",codigo="{codigo}"}} {total}')
+
+        for campo, tipo, ayuda in (
+            ('total', 'counter', 'Comandos de MongoDB ejecutados'),
+            ('errores', 'counter', 'Comandos de MongoDB fallidos'),
+            ('segundos', 'counter', 'Tiempo acumulado en comandos de MongoDB'),
+            ('bytes_enviados', 'counter', 'Bytes BSON enviados a MongoDB'),
+            ('bytes_recibidos', 'counter', 'Bytes BSON recibidos de MongoDB'),
+        ):
+            if campo.startswith('bytes_') and not METRICAS_BYTES:
+                continue  # Sin medirlos serían ceros engañosos
+            nombre = 'biblioteca_mongo_comandos_total' if campo == 'total' else f'biblioteca_mongo_comandos_{campo}_total'
+            metrica(nombre, tipo, ayuda)
+            for comando, datos in sorted(metricas_comandos.items()):
+                lineas.append(f'{nombre}{{comando="{comando}"}} {datos[campo]}')
+
+        metrica('biblioteca_mongo_pool_eventos_total', 'counter', 'Eventos del pool de MongoDB en este proceso')
+        for clave, valor in sorted(metricas_pool.items()):
+            if clave != 'en_uso':
+                lineas.append(f'biblioteca_mongo_pool_eventos_total{{evento="{clave}"}} {valor}')
+        metrica('biblioteca_mongo_pool', 'gauge', 'Conexiones del pool de MongoDB en este proceso')
+        lineas.append(f'biblioteca_mongo_pool{{dato="en_uso"}} {metricas_pool["en_uso"]}')
+        lineas.append(f'biblioteca_mongo_pool{{dato="max"}} {MONGO_MAX_POOL}')
+
+    metrica('biblioteca_cache', 'gauge', 'Estadísticas de las cachés en memoria')
+    for cache in (cache_libros, cache_clientes, cache_carritos):
+        for clave, valor in cache.estadisticas().items():
+            lineas.append(f'biblioteca_cache{{cache="{cache.nombre}",dato="{clave}"}} {valor}')
+
+    metrica('biblioteca_trabajos_pendientes', 'gauge', 'Trabajos en el pool de procesos')
+    lineas.append(f'biblioteca_trabajos_pendientes {trabajos_pendientes[0]}')
+    return '\n'.join(lineas) + '\n'
+
+@app.route('/metrics')
+def metricas():
+    """Con METRICAS_TOKEN se pide "Authorization: Bearer <token>" (para
+    Prometheus); sin él, solo un administrador con sesión puede verlas"""
+    if METRICAS_TOKEN:
+        autorizacion = request.headers.get('Authorization', '').encode()
+        if not secrets.compare_digest(autorizacion, f'Bearer {METRICAS_TOKEN}'.encode()):
+            return 'No autorizado', 401, {'WWW-Authenticate': 'Bearer'}
+    elif session.get('usuario_rol') != 'administrador':
+        return 'No autorizado', 403
+    return Response(texto_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# ----------------- CONSULTAS LENTAS -----------------
+# Los comandos que tardan más de CONSULTAS_LENTAS_MS se registran con su forma
+# (valores literales ocultos), la ruta de Flask que los originó y, para los que
+# lo admiten, el plan de `explain`, que se pide en un hilo aparte para no
+# alargar la petición. Se muestrean y se limita cuántos se guardan por minuto.
+CONSULTAS_LENTAS_MS = float(os.environ.get('CONSULTAS_LENTAS_MS', 100))
+CONSULTAS_LENTAS_MUESTRA = float(os.environ.get('CONSULTAS_LENTAS_MUESTRA', 1.0))
+CONSULTAS_LENTAS_POR_MINUTO = int(os.environ.get('CONSULTAS_LENTAS_POR_MINUTO', 30))
+CONSULTAS_LENTAS_MAX = int(os.environ.get('CONSULTAS_LENTAS_MAX', 200))
+
+COMANDOS_CON_EXPLAIN = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+# Claves cuyos valores describen la forma de la consulta, no datos
+CLAVES_ESTRUCTURALES = {'sort', 'projection', 'hint', '$sort', '$project', 'limit', 'skip',
+                        'batchSize', '$limit', '$skip', 'ordered', 'upsert', 'multi', 'new'}
+# Campos de sesión y de réplica que no pueden ir dentro de un explain
+CAMPOS_INTERNOS = {'lsid', '$clusterTime', '$db', 'txnNumber', 'autocommit', 'startTransaction',
+                   '$readPreference', 'readConcern', 'writeConcern', 'apiVersion', 'apiStrict'}
+
+consultas_lentas = deque(maxlen=CONSULTAS_LENTAS_MAX)
+_comandos_en_curso = {}
+_lentas_lock = threading.Lock()
+_lentas_ventana = [0.0, 0]  # inicio del minuto actual, registros en ese minuto
+_ejecutor_explain = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+
+def ocultar_valores(valor, estructural=False):
+    """Forma del comando con los valores literales reemplazados por '?'"""
+    if isinstance(valor, dict):
+        return {clave: ocultar_valores(v, estructural or clave in CLAVES_ESTRUCTURALES)
+                for clave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        if valor and not isinstance(valor[0], (dict, list, tuple)):
+            return ['?'] if not estructural else list(valor)
+        return [ocultar_valores(v, estructural) for v in valor]
+    if estructural or (isinstance(valor, str) and valor.startswith('$')):
+        return valor
+    return '?'
+
+def forma_comando(comando, nombre):
+    forma = ocultar_valores({clave: v for clave, v in comando.items()
+                             if clave not in CAMPOS_INTERNOS and clave != 'documents'})
+    forma[nombre] = comando.get(nombre)  # La colección sí se muestra
+    if 'documents' in comando:
+        forma['documents'] = f"<{len(comando['documents'])} documentos>"
+    return forma
+
+def registrar_inicio_comando(evento):
+    if evento.command_name == 'explain' or not evento.command:
+        return
+    ruta = request.endpoint if has_request_context() else None
+    with _lentas_lock:
+        _comandos_en_curso[evento.request_id] = (evento.command, evento.database_name, ruta)
+
+def _admitir_consulta_lenta():
+    """Muestreo y límite por minuto"""
+    if random.random() >= CONSULTAS_LENTAS_MUESTRA:
+        return False
+    ahora = time.monotonic()
+    with _lentas_lock:
+        if ahora - _lentas_ventana[0] >= 60:
+            _lentas_ventana[0] = ahora
+            _lentas_ventana[1] = 0
+        if _lentas_ventana[1] >= CONSULTAS_LENTAS_POR_MINUTO:
+            return False
+        _lentas_ventana[1] += 1
+        return True
+
+def arbol_plan(etapa):
+    """Solo las etapas del plan con su índice y dirección; parsedQuery, filter e
+    indexBounds llevan los valores literales de la consulta y se descartan"""
+    if 'queryPlan' in etapa:  # Formato del motor SBE
+        etapa = etapa['queryPlan']
+    arbol = {clave: etapa[clave] for clave in ('stage', 'indexName', 'keyPattern', 'direction') if clave in etapa}
+    if 'inputStage' in etapa:
+        arbol['inputStage'] = arbol_plan(etapa['inputStage'])
+    if 'inputStages' in etapa:
+        arbol['inputStages'] = [arbol_plan(hija) for hija in etapa['inputStages']]
+    return arbol
+
+def _pedir_explain(registro, comando, base_datos):
+    try:
+        explicable = {clave: v for clave, v in comando.items() if clave not in CAMPOS_INTERNOS}
+        plan = obtener_cliente()[base_datos].command({'explain': explicable, 'verbosity': 'queryPlanner'})
+        planificador = plan.get('queryPlanner')
+        if planificador is None and plan.get('stages'):  # aggregate: el plan está en la etapa $cursor
+            planificador = plan['stages'][0].get('$cursor', {}).get('queryPlanner')
+        planificador = planificador or {}
+        registro['plan'] = {
+            'winningPlan': arbol_plan(planificador.get('winningPlan', {})),
+            'rejectedPlans': len(planificador.get('rejectedPlans', [])),
+        }
+    except Exception as e:
+        registro['plan'] = {'error': str(e)}
+    print(json.dumps({'consulta_lenta': registro}, ensure_ascii=False, default=str))
+
+def revisar_comando_lento(evento, segundos, error):
+    with _lentas_lock:
+        inicio = _comandos_en_curso.pop(evento.request_id, None)
+    if inicio is None or segundos * 1000 < CONSULTAS_LENTAS_MS or not _admitir_consulta_lenta():
+        return
+    comando, base_datos, ruta = inicio
+    registro = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'comando': evento.command_name,
+        'coleccion': comando.get(evento.command_name),
+        'duracion_ms': round(segundos * 1000, 2),
+        'ruta': ruta,
+        'error': error,
+        'forma': forma_comando(comando, evento.command_name),
+        'plan': None,
+    }
+    consultas_lentas.append(registro)
+    if evento.command_name in COMANDOS_CON_EXPLAIN and not error:
+        _ejecutor_explain.submit(_pedir_explain, registro, comando, base_datos)
+    else:
+        print(json.dumps({'consulta_lenta': registro}, ensure_ascii=False, default=str))
+
+@app.route('/admin/consultas-lentas')
+@login_required
+@admin_required
+def ver_consultas_lentas():
+    registros = list(reversed(consultas_lentas))
+    if request.args.get('formato') == 'json':
+        return jsonify(json.loads(json.dumps(registros, default=str)))
+    return render_template('consultas_lentas.html', consultas=registros,
+                           umbral=CONSULTAS_LENTAS_MS, muestra=CONSULTAS_LENTAS_MUESTRA,
+                           por_minuto=CONSULTAS_LENTAS_POR_MINUTO)
+
+# ----------------- CACHÉ HTTP Y COMPRESIÓN -----------------
+# Las páginas que dependen solo de documentos (ventas, comprobantes, catálogo)
+# llevan un ETag débil calculado de esos documentos; si el navegador ya tiene
+# esa versión se responde 304 sin renderizar la plantilla ni generar el PDF.
+# Cambiar VERSION_RECURSOS al desplegar plantillas nuevas invalida todos los ETag.
+VERSION_RECURSOS = os.environ.get('VERSION_RECURSOS', '1')
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+COMPRESION_NIVEL = int(os.environ.get('COMPRESION_NIVEL', 6))
+COMPRESION_TIPOS = {'text/html', 'application/json', 'text/plain', 'text/css', 'application/javascript'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Sin el paquete brotli solo se ofrece gzip
+
+def etag_documentos(*partes):
+    return hashlib.sha1(json_util.dumps([VERSION_RECURSOS, *partes]).encode()).hexdigest()
+
+def fecha_http(fecha):
+    """Fecha en UTC para los encabezados HTTP; las fechas guardadas son locales sin
+    zona (datetime.now()), así que se convierten con la zona del servidor"""
+    return fecha.astimezone(timezone.utc).replace(microsecond=0)
+
+def _no_modificado(etag, ultima_modificacion, revisar_mensajes):
+    if revisar_mensajes and session.get('_flashes'):
+        return False  # La página tiene mensajes pendientes que mostrar
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if ultima_modificacion and request.if_modified_since:
+        return request.if_modified_since >= fecha_http(ultima_modificacion)
+    return False
+
+def respuesta_condicional(etag, generar, ultima_modificacion=None, cache_control='private, no-cache'):
+    """Responder 304 si el cliente ya tiene esta versión; si no, llamar a generar()
+    y agregar ETag, Last-Modified y Cache-Control a la respuesta"""
+    # Las respuestas públicas no leen la sesión, para no agregar Vary: Cookie
+    if _no_modificado(etag, ultima_modificacion, not cache_control.startswith('public')):
+        respuesta = Response(status=304)
+    else:
+        respuesta = app.make_response(generar())
+        if respuesta.status_code != 200:
+            return respuesta
+    respuesta.set_etag(etag, weak=True)
+    if ultima_modificacion:
+        respuesta.last_modified = fecha_http(ultima_modificacion)
+    # Por omisión privada (páginas con sesión) y no-cache, que obliga a revalidar cada vez
+    respuesta.headers['Cache-Control'] = cache_control
+    return respuesta
+
+def codificacion_aceptada():
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+@app.after_request
+def comprimir_respuesta(respuesta):
+    if respuesta.mimetype not in COMPRESION_TIPOS:
+        return respuesta
+    respuesta.vary.add('Accept-Encoding')
+    if (respuesta.direct_passthrough or respuesta.is_streamed or respuesta.status_code != 200
+            or 'Content-Encoding' in respuesta.headers):
+        return respuesta
+    datos = respuesta.get_data()
+    if len(datos) < COMPRESION_MIN_BYTES:
+        return respuesta
+    codificacion = codificacion_aceptada()
+    if codificacion == 'br':
+        comprimidos = brotli.compress(datos, quality=min(COMPRESION_NIVEL, 11))
+    elif codificacion == 'gzip':
+        comprimidos = gzip.compress(datos, compresslevel=COMPRESION_NIVEL)
+    else:
+        return respuesta
+    respuesta.set_data(comprimidos)
+    respuesta.headers['Content-Encoding'] = codificacion
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)  # El cuerpo ya no es idéntico byte a byte
+    return respuesta
+
+# ----------------- SALUD Y FÁBRICA DE LA APLICACIÓN -----------------
+
+@app.route('/salud')
+def salud():
+    """Readiness: el proceso responde y MongoDB está disponible"""
+    inicio = time.perf_counter()
+    try:
+        obtener_cliente().admin.command('ping')
+    except Exception as e:
+        return jsonify({'estado': 'no disponible', 'mongo': str(e), 'pid': os.getpid()}), 503
+    return jsonify({
+        'estado': 'ok',
+        'mongo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        'pid': os.getpid()
+    })
+
+def configurar_app(configuracion=None, inicializar=None):
+    """Configurar la aplicación del módulo (`app`) para un servidor WSGI y devolverla.
+
+    No es una fábrica: todas las llamadas configuran y devuelven la misma
+    instancia, porque las rutas se registran sobre ella al importar el módulo.
+
+    No abre conexiones a MongoDB salvo que `inicializar` (o MONGO_INICIALIZAR=1)
+    pida crear datos iniciales, índices y precargar cachés. Si MongoDB no
+    responde, la aplicación arranca igual y /salud reporta el problema.
+    """
+    if configuracion:
+        app.config.update(configuracion)
+    if inicializar is None:
+        inicializar = os.environ.get('MONGO_INICIALIZAR', '0') == '1'
+    if inicializar:
+        try:
+            obtener_cliente().admin.command('ping')
+            print("Conexión exitosa a MongoDB.")
+            inicializar_datos()
+            crear_indices()
+            reindexar_busqueda(filtro={'relevancia': {'$exists': False}})
+            calentar_caches()
+        except Exception as e:
+            print(f"ERROR: No se pudo conectar a MongoDB. Detalle: {e}")
+    return app
+
 # ----------------- INICIALIZACIÓN -----------------
 
 if __name__ == '__main__':
-    inicializar_datos()
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Sistema de Gestión de Libros')
+    subcomandos = parser.add_subparsers(dest='comando')
+    subcomandos.add_parser('indices', help='Crear los índices declarados')
+    subcomandos.add_parser('verificar-indices', help='Reportar índices faltantes y consultas con COLLSCAN')
+    subcomandos.add_parser('reindexar-busqueda', help='Recalcular los términos de búsqueda de los libros')
+    parser_resumen = subcomandos.add_parser('resumen-ventas', help='Reconstruir los resúmenes de ventas')
+    parser_resumen.add_argument('--lote', type=int, default=1000)
+    parser_resumen.add_argument('--reiniciar', action='store_true', help='Descartar el avance y empezar de cero')
+    parser_importar = subcomandos.add_parser('importar-libros', help='Importar libros desde CSV o NDJSON (upsert por isbn)')
+    parser_importar.add_argument('archivo')
+    parser_importar.add_argument('--formato', choices=sorted(FORMATOS_IMPORTACION))
+    parser_importar.add_argument('--lote', type=int, default=IMPORTACION_LOTE)
+    args = parser.parse_args()
+
+    if args.comando == 'indices':
+        sys.exit(1 if crear_indices() else 0)
+    elif args.comando == 'verificar-indices':
+        sys.exit(0 if verificar_indices() else 1)
+    elif args.comando == 'reindexar-busqueda':
+        reindexar_busqueda()
+        sys.exit(0)
+    elif args.comando == 'resumen-ventas':
+        reconstruir_resumen_ventas(args.lote, args.reiniciar)
+        sys.exit(0)
+    elif args.comando == 'importar-libros':
+        formato = formato_importacion(args.archivo, args.formato)
+        if formato not in FORMATOS_IMPORTACION:
+            sys.exit('Formato no soportado; usa --formato csv o ndjson (un objeto JSON por línea)')
+
+        def mostrar_avance(resumen, fin=''):
+            print(f"\r{resumen['filas']:,} filas: {resumen['insertados']:,} nuevos, "
+                  f"{resumen['actualizados']:,} actualizados, {resumen['errores']:,} errores", end=fin, flush=True)
+
+        with open(args.archivo, 'rb') as archivo:
+            resumen = importar_libros(FORMATOS_IMPORTACION[formato](archivo), args.lote, mostrar_avance)
+        mostrar_avance(resumen, '\n')
+        for error in resumen['detalle_errores']:
+            print(f"Fila {error['fila']}: {error['error']}")
+        sys.exit(1 if resumen['errores'] else 0)
+
+    configurar_app(inicializar=True).run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
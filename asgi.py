@@ -0,0 +1,229 @@
+"""Rutas asíncronas (ASGI) del catálogo y el carrito para clientes.
+
+    uvicorn asgi:app --workers 4
+
+Usan AsyncMongoClient y la misma lógica que las rutas de app.py
+(validar_item_carrito, cambios_*, pipeline_busqueda, totales_carrito). Leen y
+escriben la misma cookie de sesión firmada que Flask, así que un proxy puede
+enviar estas rutas a uvicorn y el resto a gunicorn:
+
+    GET  /api/catalogo?q=...
+    GET  /api/carrito
+    POST /carrito/agregar
+    POST /carrito/actualizar
+    POST /api/carrito/eliminar/{libro_id}
+"""
+from contextlib import asynccontextmanager
+
+from bson.objectid import ObjectId
+from itsdangerous import BadSignature
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app import (
+    app as flask_app, MONGO_URI, MONGO_DB, ErrorCarrito, opciones_cliente,
+    cache_libros, cache_carritos, carrito_vacio, nuevo_id_carrito, validar_item_carrito,
+    items_carrito, totales_carrito, cambios_agregar_item, cambios_cantidad_item,
+    cambios_quitar_item, pipeline_busqueda, normalizar_texto,
+    tokenizar, ids_documentos, LibroCatalogo, COMPRESION_MIN_BYTES, COMPRESION_NIVEL,
+)
+
+_cliente = None
+
+
+def coleccion(nombre):
+    global _cliente
+    if _cliente is None:
+        _cliente = AsyncMongoClient(MONGO_URI, **opciones_cliente())
+    return _cliente[MONGO_DB][nombre]
+
+
+# ----------------- SESIÓN COMPARTIDA CON FLASK -----------------
+
+def _serializador():
+    return flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def leer_sesion(request):
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return {}
+    try:
+        return _serializador().loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+def escribir_sesion(respuesta, sesion):
+    respuesta.set_cookie(
+        flask_app.config['SESSION_COOKIE_NAME'],
+        _serializador().dumps(dict(sesion)),
+        path=flask_app.config['SESSION_COOKIE_PATH'] or '/',
+        domain=flask_app.config['SESSION_COOKIE_DOMAIN'],
+        secure=flask_app.config['SESSION_COOKIE_SECURE'],
+        httponly=flask_app.config['SESSION_COOKIE_HTTPONLY'],
+        samesite=flask_app.config['SESSION_COOKIE_SAMESITE'] or 'lax',
+    )
+    return respuesta
+
+
+def respuesta_carrito(sesion, datos, carrito=None):
+    """JSON con la cookie actualizada si cambió la versión del carrito"""
+    if carrito is not None:
+        sesion['carrito_version'] = carrito['version']
+        cache_carritos.guardar((carrito['_id'], carrito['version']), carrito)
+    return escribir_sesion(JSONResponse(datos), sesion)
+
+
+def cliente_requerido(funcion):
+    async def envoltura(request):
+        sesion = leer_sesion(request)
+        if 'cliente_id' not in sesion:
+            return JSONResponse({'success': False, 'message': 'Inicia sesión como cliente'}, status_code=401)
+        return await funcion(request, sesion)
+    return envoltura
+
+
+# ----------------- CATÁLOGO -----------------
+
+def libro_json(libro):
+    return {
+        '_id': str(libro['_id']),
+        'nombre': libro.get('nombre', ''),
+        'autor': libro.get('autor', ''),
+        'genero': libro.get('genero', ''),
+        'precio': libro.get('precio', 0),
+        'stock': libro.get('stock', 0),
+    }
+
+
+@cliente_requerido
+async def catalogo(request, sesion):
+    query = request.query_params.get('q', '')
+    clave = ('catalogo', normalizar_texto(query)) if query else ('disponibles',)
+    libros = cache_libros.buscar(clave)
+    if libros is None:
+        disponibles = {'stock': {'$gt': 0}}
+        if query:
+            if tokenizar(query):
+                cursor = await coleccion('tipolibro').aggregate(
+                    pipeline_busqueda(query, disponibles, proyeccion=LibroCatalogo.PROYECCION))
+                libros = LibroCatalogo.lista(await cursor.to_list())
+            else:
+                libros = []
+        else:
+            libros = LibroCatalogo.lista(await coleccion('tipolibro').find(disponibles, LibroCatalogo.PROYECCION).to_list())
+        cache_libros.guardar(clave, libros, ids_documentos(libros))
+    return JSONResponse({'success': True, 'query': query, 'libros': [libro_json(libro) for libro in libros]})
+
+
+# ----------------- CARRITO -----------------
+
+async def obtener_carrito(sesion):
+    carrito_id = sesion.get('carrito_id')
+    if not carrito_id:
+        return carrito_vacio(None)
+    clave = (carrito_id, sesion.get('carrito_version', 0))
+    carrito = cache_carritos.buscar(clave)
+    if carrito is None:
+        carrito = await coleccion('carritos').find_one({'_id': carrito_id}) or carrito_vacio(carrito_id)
+        cache_carritos.guardar(clave, carrito)
+    return carrito
+
+
+async def _libro_y_cantidad(request):
+    formulario = await request.form()
+    libro_id = formulario.get('libro_id', '')
+    cantidad = int(formulario.get('cantidad', 1))
+    libro = await coleccion('tipolibro').find_one({'_id': ObjectId(libro_id)}) if ObjectId.is_valid(libro_id) else None
+    validar_item_carrito(libro, cantidad)
+    return libro, cantidad
+
+
+@cliente_requerido
+async def ver_carrito(request, sesion):
+    items = items_carrito(await obtener_carrito(sesion))
+    return JSONResponse({'success': True, 'items': items, **totales_carrito(items)})
+
+
+@cliente_requerido
+async def agregar_carrito(request, sesion):
+    try:
+        libro, cantidad = await _libro_y_cantidad(request)
+        if 'carrito_id' not in sesion:
+            sesion['carrito_id'] = nuevo_id_carrito()
+        filtro, cambios = cambios_agregar_item(sesion['carrito_id'], libro, cantidad, sesion.get('cliente_id'))
+        try:
+            carrito = await coleccion('carritos').find_one_and_update(
+                filtro, cambios, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise ErrorCarrito('Stock insuficiente para la cantidad solicitada')
+    except (ErrorCarrito, ValueError) as e:
+        return JSONResponse({'success': False, 'message': str(e)})
+    return respuesta_carrito(sesion, {
+        'success': True,
+        'message': 'Libro agregado al carrito',
+        'carrito_count': len(carrito['items'])
+    }, carrito)
+
+
+@cliente_requerido
+async def actualizar_carrito(request, sesion):
+    try:
+        libro, cantidad = await _libro_y_cantidad(request)
+        carrito = await coleccion('carritos').find_one_and_update(
+            *cambios_cantidad_item(sesion.get('carrito_id'), libro, cantidad),
+            return_document=ReturnDocument.AFTER
+        )
+        if carrito is None:
+            raise ErrorCarrito('El libro no está en el carrito')
+    except (ErrorCarrito, ValueError) as e:
+        return JSONResponse({'success': False, 'message': str(e)})
+    return respuesta_carrito(sesion, {
+        'success': True,
+        'message': 'Carrito actualizado',
+        **totales_carrito(items_carrito(carrito))
+    }, carrito)
+
+
+@cliente_requerido
+async def eliminar_del_carrito(request, sesion):
+    try:
+        carrito = await coleccion('carritos').find_one_and_update(
+            *cambios_quitar_item(sesion.get('carrito_id'), request.path_params['libro_id']),
+            return_document=ReturnDocument.AFTER
+        )
+    except ErrorCarrito as e:
+        return JSONResponse({'success': False, 'message': str(e)})
+    items = items_carrito(carrito or carrito_vacio(None))
+    return respuesta_carrito(sesion, {
+        'success': True,
+        'message': 'Libro eliminado del carrito',
+        **totales_carrito(items)
+    }, carrito)
+
+
+@asynccontextmanager
+async def ciclo_de_vida(_app):
+    yield
+    if _cliente is not None:
+        await _cliente.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/catalogo', catalogo),
+        Route('/api/carrito', ver_carrito),
+        Route('/carrito/agregar', agregar_carrito, methods=['POST']),
+        Route('/carrito/actualizar', actualizar_carrito, methods=['POST']),
+        Route('/api/carrito/eliminar/{libro_id}', eliminar_del_carrito, methods=['POST']),
+    ],
+    middleware=[Middleware(GZipMiddleware, minimum_size=COMPRESION_MIN_BYTES, compresslevel=COMPRESION_NIVEL)],
+    lifespan=ciclo_de_vida,
+)
@@ -0,0 +1,151 @@
+"""Comparar las rutas del carrito servidas por gunicorn (WSGI) y por uvicorn (ASGI).
+
+Uso:
+    MONGO_DB=libros_benchmark python benchmarks/asgi_wsgi.py --compradores 50,200,1000 --segundos 10
+
+Siembra un libro con stock de sobra en MONGO_DB, firma una cookie de sesión de
+cliente con la clave de Flask y, para cada nivel de concurrencia, simula
+compradores que agregan el libro una vez y luego cambian la cantidad en bucle
+(POST /carrito/actualizar) contra cada servidor. Los dos servidores usan el
+mismo número de procesos (--procesos); gunicorn corre con --threads.
+Necesita gunicorn, uvicorn y un mongod accesible en MONGO_URI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from app import app as flask_app, coleccion_libros, coleccion_clientes  # noqa: E402
+
+SERVIDORES = {
+    'wsgi': lambda procesos, hilos, puerto: [
+        sys.executable, '-m', 'gunicorn', '-w', str(procesos), '--threads', str(hilos),
+        '-b', f'127.0.0.1:{puerto}', 'wsgi:app'],
+    'asgi': lambda procesos, hilos, puerto: [
+        sys.executable, '-m', 'uvicorn', '--workers', str(procesos), '--port', str(puerto),
+        '--log-level', 'warning', 'asgi:app'],
+}
+
+
+def sembrar():
+    libro_id = coleccion_libros.insert_one({
+        'nombre': 'Libro de prueba de carga', 'autor': 'Benchmark', 'precio': 100.0, 'stock': 10 ** 9
+    }).inserted_id
+    cliente_id = coleccion_clientes.insert_one({
+        'nombre': 'Comprador', 'email': f'comprador{time.time_ns()}@benchmark', 'activo': True
+    }).inserted_id
+    serializador = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookie = serializador.dumps({
+        'cliente_id': str(cliente_id), 'cliente_nombre': 'Comprador', 'cliente_email': 'comprador@benchmark'
+    })
+    return str(libro_id), cookie
+
+
+def post(url, datos, cookie):
+    solicitud = urllib.request.Request(
+        url, data=urllib.parse.urlencode(datos).encode(), headers={'Cookie': f'session={cookie}'}
+    )
+    with urllib.request.urlopen(solicitud, timeout=30) as respuesta:
+        respuesta.read()
+        nueva = respuesta.headers.get('Set-Cookie', '')
+    if nueva.startswith('session='):
+        cookie = nueva.split(';', 1)[0][len('session='):]
+    return cookie
+
+
+def cargar(base, libro_id, cookie, compradores, segundos):
+    latencias, errores = [], [0]
+    lock = threading.Lock()
+    listos = threading.Barrier(compradores + 1)
+    arranque = threading.Event()
+    fin = [0.0]
+
+    def comprador():
+        propias, fallidas = [], 0
+        try:
+            sesion = post(base + '/carrito/agregar', {'libro_id': libro_id, 'cantidad': 1}, cookie)
+        except (urllib.error.URLError, ConnectionError):
+            sesion, fallidas = cookie, 1
+        listos.wait()
+        arranque.wait()
+        cantidad = 1
+        while time.monotonic() < fin[0]:
+            cantidad = cantidad % 5 + 1
+            inicio = time.perf_counter()
+            try:
+                sesion = post(base + '/carrito/actualizar', {'libro_id': libro_id, 'cantidad': cantidad}, sesion)
+                propias.append((time.perf_counter() - inicio) * 1000)
+            except (urllib.error.URLError, ConnectionError):
+                fallidas += 1
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos = [threading.Thread(target=comprador) for _ in range(compradores)]
+    for hilo in hilos:
+        hilo.start()
+    # Medir solo después de que todos los compradores tienen su carrito
+    listos.wait()
+    fin[0] = time.monotonic() + segundos
+    arranque.set()
+    for hilo in hilos:
+        hilo.join()
+    latencias.sort()
+    return latencias, errores[0]
+
+
+def esperar_listo(url, limite=30):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return True
+        except urllib.error.HTTPError:
+            return True  # Responde, aunque sea con error de autenticación
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compradores', default='50,200')
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--procesos', type=int, default=2)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker de gunicorn')
+    parser.add_argument('--puerto', type=int, default=8766)
+    args = parser.parse_args()
+
+    libro_id, cookie = sembrar()
+    base = f'http://127.0.0.1:{args.puerto}'
+    print(f"{'servidor':>8} {'compradores':>12} {'req/s':>9} {'p50':>8} {'p99':>8} {'errores':>8}")
+    for nombre, comando in SERVIDORES.items():
+        servidor = subprocess.Popen(comando(args.procesos, args.hilos, args.puerto), cwd=RAIZ,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not esperar_listo(base + '/carrito/agregar'):
+                print(f"{nombre:>8} no respondió")
+                continue
+            for compradores in (int(c) for c in args.compradores.split(',')):
+                latencias, errores = cargar(base, libro_id, cookie, compradores, args.segundos)
+                if not latencias:
+                    print(f"{nombre:>8} {compradores:>12} {'-':>9} {'-':>8} {'-':>8} {errores:>8}")
+                    continue
+                p99 = latencias[max(0, int(len(latencias) * 0.99) - 1)]
+                print(f"{nombre:>8} {compradores:>12} {len(latencias) / args.segundos:>9.1f} "
+                      f"{statistics.median(latencias):>6.1f}ms {p99:>6.1f}ms {errores:>8}")
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Comparar la búsqueda del catálogo por $regex (ruta anterior) con la búsqueda
+por prefijos indexados de terminos_busqueda. Las dos rutas devuelven como máximo
+--limite libros (por defecto BUSQUEDA_LIMITE); la indexada puntúa y ordena por
+relevancia en la agregación antes de limitar.
+
+Uso:
+    python benchmarks/busqueda.py --tamanos 10000,100000,1000000 --consultas 200
+
+Necesita un mongod accesible en MONGO_URI (por defecto mongodb://localhost:27017/)
+y usa una base de datos aparte (--db, por defecto libros_benchmark) que se borra
+en cada tamaño.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from pymongo import MongoClient, ASCENDING
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import BUSQUEDA_LIMITE, campos_busqueda, pipeline_busqueda  # noqa: E402
+
+PALABRAS = [
+    'años', 'soledad', 'amor', 'cólera', 'sombra', 'viento', 'ciudad', 'perros', 'casa',
+    'espíritus', 'laberinto', 'pasión', 'noche', 'mañana', 'corazón', 'tiempo', 'río',
+    'montaña', 'niño', 'canción', 'última', 'jardín', 'historia', 'océano', 'frontera',
+]
+NOMBRES = ['Gabriel', 'Isabel', 'Mario', 'Julio', 'Laura', 'Carlos', 'Elena', 'Octavio', 'Rosario']
+APELLIDOS = ['García', 'Márquez', 'Allende', 'Vargas', 'Cortázar', 'Esquivel', 'Fuentes', 'Paz', 'Castellanos']
+
+
+def libro_aleatorio(rng):
+    libro = {
+        'nombre': ' '.join(rng.choice(PALABRAS) for _ in range(rng.randint(2, 5))).capitalize(),
+        'autor': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+        'stock': rng.randint(0, 50),
+        'precio': round(rng.uniform(80, 900), 2),
+    }
+    libro.update(campos_busqueda(libro))
+    return libro
+
+
+def poblar(coleccion, tamano, rng, lote=10000):
+    coleccion.drop()
+    for inicio in range(0, tamano, lote):
+        coleccion.insert_many([libro_aleatorio(rng) for _ in range(min(lote, tamano - inicio))], ordered=False)
+    coleccion.create_index([('terminos_busqueda', ASCENDING)])
+    coleccion.create_index([('stock', ASCENDING), ('_id', ASCENDING)])
+
+
+def consulta_regex(coleccion, consulta, limite):
+    return list(coleccion.find({
+        '$or': [
+            {'nombre': {'$regex': consulta, '$options': 'i'}},
+            {'autor': {'$regex': consulta, '$options': 'i'}}
+        ],
+        'stock': {'$gt': 0}
+    }).limit(limite))
+
+
+def consulta_indexada(coleccion, consulta, limite):
+    return list(coleccion.aggregate(pipeline_busqueda(consulta, {'stock': {'$gt': 0}}, limite)))
+
+
+def medir(funcion, coleccion, consultas, limite):
+    tiempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcion(coleccion, consulta, limite)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return statistics.mean(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000,1000000')
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--limite', type=int, default=BUSQUEDA_LIMITE)
+    parser.add_argument('--db', default='libros_benchmark')
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.semilla)
+    coleccion = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))[args.db]['tipolibro']
+    consultas = [rng.choice(PALABRAS + APELLIDOS)[:rng.randint(3, 6)] for _ in range(args.consultas)]
+
+    print(f"{'libros':>10} {'regex media':>12} {'regex p95':>10} {'índice media':>13} {'índice p95':>11}")
+    for tamano in (int(t) for t in args.tamanos.split(',')):
+        poblar(coleccion, tamano, rng)
+        regex = medir(consulta_regex, coleccion, consultas, args.limite)
+        indexada = medir(consulta_indexada, coleccion, consultas, args.limite)
+        print(f"{tamano:>10} {regex[0]:>10.1f}ms {regex[1]:>8.1f}ms {indexada[0]:>11.1f}ms {indexada[1]:>9.1f}ms")
+    coleccion.drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Prueba de carga reproducible sobre las rutas reales de app.py.
+
+Uso:
+    python benchmarks/carga.py --libros 5000 --clientes 1000 --ventas 50000 --peticiones 2000
+    python benchmarks/carga.py --guardar base.json
+    python benchmarks/carga.py --sin-sembrar --comparar base.json --tolerancia 15
+
+Siembra una base de datos aparte (--db, por defecto libros_carga, que se borra
+salvo con --sin-sembrar) con libros, clientes, usuarios y ventas, y luego
+lanza una mezcla ponderada de escenarios con el cliente de pruebas de Flask
+desde --hilos hilos: login, búsqueda en el catálogo, agregar al carrito,
+checkout, listado de ventas, dashboard y comprobante PDF.
+
+Reporta p50/p95/p99, throughput y comandos de MongoDB por petición (tomados de
+las métricas de /metrics). Con --guardar escribe un JSON de referencia; con
+--comparar marca como regresión cualquier escenario cuyo p95 o throughput
+empeore más de --tolerancia por ciento, y termina con código 1.
+
+Necesita un mongod accesible en MONGO_URI. Con --en-memoria usa mongomock en
+su lugar (útil para probar el arnés; el dashboard usa $documents/$facet, el
+checkout bulk_write y el catálogo $substrCP en la proyección, que mongomock no
+soporta por completo).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+generar_datos = None  # Se importa después de configurar MONGO_DB (importa app)
+
+# escenario -> (peso, endpoint de Flask, tipo de sesión)
+ESCENARIOS = {
+    'login': (5, 'login_cliente', None),
+    'catalogo_busqueda': (30, 'catalogo_cliente', 'cliente'),
+    'agregar_carrito': (20, 'agregar_carrito', 'cliente'),
+    'checkout': (10, 'comprar_directo', 'cliente'),
+    'listar_ventas': (15, 'listar_ventas', 'admin'),
+    'dashboard': (10, 'dashboard', 'admin'),
+    'comprobante': (10, 'comprobante_venta', 'admin'),
+}
+
+
+def importar_app(args):
+    os.environ['MONGO_DB'] = args.db
+    if args.en_memoria:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('--en-memoria necesita mongomock (pip install mongomock)')
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    sys.path.insert(0, RAIZ)
+    import app
+    global generar_datos
+    import generar_datos
+    app.app.config['TESTING'] = True
+    return app
+
+
+# ----------------- DATOS -----------------
+
+def sembrar(app, args):
+    """Mismos documentos que benchmarks/generar_datos.py, insertados desde este proceso"""
+    for nombre in ('tipolibro', 'clientes', 'usuarios', 'ventas', 'ventas_resumen', 'rollups_estado', 'carritos'):
+        app.db[nombre].drop()
+    app.inicializar_datos()
+
+    totales = {'libros': args.libros, 'clientes': args.clientes, 'usuarios': args.usuarios, 'ventas': args.ventas}
+    desde = datetime.now() - timedelta(days=365)
+    for tipo, coleccion in generar_datos.COLECCIONES.items():
+        for inicio in range(0, totales[tipo], 5000):
+            lote = generar_datos.documentos(tipo, inicio, min(inicio + 5000, totales[tipo]),
+                                            args.semilla, totales, desde, 365)
+            app.db[coleccion].insert_many(lote, ordered=False)
+
+    app.crear_indices()
+    try:
+        app.reconstruir_resumen_ventas(reiniciar=True)
+    except Exception as e:
+        print(f"AVISO: No se pudieron reconstruir los resúmenes de ventas: {e}")
+
+
+def contexto(app):
+    """Ids que usan los escenarios; se leen de la base para poder usar --sin-sembrar"""
+    return {
+        'libros': [str(libro['_id']) for libro in app.coleccion_libros.find({'stock': {'$gt': 10}}, {'_id': 1}).limit(2000)],
+        'clientes': [cliente['email'] for cliente in app.coleccion_clientes.find(
+            {'email': {'$regex': f'@{generar_datos.DOMINIO}$'}, 'activo': True}, {'email': 1}).limit(2000)],
+        'ventas': [str(venta['_id']) for venta in app.coleccion_ventas.find({}, {'_id': 1}).limit(2000)],
+    }
+
+
+# ----------------- ESCENARIOS -----------------
+
+def iniciar_sesiones(app, ctx, rng):
+    admin = app.app.test_client()
+    admin.post('/login', data={'email': 'admin@biblioteca.com', 'password': 'admin123'})
+    cliente = app.app.test_client()
+    cliente.post('/login-cliente', data={'email': rng.choice(ctx['clientes']), 'password': generar_datos.PASSWORD})
+    return {'admin': admin, 'cliente': cliente}
+
+
+def ejecutar(escenario, sesiones, ctx, rng, app):
+    """Hacer la petición del escenario y regresar si fue exitosa"""
+    if escenario == 'login':
+        cliente = app.app.test_client()
+        respuesta = cliente.post('/login-cliente', data={'email': rng.choice(ctx['clientes']),
+                                                          'password': generar_datos.PASSWORD})
+        return respuesta.status_code == 302
+    if escenario == 'catalogo_busqueda':
+        consulta = rng.choice(generar_datos.PALABRAS + generar_datos.APELLIDOS)[:rng.randint(3, 6)]
+        return sesiones['cliente'].get('/catalogo', query_string={'q': consulta}).status_code == 200
+    if escenario == 'agregar_carrito':
+        respuesta = sesiones['cliente'].post('/carrito/agregar', data={'libro_id': rng.choice(ctx['libros']), 'cantidad': 1})
+        return respuesta.status_code == 200 and respuesta.get_json().get('success', False)
+    if escenario == 'checkout':
+        respuesta = sesiones['cliente'].post('/comprar-directo', data={'libro_id': rng.choice(ctx['libros']), 'cantidad': 1})
+        return respuesta.status_code == 302 and '/mi-compra/' in respuesta.location
+    if escenario == 'listar_ventas':
+        return sesiones['admin'].get('/ventas').status_code == 200
+    if escenario == 'dashboard':
+        return sesiones['admin'].get('/dashboard').status_code == 200
+    if escenario == 'comprobante':
+        return sesiones['admin'].get(f"/ventas/{rng.choice(ctx['ventas'])}/comprobante").status_code == 200
+    raise ValueError(escenario)
+
+
+def comandos_por_endpoint(app):
+    with app._metricas_lock:
+        return {ruta: (datos['comandos'].suma, datos['comandos'].total) for ruta, datos in app.metricas_rutas.items()}
+
+
+def correr(app, args, ctx):
+    nombres = list(ESCENARIOS)
+    pesos = [ESCENARIOS[nombre][0] for nombre in nombres]
+    latencias = {nombre: [] for nombre in nombres}
+    errores = {nombre: 0 for nombre in nombres}
+    lock = threading.Lock()
+    por_hilo = args.peticiones // args.hilos
+
+    def trabajador(semilla):
+        rng = random.Random(semilla)
+        sesiones = iniciar_sesiones(app, ctx, rng)
+        propias = {nombre: [] for nombre in nombres}
+        fallidas = {nombre: 0 for nombre in nombres}
+        for _ in range(por_hilo):
+            escenario = rng.choices(nombres, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                exito = ejecutar(escenario, sesiones, ctx, rng, app)
+            except Exception:
+                exito = False
+            propias[escenario].append((time.perf_counter() - inicio) * 1000)
+            if not exito:
+                fallidas[escenario] += 1
+        with lock:
+            for nombre in nombres:
+                latencias[nombre].extend(propias[nombre])
+                errores[nombre] += fallidas[nombre]
+
+    comandos_antes = comandos_por_endpoint(app)
+    hilos = [threading.Thread(target=trabajador, args=(args.semilla + i,)) for i in range(args.hilos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    comandos_despues = comandos_por_endpoint(app)
+
+    resultados = {}
+    for nombre in nombres:
+        tiempos = sorted(latencias[nombre])
+        if not tiempos:
+            continue
+        endpoint = ESCENARIOS[nombre][1]
+        suma_antes, total_antes = comandos_antes.get(endpoint, (0, 0))
+        suma_despues, total_despues = comandos_despues.get(endpoint, (0, 0))
+        peticiones_endpoint = total_despues - total_antes
+        resultados[nombre] = {
+            'peticiones': len(tiempos),
+            'errores': errores[nombre],
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'media_ms': round(statistics.mean(tiempos), 2),
+            'throughput': round(len(tiempos) / duracion, 2),
+            'comandos_mongo': round((suma_despues - suma_antes) / peticiones_endpoint, 2) if peticiones_endpoint else None,
+        }
+    total = sum(len(tiempos) for tiempos in latencias.values())
+    return {'duracion_s': round(duracion, 2), 'throughput': round(total / duracion, 2), 'escenarios': resultados}
+
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(len(ordenados) * p / 100)) - 1))]
+
+
+# ----------------- REPORTE -----------------
+
+def imprimir(resultado):
+    print(f"\n{'escenario':<18} {'pet.':>6} {'err.':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>8} {'mongo/pet':>10}")
+    for nombre, datos in resultado['escenarios'].items():
+        comandos = '-' if datos['comandos_mongo'] is None else f"{datos['comandos_mongo']:.1f}"
+        print(f"{nombre:<18} {datos['peticiones']:>6} {datos['errores']:>5} {datos['p50_ms']:>7.1f}ms "
+              f"{datos['p95_ms']:>7.1f}ms {datos['p99_ms']:>7.1f}ms {datos['throughput']:>8.1f} {comandos:>10}")
+    print(f"\nTotal: {resultado['throughput']} req/s en {resultado['duracion_s']} s")
+
+
+def comparar(actual, base, tolerancia):
+    """Imprimir las diferencias contra una referencia; regresa las regresiones"""
+    regresiones = []
+    print(f"\n{'escenario':<18} {'p95 base':>10} {'p95 ahora':>10} {'cambio':>8} {'req/s base':>11} {'req/s ahora':>12} {'cambio':>8}")
+    for nombre, datos in actual['escenarios'].items():
+        anterior = base['escenarios'].get(nombre)
+        if not anterior:
+            continue
+        cambio_p95 = cambio_porcentual(anterior['p95_ms'], datos['p95_ms'])
+        cambio_throughput = cambio_porcentual(anterior['throughput'], datos['throughput'])
+        marca = ''
+        if cambio_p95 > tolerancia or cambio_throughput < -tolerancia:
+            regresiones.append(nombre)
+            marca = '  << regresión'
+        print(f"{nombre:<18} {anterior['p95_ms']:>8.1f}ms {datos['p95_ms']:>8.1f}ms {cambio_p95:>+7.1f}% "
+              f"{anterior['throughput']:>11.1f} {datos['throughput']:>12.1f} {cambio_throughput:>+7.1f}%{marca}")
+    return regresiones
+
+
+def cambio_porcentual(antes, despues):
+    return (despues - antes) / antes * 100 if antes else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='libros_carga')
+    parser.add_argument('--libros', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--usuarios', type=int, default=5)
+    parser.add_argument('--ventas', type=int, default=20000)
+    parser.add_argument('--peticiones', type=int, default=1000)
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-sembrar', action='store_true', help='Reusar los datos de una corrida anterior')
+    parser.add_argument('--en-memoria', action='store_true', help='Usar mongomock en lugar de un mongod')
+    parser.add_argument('--guardar', help='Archivo JSON donde guardar los resultados')
+    parser.add_argument('--comparar', help='Archivo JSON de referencia')
+    parser.add_argument('--tolerancia', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.db == 'libros':
+        sys.exit('Usa una base de datos aparte para la prueba de carga (--db)')
+
+    app = importar_app(args)
+    if not args.sin_sembrar:
+        inicio = time.perf_counter()
+        sembrar(app, args)
+        print(f"Datos sembrados en {time.perf_counter() - inicio:.1f} s")
+    ctx = contexto(app)
+    if not (ctx['libros'] and ctx['clientes'] and ctx['ventas']):
+        sys.exit('La base de datos no tiene datos de carga; corre sin --sin-sembrar')
+
+    resultado = correr(app, args, ctx)
+    resultado['parametros'] = {clave: valor for clave, valor in vars(args).items()
+                               if clave not in ('guardar', 'comparar')}
+    resultado['fecha'] = datetime.now().isoformat(timespec='seconds')
+    imprimir(resultado)
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.guardar}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        if regresiones:
+            print(f"\nRegresiones: {', '.join(regresiones)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Bytes enviados y latencia de las páginas con y sin compresión y con GET condicional.
+
+Uso:
+    python benchmarks/compresion.py --peticiones 200
+    python benchmarks/compresion.py --sin-sembrar --db libros_carga
+
+Usa la misma base de prueba que benchmarks/carga.py (se siembra salvo con
+--sin-sembrar). Cada ruta se pide --peticiones veces con el cliente de pruebas
+de Flask, sin Accept-Encoding, con gzip y con br (si el paquete brotli está
+instalado), y una vez más con el ETag recibido en If-None-Match para medir la
+respuesta 304. La latencia es la del servidor (sin red): el ahorro en una red
+real es mayor, porque transmitir los bytes ahorrados también toma tiempo.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import carga  # noqa: E402
+
+
+def rutas(app, ctx, sesiones):
+    """(nombre, sesión, url) de las páginas a medir"""
+    with sesiones['cliente'].session_transaction() as sesion:
+        cliente_id = sesion.get('cliente_id')
+    compra = app.coleccion_ventas.find_one({'cliente_id': cliente_id}, {'_id': 1})
+    lista = [
+        ('catalogo', sesiones['cliente'], '/catalogo'),
+        ('listar_libros', sesiones['admin'], '/libros'),
+        ('listar_ventas', sesiones['admin'], '/ventas'),
+        ('ver_venta', sesiones['admin'], f"/ventas/{ctx['ventas'][0]}"),
+        ('comprobante_venta', sesiones['admin'], f"/ventas/{ctx['ventas'][0]}/comprobante"),
+    ]
+    if compra:
+        lista.append(('ver_compra', sesiones['cliente'], f"/mi-compra/{compra['_id']}"))
+    return lista
+
+
+def medir(cliente, url, encabezados, peticiones):
+    latencias, tamano, respuesta = [], 0, None
+    for _ in range(peticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.get(url, headers=encabezados)
+        tamano = len(respuesta.get_data())
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    latencias.sort()
+    return {
+        'estado': respuesta.status_code,
+        'bytes': tamano,
+        'p50_ms': statistics.median(latencias),
+        'p95_ms': carga.percentil(latencias, 95),
+        'etag': respuesta.headers.get('ETag'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='libros_carga')
+    parser.add_argument('--libros', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--usuarios', type=int, default=5)
+    parser.add_argument('--ventas', type=int, default=20000)
+    parser.add_argument('--peticiones', type=int, default=100)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-sembrar', action='store_true', help='Reusar los datos de una corrida anterior')
+    parser.add_argument('--en-memoria', action='store_true', help='Usar mongomock en lugar de un mongod')
+    args = parser.parse_args()
+
+    if args.db == 'libros':
+        sys.exit('Usa una base de datos aparte para el benchmark (--db)')
+
+    app = carga.importar_app(args)
+    if not args.sin_sembrar:
+        carga.sembrar(app, args)
+    ctx = carga.contexto(app)
+    if not (ctx['clientes'] and ctx['ventas']):
+        sys.exit('La base de datos no tiene datos de prueba; corre sin --sin-sembrar')
+    sesiones = carga.iniciar_sesiones(app, ctx, random.Random(args.semilla))
+
+    codificaciones = ['identity', 'gzip'] + (['br'] if app.brotli is not None else [])
+    print(f"{'ruta':<18} {'codificación':<13} {'estado':>6} {'bytes':>10} {'ahorro':>7} {'p50':>9} {'p95':>9}")
+    for nombre, cliente, url in rutas(app, ctx, sesiones):
+        cliente.get(url)  # Calentar cachés (libros, PDF del comprobante)
+        base = None
+        for codificacion in codificaciones:
+            resultado = medir(cliente, url, {'Accept-Encoding': codificacion}, args.peticiones)
+            base = base or resultado
+            ahorro = 1 - resultado['bytes'] / base['bytes'] if base['bytes'] else 0
+            print(f"{nombre:<18} {codificacion:<13} {resultado['estado']:>6} {resultado['bytes']:>10,} "
+                  f"{ahorro:>7.1%} {resultado['p50_ms']:>7.2f}ms {resultado['p95_ms']:>7.2f}ms")
+        if base['etag']:
+            resultado = medir(cliente, url, {'If-None-Match': base['etag']}, args.peticiones)
+            print(f"{nombre:<18} {'If-None-Match':<13} {resultado['estado']:>6} {resultado['bytes']:>10,} "
+                  f"{1 - resultado['bytes'] / max(base['bytes'], 1):>7.1%} {resultado['p50_ms']:>7.2f}ms "
+                  f"{resultado['p95_ms']:>7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
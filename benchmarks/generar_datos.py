@@ -0,0 +1,268 @@
+"""Generador de datos sintéticos para la base de datos de libros.
+
+Uso:
+    python benchmarks/generar_datos.py --libros 100000 --clientes 1000000 --ventas 5000000 --procesos 8
+    python benchmarks/generar_datos.py --db libros_grande --reiniciar --indices --ventas 20000000
+
+Cada documento se deriva solo de (semilla, colección, índice): su ObjectId y sus
+atributos son los mismos sin importar cuántos procesos o qué tamaño de lote se
+usen, y las fechas de las ventas se cuentan hacia atrás desde --hasta, no desde
+hoy. Por eso las ventas pueden referenciar libros y clientes reales sin
+consultarlos: el id del libro 42 siempre es el mismo. Las ventas tienen la
+misma forma de items e IVA que escribe el checkout de app.py.
+
+Los procesos productores generan lotes e insertan con insert_many(ordered=False),
+cada uno con su propio MongoClient; el proceso principal reporta avance y
+documentos por segundo. Con --indices se crean los índices de app.py al final.
+Los resúmenes de ventas se reconstruyen después con `python app.py resumen-ventas --reiniciar`.
+
+Escribe en una base de datos aparte (--db, por defecto libros_datos; nunca
+libros) y, como los ids son fijos, se niega a generar sobre colecciones con
+datos salvo que se pida --reiniciar.
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from app import calcular_iva, encriptar_password, campos_busqueda  # noqa: E402
+
+PALABRAS = [
+    'años', 'soledad', 'amor', 'cólera', 'sombra', 'viento', 'ciudad', 'perros', 'casa',
+    'espíritus', 'laberinto', 'pasión', 'noche', 'mañana', 'corazón', 'tiempo', 'río',
+    'montaña', 'niño', 'canción', 'última', 'jardín', 'historia', 'océano', 'frontera',
+]
+NOMBRES = ['Gabriel', 'Isabel', 'Mario', 'Julio', 'Laura', 'Carlos', 'Elena', 'Octavio', 'Rosario',
+           'Juan', 'Sor', 'Alfonso', 'Carmen', 'Ángeles', 'Jorge', 'Gioconda', 'Rómulo', 'Pablo']
+APELLIDOS = ['García', 'Márquez', 'Allende', 'Vargas', 'Cortázar', 'Esquivel', 'Fuentes', 'Paz',
+             'Castellanos', 'Rulfo', 'Borges', 'Neruda', 'Poniatowska', 'Mastretta', 'Belli', 'Gallegos']
+GENEROS = ['Novela', 'Cuento', 'Poesía', 'Ensayo', 'Historia', 'Ciencia ficción', 'Infantil', 'Biografía']
+CIUDADES = ['CDMX', 'Guadalajara', 'Monterrey', 'Puebla', 'Mérida', 'Querétaro', 'Oaxaca', 'Tijuana']
+PASSWORD = 'cliente123'
+DOMINIO = 'ejemplo.test'
+
+COLECCIONES = {'libros': 'tipolibro', 'clientes': 'clientes', 'usuarios': 'usuarios', 'ventas': 'ventas'}
+# Tres bytes del ObjectId distinguen la colección; cinco bytes guardan el índice
+ETIQUETAS = {'libros': 1, 'clientes': 2, 'usuarios': 3, 'ventas': 4}
+INICIO_CATALOGO = datetime(2020, 1, 1)
+
+
+def id_documento(tipo, indice, fecha=INICIO_CATALOGO):
+    """ObjectId determinista: marca de tiempo + colección + índice"""
+    return ObjectId(struct.pack('>I', int(fecha.timestamp())) + ETIQUETAS[tipo].to_bytes(3, 'big')
+                    + indice.to_bytes(5, 'big'))
+
+
+def _rng(semilla, tipo, indice):
+    return random.Random(f'{semilla}:{tipo}:{indice}')
+
+
+def libro(semilla, i):
+    rng = _rng(semilla, 'libros', i)
+    documento = {
+        '_id': id_documento('libros', i),
+        'nombre': ' '.join(rng.choice(PALABRAS) for _ in range(rng.randint(2, 5))).capitalize(),
+        'autor': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+        'genero': rng.choice(GENEROS),
+        'stock': rng.randint(0, 500),
+        'isbn': f'978{i:010d}',
+        'anio_publicacion': rng.randint(1900, 2024),
+        'precio': round(rng.lognormvariate(5.6, 0.5), 2),
+        'descripcion': '',
+        'fecha_agregado': INICIO_CATALOGO + timedelta(days=rng.randint(0, 365)),
+    }
+    documento.update(campos_busqueda(documento))
+    return documento
+
+
+def cliente(semilla, i, password=None):
+    rng = _rng(semilla, 'clientes', i)
+    return {
+        '_id': id_documento('clientes', i),
+        'nombre': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+        'email': f'cliente{i}@{DOMINIO}',
+        'password': password or encriptar_password(PASSWORD),
+        'telefono': f'55{rng.randint(0, 99999999):08d}',
+        'direccion': {'calle': f'Calle {rng.randint(1, 999)}', 'ciudad': rng.choice(CIUDADES),
+                      'codigo_postal': f'{rng.randint(1000, 99999):05d}'},
+        'fecha_registro': INICIO_CATALOGO + timedelta(days=rng.randint(0, 365)),
+        'activo': rng.random() > 0.02,
+    }
+
+
+def usuario(semilla, i, password=None):
+    rng = _rng(semilla, 'usuarios', i)
+    return {
+        '_id': id_documento('usuarios', i),
+        'nombre': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+        'email': f'vendedor{i}@{DOMINIO}',
+        'password': password or encriptar_password('vendedor123'),
+        'rol': 'empleado',
+        'activo': True,
+        'fecha_registro': INICIO_CATALOGO,
+    }
+
+
+def fecha_venta(rng, desde, dias):
+    """Más ventas recientes que antiguas, más en horario comercial y fines de semana"""
+    while True:
+        dia = int(dias * (1 - rng.random() ** 1.5))
+        fecha = desde + timedelta(days=dia)
+        if fecha.weekday() < 5 and rng.random() < 0.25:
+            continue  # Entre semana se vende menos
+        hora = min(22, max(8, int(rng.gauss(15, 3))))
+        return fecha.replace(hour=hora, minute=rng.randint(0, 59), second=rng.randint(0, 59))
+
+
+def venta(semilla, i, totales, desde, dias, password=None):
+    rng = _rng(semilla, 'ventas', i)
+    comprador = cliente(semilla, rng.randrange(totales['clientes']), password)
+    items = []
+    # Una distribución sesgada hace que algunos libros se vendan mucho más que otros
+    for indice_libro in {int(totales['libros'] * rng.random() ** 2) for _ in range(rng.choice((1, 1, 1, 2, 2, 3, 4)))}:
+        producto = libro(semilla, indice_libro)
+        cantidad = rng.choice((1, 1, 1, 2, 3))
+        items.append({
+            'libro_id': str(producto['_id']),
+            'titulo': producto['nombre'],
+            'autor': producto['autor'],
+            'genero': producto['genero'],
+            'isbn': producto['isbn'],
+            'cantidad': cantidad,
+            'precio_unitario': producto['precio'],
+            'subtotal': producto['precio'] * cantidad,
+        })
+    subtotal = sum(item['subtotal'] for item in items)
+    iva = calcular_iva(subtotal)
+    fecha = fecha_venta(rng, desde, dias)
+    documento = {
+        '_id': id_documento('ventas', i, fecha),
+        'cliente_id': str(comprador['_id']),
+        'cliente_nombre': comprador['nombre'],
+        'cliente_email': comprador['email'],
+        'tipo': 'online',
+        'items': items,
+        'subtotal': subtotal,
+        'iva': iva,
+        'total': subtotal + iva,
+        'fecha_venta': fecha,
+        'estado': 'completada',
+    }
+    if totales['usuarios'] and rng.random() < 0.4:
+        vendedor = usuario(semilla, rng.randrange(totales['usuarios']))
+        documento.update({
+            'tipo': 'presencial',
+            'cliente_telefono': comprador['telefono'],
+            'usuario_id': str(vendedor['_id']),
+            'usuario_nombre': vendedor['nombre'],
+        })
+    return documento
+
+
+def documentos(tipo, inicio, fin, semilla, totales, desde, dias):
+    """Documentos [inicio, fin) de una colección"""
+    passwords = {'clientes': encriptar_password(PASSWORD), 'usuarios': encriptar_password('vendedor123')}
+    if tipo == 'libros':
+        return [libro(semilla, i) for i in range(inicio, fin)]
+    if tipo == 'clientes':
+        return [cliente(semilla, i, passwords['clientes']) for i in range(inicio, fin)]
+    if tipo == 'usuarios':
+        return [usuario(semilla, i, passwords['usuarios']) for i in range(inicio, fin)]
+    return [venta(semilla, i, totales, desde, dias, passwords['clientes']) for i in range(inicio, fin)]
+
+
+# ----------------- PRODUCTORES -----------------
+
+_cliente_mongo = None
+
+
+def _producir(uri, base_datos, tipo, inicio, fin, semilla, totales, desde, dias):
+    global _cliente_mongo
+    if _cliente_mongo is None:
+        _cliente_mongo = MongoClient(uri)
+    lote = documentos(tipo, inicio, fin, semilla, totales, desde, dias)
+    _cliente_mongo[base_datos][COLECCIONES[tipo]].insert_many(lote, ordered=False)
+    return len(lote)
+
+
+def generar(args, totales):
+    desde = args.hasta - timedelta(days=args.dias)
+    with ProcessPoolExecutor(max_workers=args.procesos) as ejecutor:
+        for tipo in ('libros', 'clientes', 'usuarios', 'ventas'):
+            total = totales[tipo]
+            if not total:
+                continue
+            inicio = time.perf_counter()
+            futuros = [ejecutor.submit(_producir, args.uri, args.db, tipo, desde_i, min(desde_i + args.lote, total),
+                                       args.semilla, totales, desde, args.dias)
+                       for desde_i in range(0, total, args.lote)]
+            hechos = 0
+            for futuro in as_completed(futuros):
+                hechos += futuro.result()
+                transcurrido = time.perf_counter() - inicio
+                print(f"\r{COLECCIONES[tipo]:>10}: {hechos:>12,}/{total:,} "
+                      f"({hechos / total:6.1%}) {hechos / transcurrido:>10,.0f} docs/s", end='', flush=True)
+            print()
+
+
+def fecha(texto):
+    return datetime.strptime(texto, '%Y-%m-%d')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default='libros_datos')
+    parser.add_argument('--libros', type=int, default=10000)
+    parser.add_argument('--clientes', type=int, default=10000)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--ventas', type=int, default=100000)
+    parser.add_argument('--dias', type=int, default=730, help='Días hacia atrás que cubren las ventas')
+    parser.add_argument('--hasta', default='2025-01-01', type=fecha,
+                        help='Fecha AAAA-MM-DD donde terminan las ventas (fija para que dos corridas den los mismos datos)')
+    parser.add_argument('--lote', type=int, default=5000)
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--reiniciar', action='store_true', help='Borrar las colecciones antes de generar')
+    parser.add_argument('--indices', action='store_true', help='Crear los índices de app.py al terminar')
+    args = parser.parse_args()
+
+    if args.ventas and not (args.libros and args.clientes):
+        sys.exit('Las ventas necesitan al menos un libro y un cliente')
+    totales = {'libros': args.libros, 'clientes': args.clientes, 'usuarios': args.usuarios, 'ventas': args.ventas}
+
+    if args.db == 'libros':
+        sys.exit('Usa una base de datos aparte para el benchmark (--db)')
+
+    base_datos = MongoClient(args.uri)[args.db]
+    if args.reiniciar:
+        for coleccion in COLECCIONES.values():
+            base_datos[coleccion].drop()
+    else:
+        con_datos = [COLECCIONES[tipo] for tipo, total in totales.items()
+                     if total and base_datos[COLECCIONES[tipo]].estimated_document_count()]
+        if con_datos:
+            sys.exit(f"{args.db} ya tiene datos en {', '.join(con_datos)}; usa --reiniciar para borrarlos")
+
+    inicio = time.perf_counter()
+    generar(args, totales)
+    print(f"Listo en {time.perf_counter() - inicio:.1f} s")
+
+    if args.indices:
+        import app
+        app.MONGO_URI, app.MONGO_DB = args.uri, args.db  # El cliente de app se crea en el primer uso
+        errores = app.crear_indices()
+        print("Índices creados" if not errores else f"{len(errores)} índices con error")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Medir cómo escala el throughput con el número de workers de gunicorn.
+
+Uso:
+    python benchmarks/workers.py --workers 1,2,4,8 --ruta /salud --concurrencia 32 --segundos 10
+
+Para cada cantidad de workers levanta `gunicorn wsgi:app`, espera a que /salud
+responda y lanza peticiones concurrentes contra --ruta durante --segundos.
+Necesita gunicorn instalado y un mongod accesible en MONGO_URI. Las variables
+MONGO_MAX_POOL, MONGO_WAIT_QUEUE_TIMEOUT_MS, etc. se pasan tal cual a los workers.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def esperar_listo(url, limite=30):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as respuesta:
+                if respuesta.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def cargar(url, concurrencia, segundos):
+    latencias, errores = [], [0]
+    lock = threading.Lock()
+    fin = time.monotonic() + segundos
+
+    def cliente():
+        propias, fallidas = [], 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=10) as respuesta:
+                    respuesta.read()
+                propias.append((time.perf_counter() - inicio) * 1000)
+            except (urllib.error.URLError, ConnectionError):
+                fallidas += 1
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    latencias.sort()
+    return latencias, errores[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--ruta', default='/salud')
+    parser.add_argument('--concurrencia', type=int, default=32)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    base = f'http://127.0.0.1:{args.puerto}'
+    print(f"{'workers':>8} {'req/s':>9} {'p50':>8} {'p95':>8} {'errores':>8}")
+    for workers in (int(w) for w in args.workers.split(',')):
+        servidor = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{args.puerto}',
+             '--preload', 'wsgi:app'],
+            cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            if not esperar_listo(base + '/salud'):
+                print(f"{workers:>8} gunicorn no respondió en /salud")
+                continue
+            latencias, errores = cargar(base + args.ruta, args.concurrencia, args.segundos)
+            if not latencias:
+                print(f"{workers:>8} {'-':>9} {'-':>8} {'-':>8} {errores:>8}")
+                continue
+            p95 = latencias[max(0, int(len(latencias) * 0.95) - 1)]
+            print(f"{workers:>8} {len(latencias) / args.segundos:>9.1f} "
+                  f"{statistics.median(latencias):>6.1f}ms {p95:>6.1f}ms {errores:>8}")
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == '__main__':
+    main()
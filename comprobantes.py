@@ -0,0 +1,226 @@
+"""Generación de comprobantes PDF a partir de una descripción de diseño.
+
+Los comprobantes de venta (administración) y de compra (cliente) comparten el
+mismo renderizador; solo cambian las secciones, columnas y pie que declara su
+diseño. La tabla de productos fluye entre páginas repitiendo sus encabezados.
+
+Este módulo solo depende de ReportLab para poder usarse fuera del proceso web.
+"""
+import io
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+MARGEN_IZQUIERDO = 100
+MARGEN_DERECHO = 500
+MARGEN_SUPERIOR = 50
+MARGEN_INFERIOR = 60
+
+
+def truncar(texto, largo):
+    texto = str(texto)
+    return texto if len(texto) <= largo else texto[:largo - 3] + "..."
+
+
+def _fecha(venta):
+    return venta['fecha_venta'].strftime('%d/%m/%Y')
+
+
+def _hora(venta):
+    return venta['fecha_venta'].strftime('%H:%M:%S')
+
+
+# Columnas de la tabla de productos: (encabezado, posición x, valor del item)
+COLUMNAS_PRODUCTOS = [
+    ('Producto', 100, lambda item: truncar(item['titulo'], 40)),
+    ('Cant.', 300, lambda item: str(item['cantidad'])),
+    ('Precio Unit.', 350, lambda item: f"${item['precio_unitario']:.2f}"),
+    ('Subtotal', 450, lambda item: f"${item['subtotal']:.2f}"),
+]
+
+# Cada sección es (título, [(etiqueta, valor)]); un valor None omite la línea
+DISENO_VENTA = {
+    'titulo_documento': 'Comprobante de Venta',
+    'encabezado': 'COMPROBANTE DE VENTA',
+    'secciones': [
+        ('INFORMACIÓN DE LA VENTA:', [
+            ('Folio', lambda venta: str(venta['_id'])),
+            ('Fecha', _fecha),
+            ('Hora', _hora),
+            ('Estado', lambda venta: venta.get('estado', 'Completada')),
+        ]),
+        ('INFORMACIÓN DEL CLIENTE:', [
+            ('Nombre', lambda venta: venta.get('cliente_nombre', 'N/A')),
+            ('Email', lambda venta: venta.get('cliente_email', 'N/A')),
+            ('Teléfono', lambda venta: venta.get('cliente_telefono') or None),
+        ]),
+        ('INFORMACIÓN DEL VENDEDOR:', [
+            ('Atendió', lambda venta: venta.get('usuario_nombre', 'N/A')),
+        ]),
+    ],
+    'columnas': COLUMNAS_PRODUCTOS,
+    'detalle_item': lambda item: truncar(f"Autor: {item.get('autor', 'N/A')}", 50),
+    'pie': [
+        "¡Gracias por su compra en Biblioteca Digital!",
+        "Esperamos volver a servirle pronto.",
+        "Sistema de Gestión de Libros - Venta segura y confiable",
+    ],
+}
+
+DISENO_COMPRA = {
+    'titulo_documento': 'Comprobante de Compra',
+    'encabezado': 'COMPROBANTE DE COMPRA',
+    'secciones': [
+        ('INFORMACIÓN DE LA COMPRA:', [
+            ('Folio', lambda venta: str(venta['_id'])),
+            ('Fecha', _fecha),
+            ('Hora', _hora),
+            ('Estado', lambda venta: venta.get('estado', 'Completada')),
+        ]),
+        ('INFORMACIÓN DEL CLIENTE:', [
+            ('Nombre', lambda venta: venta.get('cliente_nombre', 'N/A')),
+            ('Email', lambda venta: venta.get('cliente_email', 'N/A')),
+        ]),
+    ],
+    'columnas': COLUMNAS_PRODUCTOS,
+    'detalle_item': None,
+    'pie': [
+        "¡Gracias por su compra en Biblioteca Digital!",
+        "Esperamos volver a servirle pronto.",
+        "Para consultas: contacto@bibliotecadigital.com",
+    ],
+}
+
+DISENOS = {
+    'venta': DISENO_VENTA,
+    'compra': DISENO_COMPRA,
+}
+
+
+class _Pagina:
+    """Posición vertical del cursor con salto de página automático"""
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.alto = A4[1]
+        self.y = self.alto - MARGEN_SUPERIOR
+        self.al_saltar = None
+
+    def reservar(self, espacio):
+        """Saltar de página si no caben `espacio` puntos más"""
+        if self.y - espacio < MARGEN_INFERIOR:
+            self.pdf.showPage()
+            self.y = self.alto - MARGEN_SUPERIOR
+            if self.al_saltar:
+                self.al_saltar()
+
+    def bajar(self, espacio):
+        self.reservar(espacio)
+        self.y -= espacio
+
+
+def dibujar_comprobante(pdf, venta, diseno):
+    """Dibujar un comprobante completo en `pdf`, empezando en una página nueva"""
+    pagina = _Pagina(pdf)
+    alto = pagina.alto
+
+    # Encabezado
+    pdf.setFont("Helvetica-Bold", 18)
+    pdf.drawString(MARGEN_IZQUIERDO, alto - 50, "BIBLIOTECA DIGITAL")
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(MARGEN_IZQUIERDO, alto - 70, diseno['encabezado'])
+    pdf.line(MARGEN_IZQUIERDO, alto - 75, MARGEN_DERECHO, alto - 75)
+    pagina.y = alto - 75
+
+    # Secciones de información
+    for titulo, lineas in diseno['secciones']:
+        pagina.bajar(25)
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawString(MARGEN_IZQUIERDO, pagina.y, titulo)
+        pdf.setFont("Helvetica", 10)
+        for etiqueta, valor in lineas:
+            texto = valor(venta)
+            if texto is None:
+                continue
+            pagina.bajar(15)
+            pdf.drawString(MARGEN_IZQUIERDO, pagina.y, f"{etiqueta}: {texto}")
+
+    # Tabla de productos
+    pagina.bajar(30)
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.drawString(MARGEN_IZQUIERDO, pagina.y, "DETALLE DE PRODUCTOS:")
+
+    def encabezados_tabla():
+        pagina.y -= 20
+        pdf.setFont("Helvetica-Bold", 10)
+        for encabezado, x, _ in diseno['columnas']:
+            pdf.drawString(x, pagina.y, encabezado)
+        pagina.y -= 10
+        pdf.line(MARGEN_IZQUIERDO, pagina.y, MARGEN_DERECHO, pagina.y)
+        pagina.y -= 10
+        pdf.setFont("Helvetica", 9)
+
+    pagina.reservar(60)
+    encabezados_tabla()
+    pagina.al_saltar = encabezados_tabla
+
+    detalle_item = diseno.get('detalle_item')
+    for item in venta.get('items', []):
+        pagina.reservar(32 if detalle_item else 20)
+        for _, x, valor in diseno['columnas']:
+            pdf.drawString(x, pagina.y, valor(item))
+        if detalle_item:
+            pagina.y -= 12
+            pdf.setFont("Helvetica-Oblique", 8)
+            pdf.drawString(MARGEN_IZQUIERDO, pagina.y, detalle_item(item))
+            pdf.setFont("Helvetica", 9)
+        pagina.y -= 20
+    pagina.al_saltar = None
+
+    # Totales y pie (se mantienen juntos en la misma página)
+    pagina.reservar(70 + 40 + 15 * len(diseno['pie']))
+    pagina.y -= 10
+    pdf.line(MARGEN_IZQUIERDO, pagina.y, MARGEN_DERECHO, pagina.y)
+
+    pagina.y -= 20
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(350, pagina.y, f"Subtotal: ${venta.get('subtotal', 0):.2f}")
+    pagina.y -= 15
+    pdf.drawString(350, pagina.y, f"IVA (16%): ${venta.get('iva', 0):.2f}")
+    pagina.y -= 15
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.drawString(350, pagina.y, f"TOTAL: ${venta.get('total', 0):.2f}")
+
+    pagina.y -= 25
+    pdf.setFont("Helvetica-Oblique", 10)
+    for linea in diseno['pie']:
+        pagina.y -= 15
+        pdf.drawString(MARGEN_IZQUIERDO, pagina.y, linea)
+
+    pdf.showPage()
+
+
+def generar_pdf(venta, diseno):
+    """Generar el PDF de un comprobante y regresar sus bytes"""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(f"{diseno['titulo_documento']} - {venta['_id']}")
+    dibujar_comprobante(pdf, venta, diseno)
+    pdf.save()
+    return buffer.getvalue()
+
+
+def generar_pdf_multiple(ventas, diseno, destino, titulo='Comprobantes'):
+    """Dibujar varios comprobantes, uno tras otro, en un solo PDF escrito en `destino`"""
+    pdf = canvas.Canvas(destino, pagesize=A4)
+    pdf.setTitle(titulo)
+    total = 0
+    for venta in ventas:
+        dibujar_comprobante(pdf, venta, diseno)
+        total += 1
+    if total == 0:
+        pdf.setFont("Helvetica", 12)
+        pdf.drawString(MARGEN_IZQUIERDO, A4[1] - MARGEN_SUPERIOR, "No hay comprobantes en el rango solicitado.")
+        pdf.showPage()
+    pdf.save()
+    return total
@@ -0,0 +1,65 @@
+"""Las pruebas corren contra mongomock: app.py crea su MongoClient en el primer
+uso, así que basta con reemplazar pymongo.MongoClient antes de importarla.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+from pymongo import InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ['MONGO_DB'] = 'libros_pruebas'
+os.environ.setdefault('SECRET_KEY', 'clave-de-pruebas')
+pymongo.MongoClient = mongomock.MongoClient
+
+
+def _bulk_write(self, operaciones, ordered=True, session=None, **kwargs):
+    """bulk_write de mongomock no es compatible con las operaciones de pymongo 4.9+;
+    aquí se aplican una por una con el mismo resultado que reporta MongoDB"""
+    resultado = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nUpserted': 0, 'nRemoved': 0, 'upserted': []}
+    for indice, operacion in enumerate(operaciones):
+        if isinstance(operacion, InsertOne):
+            self.insert_one(operacion._doc)
+            resultado['nInserted'] += 1
+            continue
+        if isinstance(operacion, UpdateOne):
+            r = self.update_one(operacion._filter, operacion._doc, upsert=operacion._upsert)
+        elif isinstance(operacion, UpdateMany):
+            r = self.update_many(operacion._filter, operacion._doc, upsert=operacion._upsert)
+        elif isinstance(operacion, ReplaceOne):
+            r = self.replace_one(operacion._filter, operacion._doc, upsert=operacion._upsert)
+        else:
+            raise NotImplementedError(type(operacion).__name__)
+        resultado['nMatched'] += r.matched_count
+        resultado['nModified'] += r.modified_count
+        if r.upserted_id is not None:
+            resultado['nUpserted'] += 1
+            resultado['upserted'].append({'index': indice, '_id': r.upserted_id})
+    return BulkWriteResult(resultado, True)
+
+
+mongomock.Collection.bulk_write = _bulk_write
+
+import app as aplicacion  # noqa: E402
+
+aplicacion.app.config['TESTING'] = True
+
+
+@pytest.fixture
+def app():
+    """El módulo app con la base de datos de pruebas vacía"""
+    aplicacion.obtener_cliente().drop_database(aplicacion.MONGO_DB)
+    aplicacion.cache_libros.invalidar()
+    return aplicacion
+
+
+@pytest.fixture
+def cliente(app):
+    return app.app.test_client()
@@ -0,0 +1,49 @@
+import pytest
+
+
+def libros_con_stock(app, *stocks):
+    return [app.coleccion_libros.insert_one({'nombre': f'Libro {i}', 'stock': stock, 'precio': 100.0}).inserted_id
+            for i, stock in enumerate(stocks)]
+
+
+def test_stock_insuficiente_devuelve_las_reservas_aplicadas(app, monkeypatch):
+    a, b = libros_con_stock(app, 5, 5)
+    preparar_items = app.preparar_items
+
+    def preparar_y_vender_antes(solicitudes):
+        # Otra venta se lleva el stock de B entre la validación y la reserva
+        items = preparar_items(solicitudes)
+        app.coleccion_libros.update_one({'_id': b}, {'$set': {'stock': 1}})
+        return items
+
+    monkeypatch.setattr(app, 'preparar_items', preparar_y_vender_antes)
+    with pytest.raises(app.ErrorCheckout):
+        app.registrar_venta([{'libro_id': str(a), 'cantidad': 2}, {'libro_id': str(b), 'cantidad': 2}], {})
+
+    libro_a, libro_b = app.coleccion_libros.find_one({'_id': a}), app.coleccion_libros.find_one({'_id': b})
+    assert (libro_a['stock'], libro_b['stock']) == (5, 1)
+    assert not libro_a.get('reservas_pendientes') and not libro_b.get('reservas_pendientes')
+    assert app.coleccion_ventas.count_documents({}) == 0
+
+
+def test_venta_confirmada_descuenta_stock_y_quita_la_marca(app):
+    a, b = libros_con_stock(app, 5, 5)
+    app.registrar_venta([{'libro_id': str(a), 'cantidad': 2}, {'libro_id': str(b), 'cantidad': 1}], {})
+
+    assert [(libro['stock'], libro.get('reservas_pendientes')) for libro in app.coleccion_libros.find()] == \
+        [(3, []), (4, [])]
+    assert app.coleccion_ventas.count_documents({}) == 1
+
+
+def test_error_al_guardar_la_venta_devuelve_el_stock(app, monkeypatch):
+    a, = libros_con_stock(app, 5)
+
+    def falla(*args, **kwargs):
+        raise RuntimeError('sin conexión')
+
+    monkeypatch.setattr(app.coleccion_ventas, 'insert_one', falla)
+    with pytest.raises(RuntimeError):
+        app.registrar_venta([{'libro_id': str(a), 'cantidad': 3}], {})
+
+    libro = app.coleccion_libros.find_one({'_id': a})
+    assert libro['stock'] == 5 and not libro.get('reservas_pendientes')
@@ -0,0 +1,58 @@
+import base64
+
+import pytest
+from bson import json_util
+from itsdangerous import URLSafeSerializer
+
+
+@pytest.fixture
+def libros(app):
+    app.coleccion_libros.insert_many([{'nombre': f'Libro {i:02}', 'isbn': str(i), 'stock': i + 1, 'precio': float(i)}
+                                      for i in range(25)])
+
+
+def nombres(respuesta):
+    return [libro['nombre'] for libro in respuesta.get_json()['libros']]
+
+
+def test_el_cursor_de_la_api_recorre_las_paginas(cliente, libros):
+    primera = cliente.get('/api/v1/libros?orden=nombre&limite=10&campos=nombre')
+    segunda = cliente.get(f"/api/v1/libros?orden=nombre&limite=10&campos=nombre&cursor={primera.get_json()['siguiente']}")
+
+    assert segunda.status_code == 200
+    assert nombres(primera) + nombres(segunda) == [f'Libro {i:02}' for i in range(20)]
+
+
+@pytest.mark.parametrize('cursor', [
+    'basura',
+    # El formato anterior: base64 de JSON sin firma
+    base64.urlsafe_b64encode(json_util.dumps({'o': ['nombre', '_id'], 'd': 'siguiente',
+                                              'v': ['Libro 05', None]}).encode()).decode(),
+    # Firmado con otra clave
+    URLSafeSerializer('otra-clave', salt='cursor-paginacion', serializer=json_util).dumps(
+        {'o': ['nombre', '_id'], 'd': 'siguiente', 'v': ['Libro 05', None]}),
+])
+def test_cursor_falsificado_se_rechaza(cliente, libros, cursor):
+    respuesta = cliente.get(f'/api/v1/libros?orden=nombre&cursor={cursor}')
+
+    assert respuesta.status_code == 400
+    assert respuesta.get_json() == {'success': False, 'message': 'Cursor inválido'}
+
+
+@pytest.mark.parametrize('datos', [
+    {'o': ['nombre', '_id'], 'd': 'siguiente', 'v': [{'$ne': None}, {'$ne': None}]},
+    {'o': ['nombre', '_id'], 'd': 'siguiente', 'v': ['Libro 05']},
+    {'o': ['nombre', '_id'], 'd': 'arriba', 'v': ['Libro 05', None]},
+    {'o': 'nombre', 'd': 'siguiente', 'v': 'Libro 05'},
+    ['nombre', 'siguiente'],
+])
+def test_cursor_firmado_pero_mal_formado_se_rechaza(app, cliente, libros, datos):
+    cursor = app.firmador_cursores().dumps(datos)
+    assert app.decodificar_cursor(cursor) is None
+    assert cliente.get(f'/api/v1/libros?orden=nombre&cursor={cursor}').status_code == 400
+
+
+def test_cursor_de_otro_orden_se_rechaza(cliente, libros):
+    cursor = cliente.get('/api/v1/libros?orden=precio&limite=10').get_json()['siguiente']
+
+    assert cliente.get(f'/api/v1/libros?orden=nombre&cursor={cursor}').status_code == 400
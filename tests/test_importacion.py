@@ -0,0 +1,62 @@
+import io
+
+import pytest
+
+
+def archivo(texto):
+    return io.BytesIO(texto.encode())
+
+
+@pytest.fixture
+def libro(app):
+    app.coleccion_libros.insert_one({
+        'isbn': '9780001', 'nombre': 'Cien años de soledad', 'autor': 'Gabriel García Márquez',
+        'genero': 'Novela', 'stock': 7, 'precio': 250.0, 'descripcion': 'Macondo', 'anio_publicacion': 1967,
+    })
+
+
+def test_fila_parcial_solo_actualiza_sus_columnas(app, libro):
+    resumen = app.importar_libros(app.filas_csv(archivo(
+        'isbn,nombre,autor,precio,stock,descripcion\n'
+        '9780001,Cien Años de Soledad,,199.5,,\n'
+    )))
+
+    assert (resumen['insertados'], resumen['actualizados'], resumen['errores']) == (0, 1, 0)
+    documento = app.coleccion_libros.find_one({'isbn': '9780001'})
+    assert documento['nombre'] == 'Cien Años de Soledad' and documento['precio'] == 199.5
+    # Las columnas vacías o ausentes y el stock conservan lo guardado
+    assert (documento['autor'], documento['descripcion'], documento['genero']) == \
+        ('Gabriel García Márquez', 'Macondo', 'Novela')
+    assert (documento['stock'], documento['anio_publicacion']) == (7, 1967)
+    # Los términos de búsqueda usan el autor que ya tenía el libro
+    assert {'cien', 'soledad', 'garcia', 'marquez'} <= set(documento['terminos_busqueda'])
+
+
+def test_fila_nueva_se_inserta_con_valores_por_omision(app, libro):
+    resumen = app.importar_libros(app.filas_csv(archivo(
+        'isbn,nombre,stock\n'
+        '9780002,Rayuela,4\n'
+    )))
+
+    assert (resumen['insertados'], resumen['actualizados']) == (1, 0)
+    documento = app.coleccion_libros.find_one({'isbn': '9780002'})
+    assert (documento['stock'], documento['precio'], documento['descripcion']) == (4, 0.0, '')
+    assert 'fecha_agregado' in documento and documento['terminos_busqueda'] == ['rayuela']
+
+
+def test_ndjson_con_isbn_numerico_actualiza_el_mismo_libro(app, libro):
+    resumen = app.importar_libros(app.filas_ndjson(archivo(
+        '{"isbn": 9780001, "nombre": "Cien años de soledad", "genero": "Realismo mágico"}\n'
+        '\n'
+        '{"nombre": "Sin isbn"}\n'
+        '[1, 2]\n'
+    )))
+
+    assert (resumen['filas'], resumen['insertados'], resumen['actualizados'], resumen['errores']) == (3, 0, 1, 2)
+    assert app.coleccion_libros.count_documents({}) == 1
+    assert app.coleccion_libros.find_one({'isbn': '9780001'})['genero'] == 'Realismo mágico'
+
+
+def test_json_no_se_trata_como_ndjson(app):
+    assert app.formato_importacion('catalogo.jsonl') == 'ndjson'
+    assert app.formato_importacion('catalogo.json') not in app.FORMATOS_IMPORTACION
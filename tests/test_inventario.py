@@ -0,0 +1,68 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+AJUSTES = [{'isbn': 'A', 'delta': 1}] * 60 + [{'isbn': 'A', 'delta': -1000}, {'isbn': 'Z', 'delta': 1}]
+
+
+@pytest.fixture
+def libro(app, monkeypatch):
+    monkeypatch.setattr(app, 'INVENTARIO_LOTE', 7)  # Varios bloques por lote
+    return app.coleccion_libros.insert_one({'isbn': 'A', 'nombre': 'Libro A', 'stock': 5}).inserted_id
+
+
+def estados(reporte):
+    return Counter(resultado['estado'] for resultado in reporte['resultados'])
+
+
+def test_lote_reporta_cada_fila(app, libro):
+    reporte, repetido = app.aplicar_lote_inventario('L1', AJUSTES)
+
+    assert not repetido
+    assert estados(reporte) == {'aplicado': 60, 'stock_insuficiente': 1, 'no_encontrado': 1}
+    assert (reporte['filas'], reporte['aplicados'], reporte['errores']) == (62, 60, 2)
+    documento = app.coleccion_libros.find_one({'_id': libro})
+    assert documento['stock'] == 65 and documento['ajustes_pendientes'] == []
+
+
+def test_repetir_el_lote_no_suma_dos_veces(app, libro):
+    primero, _ = app.aplicar_lote_inventario('L1', AJUSTES)
+    segundo, repetido = app.aplicar_lote_inventario('L1', AJUSTES)
+
+    assert repetido and segundo == primero
+    assert app.coleccion_libros.find_one({'_id': libro})['stock'] == 65
+
+
+def test_mismo_lote_id_con_otros_ajustes_se_rechaza(app, libro):
+    app.aplicar_lote_inventario('L1', AJUSTES)
+    with pytest.raises(ValueError):
+        app.aplicar_lote_inventario('L1', AJUSTES[:10])
+
+
+def test_retomar_un_lote_interrumpido(app, libro):
+    app.aplicar_lote_inventario('L1', AJUSTES)
+    # Simular una caída: las filas 1-10 se aplicaron al libro pero su resultado
+    # no llegó a registrarse, y el lote quedó a medias hace tiempo
+    app.coleccion_lotes_inventario.update_one({'_id': 'L1'}, {'$set': {
+        'estado': 'aplicando', 'actualizado': datetime(2000, 1, 1)}})
+    app.coleccion_ajustes_inventario.delete_many({'_id': {'$in': [f'L1:{fila}' for fila in range(1, 11)]}})
+    app.coleccion_libros.update_one({'_id': libro}, {'$push': {
+        'ajustes_pendientes': {'$each': [f'L1:{fila}' for fila in range(1, 11)]}}})
+
+    reporte, repetido = app.aplicar_lote_inventario('L1', AJUSTES)
+
+    assert not repetido
+    # Las filas marcadas en el libro cuentan como aplicadas sin volver a sumarse
+    assert estados(reporte) == {'aplicado': 60, 'stock_insuficiente': 1, 'no_encontrado': 1}
+    documento = app.coleccion_libros.find_one({'_id': libro})
+    assert documento['stock'] == 65 and documento['ajustes_pendientes'] == []
+
+
+def test_lote_en_curso_no_se_aplica_dos_veces_a_la_vez(app, libro):
+    app.aplicar_lote_inventario('L1', AJUSTES)
+    # Otra petición lo está aplicando ahora mismo
+    app.coleccion_lotes_inventario.update_one({'_id': 'L1'}, {'$set': {
+        'estado': 'aplicando', 'actualizado': datetime.now()}})
+    with pytest.raises(app.LoteEnCurso):
+        app.aplicar_lote_inventario('L1', AJUSTES)
@@ -0,0 +1,48 @@
+"""Tareas que se ejecutan en el pool de procesos de la aplicación.
+
+Este módulo no importa app.py: los procesos del pool se crean con `spawn` y
+solo cargan lo necesario para generar PDFs. Las tareas que leen de MongoDB
+abren su propio cliente dentro del proceso.
+"""
+import os
+
+from pymongo import MongoClient, ASCENDING
+
+import comprobantes
+
+_clientes = {}
+
+
+def _cliente(mongo_uri):
+    """Un MongoClient por proceso del pool y por URI"""
+    if mongo_uri not in _clientes:
+        _clientes[mongo_uri] = MongoClient(mongo_uri)
+    return _clientes[mongo_uri]
+
+
+def _temporal(ruta):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    return f'{ruta}.{os.getpid()}.tmp'
+
+
+def renderizar_comprobante(venta, plantilla, ruta):
+    """Generar el PDF de un comprobante en `ruta`. Regresa su tamaño en bytes."""
+    contenido = comprobantes.generar_pdf(venta, comprobantes.DISENOS[plantilla])
+    temporal = _temporal(ruta)
+    with open(temporal, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+    return len(contenido)
+
+
+def exportar_comprobantes(mongo_uri, mongo_db, filtro, ruta):
+    """Generar un PDF con todos los comprobantes que cumplen `filtro`. Regresa cuántos incluyó."""
+    ventas = (_cliente(mongo_uri)[mongo_db]['ventas']
+              .find(filtro)
+              .sort([('fecha_venta', ASCENDING), ('_id', ASCENDING)])
+              .batch_size(100))
+    temporal = _temporal(ruta)
+    with open(temporal, 'wb') as archivo:
+        total = comprobantes.generar_pdf_multiple(ventas, comprobantes.DISENO_VENTA, archivo)
+    os.replace(temporal, ruta)
+    return total
@@ -0,0 +1,12 @@
+"""Punto de entrada WSGI.
+
+    gunicorn -w 4 -b 0.0.0.0:8000 wsgi:app
+
+Cada worker crea su propio MongoClient en el primer uso, así que también es
+seguro con --preload. Con MONGO_INICIALIZAR=1 se crean datos iniciales e
+índices al arrancar. Define SECRET_KEY en el entorno: firma la sesión y los
+cursores de paginación.
+"""
+from app import configurar_app
+
+app = configurar_app()